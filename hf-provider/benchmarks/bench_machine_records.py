@@ -0,0 +1,90 @@
+"""
+Compare the rows/sec of the MachineDao read paths: pydantic models built from
+PARSE_DECLTYPES rows, against MachineRecord built from raw rows.
+
+Usage, from the hf-provider directory:
+    python benchmarks/bench_machine_records.py [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gce_provider.db.machines import SELECT_MACHINES_BY_NAME  # noqa: E402
+from gce_provider.db.migrations import migrate  # noqa: E402
+from gce_provider.db.records import MachineRecord  # noqa: E402
+from gce_provider.model.models import HfMachineStatus  # noqa: E402
+
+QUERY = SELECT_MACHINES_BY_NAME.format(in_params="SELECT machine_name FROM machines")
+
+
+def create_db(db_path: str, rows: int) -> None:
+    with sqlite3.connect(db_path) as conn:
+        migrate(conn, MagicMock())
+        conn.execute("INSERT INTO requests (id, hf_request_id) VALUES (1, 'request')")
+        conn.execute("INSERT INTO operations (id, gcp_operation_id) VALUES (1, 'op')")
+        conn.execute(
+            "INSERT INTO instance_groups (id, gcp_zone, instance_group_manager) "
+            "VALUES (1, 'us-central1-a', 'igm')"
+        )
+        conn.executemany(
+            """
+            INSERT INTO machines
+            (machine_name, request_key, instance_group_key, machine_state,
+             operation_key, internal_ip, external_ip, updated_at)
+            VALUES (?, 1, 1, 250, 1, '10.0.0.1', NULL, CURRENT_TIMESTAMP)
+            """,
+            [(f"sym-{i:08d}",) for i in range(rows)],
+        )
+
+
+def read_pydantic(db_path: str) -> list:
+    with sqlite3.connect(
+        db_path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+    ) as conn:
+        cur = conn.execute(QUERY)
+        columns = [col[0] for col in cur.description]
+        return [HfMachineStatus(**dict(zip(columns, row))) for row in cur.fetchall()]
+
+
+def read_records(db_path: str) -> list:
+    with sqlite3.connect(db_path) as conn:
+        return [MachineRecord.from_row(row) for row in conn.execute(QUERY).fetchall()]
+
+
+def measure(fn, db_path: str, repeat: int) -> float:
+    """Return the best rows/sec over the repetitions"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = fn(db_path)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        create_db(db_path, args.rows)
+
+        pydantic_rate = measure(read_pydantic, db_path, args.repeat)
+        records_rate = measure(read_records, db_path, args.repeat)
+
+    print(f"pydantic HfMachineStatus: {pydantic_rate:>12,.0f} rows/sec")
+    print(f"MachineRecord:            {records_rate:>12,.0f} rows/sec")
+    print(f"speed-up:                 {records_rate / pydantic_rate:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare the rate at which the event monitor decodes Pub/Sub messages: converting the whole
+audit-log entry to SimpleNamespace objects, and formatting its debug lines, against decoding
+only the fields that are dispatched, and dropping the operations that are ignored.
+
+The messages are the recorded audit-log entries in tests/resources/pubsub-messages, mixed so
+that `--ignored` of them are for operations that the monitor ignores.
+
+Usage, from the hf-provider directory:
+    python benchmarks/bench_message_decoding.py [--messages 20000] [--ignored 0.5] [--repeat 5]
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gce_provider.utils.audit_log import decode_entry, loads  # noqa: E402
+from gce_provider.utils.model_utils import to_simple_namespace  # noqa: E402
+
+MESSAGES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "tests", "resources", "pubsub-messages"
+)
+IGNORED_MESSAGES = ("set-labels.json",)
+
+
+def load_messages(count: int, ignored: float) -> list[bytes]:
+    """Mix the recorded messages, a share of them ignored"""
+    handled, unhandled = [], []
+    for path in sorted(glob.glob(os.path.join(MESSAGES_DIR, "*.json"))):
+        with open(path, "rb") as f:
+            # as published, on one line
+            data = json.dumps(json.load(f)).encode("utf-8")
+        (unhandled if os.path.basename(path) in IGNORED_MESSAGES else handled).append(data)
+
+    ignored_count = int(count * ignored)
+    return list(itertools.islice(itertools.cycle(unhandled), ignored_count)) + list(
+        itertools.islice(itertools.cycle(handled), count - ignored_count)
+    )
+
+
+def decode_eagerly(data: bytes):
+    """How messages were decoded before, with the debug lines formatted but not logged"""
+    data_json = json.loads(data.decode("utf-8"))
+    f"Received message:\n{data!r}\n"
+    f"Message data:\n{json.dumps(data_json)}\n\n"
+    return to_simple_namespace(data_json)
+
+
+def measure(decode, messages: list[bytes], repeat: int) -> float:
+    """Return the best messages/sec over the repetitions"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in messages:
+            decode(data)
+        best = min(best, time.perf_counter() - start)
+    return len(messages) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--ignored", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    messages = load_messages(args.messages, args.ignored)
+    before = measure(decode_eagerly, messages, args.repeat)
+    after = measure(decode_entry, messages, args.repeat)
+    print(f"JSON parser: {'json' if loads is json.loads else 'orjson'}")
+    print(f"eager:   {before:>10,.0f} messages/sec")
+    print(f"lean:    {after:>10,.0f} messages/sec")
+    print(f"speedup: {after / before:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure the messages/sec of the Pub/Sub event listener when it applies the messages in batches
+of different sizes, each batch within one database transaction.
+
+Usage, from the hf-provider directory:
+    python benchmarks/bench_pubsub_batch.py [--messages 2000] [--batch-sizes 1,10,100]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gce_provider.db.migrations import migrate  # noqa: E402
+from gce_provider.pubsub import MessageBatcher  # noqa: E402
+
+
+class _Config:
+    def __init__(self, db_path: str, batch_size: int):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.pubsub_batch_max_messages = batch_size
+        self.pubsub_batch_max_latency_ms = 0
+
+
+class _Message:
+    """Stands in for a received Pub/Sub message"""
+
+    def __init__(self, message_id: str):
+        self.message_id = message_id
+
+    def ack(self):
+        pass
+
+    def nack(self):
+        pass
+
+
+def create_db(db_path: str, machines: int) -> None:
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+        migrate(conn, MagicMock())
+        conn.execute("INSERT INTO requests (id, hf_request_id) VALUES (1, 'request')")
+        conn.execute("INSERT INTO operations (id, gcp_operation_id) VALUES (1, 'op')")
+        conn.execute(
+            "INSERT INTO instance_groups (id, gcp_zone, instance_group_manager) "
+            "VALUES (1, 'us-central1-a', 'igm')"
+        )
+        conn.executemany(
+            """
+            INSERT INTO machines (machine_name, request_key, instance_group_key, operation_key)
+            VALUES (?, 1, 1, 1)
+            """,
+            [(f"sym-{i:08d}",) for i in range(machines)],
+        )
+
+
+def inserted_message(i: int) -> SimpleNamespace:
+    """An insert audit log message for one machine"""
+    return SimpleNamespace(
+        insertId=f"insert-{i}",
+        logName="log",
+        operation=SimpleNamespace(id=f"op-{i}"),
+        protoPayload=SimpleNamespace(
+            resourceName=f"projects/project/zones/us-central1-a/instances/sym-{i:08d}",
+            response=SimpleNamespace(operationType="insert"),
+        ),
+    )
+
+
+def measure(messages: int, batch_size: int) -> float:
+    """Return the messages/sec"""
+    batch = [(_Message(str(i)), inserted_message(i)) for i in range(messages)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        create_db(db_path, messages)
+        batcher = MessageBatcher(_Config(db_path, batch_size))
+        start = time.perf_counter()
+        for i in range(0, messages, batch_size):
+            batcher.apply(batch[i : i + batch_size])
+        return messages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="1,10,100")
+    args = parser.parse_args()
+
+    baseline = None
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        rate = measure(args.messages, batch_size)
+        baseline = baseline or rate
+        print(f"batch size {batch_size:>5}: {rate:>10,.0f} messages/sec {rate / baseline:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measure how the event listener's flow control and callback threads limit its messages/sec,
+by draining a backlog of VM events through a simulated streaming pull into the MessageBatcher.
+
+The simulated stream leases messages while fewer than `max outstanding` are unacknowledged, and
+runs the subscriber callback on a pool of `callback threads`, as the Pub/Sub client library does.
+
+Usage, from the hf-provider directory:
+    python benchmarks/bench_pubsub_flow_control.py [--messages 3000] [--batch-size 100]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gce_provider.db.migrations import migrate  # noqa: E402
+from gce_provider.pubsub import MessageBatcher  # noqa: E402
+
+# (max outstanding messages, callback threads)
+SETTINGS = [(10, 10), (50, 10), (100, 10), (200, 1), (200, 4), (200, 10), (1000, 10)]
+
+
+class _Config:
+    def __init__(self, db_path: str, batch_size: int):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.pubsub_batch_max_messages = batch_size
+        self.pubsub_batch_max_latency_ms = 50
+
+
+class _Message:
+    """Stands in for a received Pub/Sub message, releasing its lease when it is settled"""
+
+    def __init__(self, message_id: str, data: bytes, leases: threading.Semaphore):
+        self.message_id = message_id
+        self.data = data
+        self._leases = leases
+
+    def ack(self):
+        self._leases.release()
+
+    def nack(self):
+        self._leases.release()
+
+
+def create_db(db_path: str, machines: int) -> None:
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+        migrate(conn, MagicMock())
+        conn.execute("INSERT INTO requests (id, hf_request_id) VALUES (1, 'request')")
+        conn.execute("INSERT INTO operations (id, gcp_operation_id) VALUES (1, 'op')")
+        conn.execute(
+            "INSERT INTO instance_groups (id, gcp_zone, instance_group_manager) "
+            "VALUES (1, 'us-central1-a', 'igm')"
+        )
+        conn.executemany(
+            """
+            INSERT INTO machines (machine_name, request_key, instance_group_key, operation_key)
+            VALUES (?, 1, 1, 1)
+            """,
+            [(f"sym-{i:08d}",) for i in range(machines)],
+        )
+
+
+def inserted_data(i: int) -> bytes:
+    """An insert audit log entry for one machine"""
+    return json.dumps(
+        {
+            "insertId": f"insert-{i}",
+            "logName": "log",
+            "operation": {"id": f"op-{i}"},
+            "protoPayload": {
+                "resourceName": f"projects/project/zones/us-central1-a/instances/sym-{i:08d}",
+                "response": {"operationType": "insert"},
+            },
+        }
+    ).encode("utf-8")
+
+
+def measure(messages: int, batch_size: int, max_outstanding: int, callback_threads: int) -> float:
+    """Return the messages/sec to drain the backlog"""
+    backlog = [inserted_data(i) for i in range(messages)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        create_db(db_path, messages)
+        leases = threading.Semaphore(max_outstanding)
+        batcher = MessageBatcher(_Config(db_path, batch_size))
+        start = time.perf_counter()
+        with batcher, ThreadPoolExecutor(max_workers=callback_threads) as callbacks:
+            for i, data in enumerate(backlog):
+                leases.acquire()
+                callbacks.submit(batcher.submit, _Message(str(i), data, leases))
+            # every message has been settled once all the leases are back
+            for _ in range(max_outstanding):
+                leases.acquire()
+        return messages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"batch size {args.batch_size}, max latency 50 ms")
+    print("max outstanding | callback threads | messages/sec")
+    for max_outstanding, callback_threads in SETTINGS:
+        rate = measure(args.messages, args.batch_size, max_outstanding, callback_threads)
+        print(f"{max_outstanding:>15} | {callback_threads:>16} | {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
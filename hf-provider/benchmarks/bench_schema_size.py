@@ -0,0 +1,112 @@
+"""
+Compare the database size and request lookup rate of the denormalized schema (version 6),
+which repeats request IDs, operation IDs and instance groups in every row, against the
+normalized schema with integer keys.
+
+Usage, from the hf-provider directory:
+    python benchmarks/bench_schema_size.py [--machines 100000] [--per-request 100] [--repeat 5]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gce_provider.db.machines import SELECT_MACHINES_FOR_REQUESTS  # noqa: E402
+from gce_provider.db.migrations import MIGRATIONS, migrate  # noqa: E402
+
+DENORMALIZED_QUERY = """
+    WITH requested(hf_request_id) AS (VALUES (?))
+    SELECT requested.hf_request_id, machines.*
+    FROM requested JOIN machines ON machines.request_id = requested.hf_request_id
+    UNION ALL
+    SELECT requested.hf_request_id, machines.*
+    FROM requested JOIN machines ON machines.return_request_id = requested.hf_request_id
+    """
+NORMALIZED_QUERY = SELECT_MACHINES_FOR_REQUESTS.format(in_params="(?)")
+
+
+def create_db(db_path: str, machines: int, per_request: int, normalized: bool) -> list[str]:
+    """Create a database of deleted, returned machines; returns the request IDs"""
+    # each request has its own operation, and its machines are returned together
+    requests = [
+        (str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4()))
+        for _ in range(machines // per_request)
+    ]
+    rows = [
+        (
+            f"sym-{i:08d}",
+            requests[i // per_request][0],
+            "us-central1-a",
+            f"projects/project/zones/us-central1-a/instanceGroupManagers/igm-{i % 4}",
+            400,
+            requests[i // per_request][1],
+            requests[i // per_request][2],
+        )
+        for i in range(len(requests) * per_request)
+    ]
+    with sqlite3.connect(db_path) as conn:
+        for migration in MIGRATIONS[:6]:
+            conn.executescript(migration.script)
+        conn.executemany(
+            "INSERT INTO machines (machine_name, request_id, gcp_zone, instance_group_manager, "
+            "machine_state, operation_id, return_request_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+        if normalized:
+            migrate(conn, MagicMock())
+        conn.execute("VACUUM")
+    return [request[0] for request in requests]
+
+
+def database_size(db_path: str) -> int:
+    with sqlite3.connect(db_path) as conn:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+
+def measure(db_path: str, query: str, request_ids: list[str], repeat: int) -> float:
+    """Return the best lookups/sec over the repetitions"""
+    best = float("inf")
+    with sqlite3.connect(db_path) as conn:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for request_id in request_ids:
+                conn.execute(query, (request_id,)).fetchall()
+            best = min(best, time.perf_counter() - start)
+    return len(request_ids) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--machines", type=int, default=100000)
+    parser.add_argument("--per-request", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for normalized, query in ((False, DENORMALIZED_QUERY), (True, NORMALIZED_QUERY)):
+            db_path = os.path.join(tmp_dir, f"bench-{normalized}.db")
+            request_ids = create_db(db_path, args.machines, args.per_request, normalized)
+            results[normalized] = (
+                database_size(db_path),
+                measure(db_path, query, request_ids, args.repeat),
+            )
+
+    (before_size, before_rate), (after_size, after_rate) = results[False], results[True]
+    print(f"denormalized: {before_size:>14,} bytes {before_rate:>10,.0f} lookups/sec")
+    print(f"normalized:   {after_size:>14,} bytes {after_rate:>10,.0f} lookups/sec")
+    print(f"size ratio:   {after_size / before_size:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure the throughput of bulk update_machine_state transitions, with the legacy
+set_updated_at trigger (dropped in schema version 3) and without it.
+
+Usage, from the hf-provider directory:
+    python benchmarks/bench_update_machine_state.py [--machines 5000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gce_provider.db.machines import MachineDao  # noqa: E402
+from gce_provider.db.migrations import migrate  # noqa: E402
+
+
+class _Config:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+
+
+def create_db(db_path: str, machines: int, with_trigger: bool) -> None:
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+        migrate(conn, MagicMock())
+        if with_trigger:
+            conn.execute(
+                """
+                CREATE TRIGGER set_updated_at AFTER UPDATE ON machines FOR EACH ROW
+                BEGIN
+                    UPDATE machines SET updated_at = CURRENT_TIMESTAMP
+                    WHERE machine_name = OLD.machine_name;
+                END
+                """
+            )
+        conn.execute("INSERT INTO requests (id, hf_request_id) VALUES (1, 'request')")
+        conn.execute("INSERT INTO operations (id, gcp_operation_id) VALUES (1, 'op')")
+        conn.execute(
+            "INSERT INTO instance_groups (id, gcp_zone, instance_group_manager) "
+            "VALUES (1, 'us-central1-a', 'igm')"
+        )
+        conn.executemany(
+            """
+            INSERT INTO machines (machine_name, request_key, instance_group_key, operation_key)
+            VALUES (?, 1, 1, 1)
+            """,
+            [(f"sym-{i:08d}",) for i in range(machines)],
+        )
+
+
+def created_message(machines: int) -> SimpleNamespace:
+    """A createInstances audit log message for every machine"""
+    return SimpleNamespace(
+        insertId="insert",
+        logName="log",
+        operation=SimpleNamespace(id="op"),
+        protoPayload=SimpleNamespace(
+            request=SimpleNamespace(
+                instances=[SimpleNamespace(name=f"sym-{i:08d}") for i in range(machines)]
+            ),
+            response=SimpleNamespace(operationType="compute.instanceGroupManagers.createInstances"),
+        ),
+    )
+
+
+def measure(machines: int, repeat: int, with_trigger: bool) -> float:
+    """Return the best rows/sec over the repetitions"""
+    message = created_message(machines)
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        create_db(db_path, machines, with_trigger)
+        dao = MachineDao(_Config(db_path))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            dao.update_machine_state(message)
+            best = min(best, time.perf_counter() - start)
+    return machines / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--machines", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    before = measure(args.machines, args.repeat, with_trigger=True)
+    after = measure(args.machines, args.repeat, with_trigger=False)
+
+    print(f"with set_updated_at trigger: {before:>12,.0f} rows/sec")
+    print(f"updated_at set in UPDATE:    {after:>12,.0f} rows/sec")
+    print(f"speed-up:                    {after / before:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,4 +10,4 @@ inJson=$2
 scriptDir=`dirname $0`
 homeDir="$(cd "$scriptDir" && cd .. && pwd)"
 
-$homeDir/bin/hf-gce getReturnRequests -f $inJson
+$homeDir/bin/hf-gce-client getReturnRequests -f $inJson
@@ -19,6 +19,7 @@ echo "BUILDROOT = $RPM_BUILD_ROOT"
 mkdir -p ${RPM_BUILD_ROOT}%{prefix}/hostfactory
 cp -a ${GITHUB_WORKSPACE}/hf-provider/resources/gce_cli/* ${RPM_BUILD_ROOT}%{prefix}/hostfactory/
 cp -a ${GITHUB_WORKSPACE}/hf-provider/dist/hf-gce ${RPM_BUILD_ROOT}%{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/
+cp -a ${GITHUB_WORKSPACE}/hf-provider/dist/hf-gce-client ${RPM_BUILD_ROOT}%{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/
 cp -a ${GITHUB_WORKSPACE}/hf-provider/dist/hf-monitor ${RPM_BUILD_ROOT}%{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/
 exit
 
@@ -30,6 +31,7 @@ exit
 %dir %{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin
 %dir %{prefix}/hostfactory/1.2/providerplugins/gcpgce/scripts
 %attr(0755, egoadmin, egoadmin) %{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/hf-gce
+%attr(0755, egoadmin, egoadmin) %{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/hf-gce-client
 %attr(0755, egoadmin, egoadmin) %{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/hf-monitor
 %attr(0755, egoadmin, egoadmin) %{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/show_gce_provider_install.sh
 %attr(0644, egoadmin, egoadmin) %{prefix}/hostfactory/1.2/providerplugins/gcpgce/bin/README.md
@@ -1,15 +1,24 @@
+import builtins
+import sys
 import time
 from functools import wraps
 from logging import Logger
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Union
 
+PROFILE_STARTUP_FLAG = "--profile-startup"
 
-def log_execution_time(logger: Logger) -> Callable[..., Any]:
+
+def log_execution_time(logger: Union[Logger, Callable[[], Logger]]) -> Callable[..., Any]:
     """
     Decorator to log the execution time of a function.
     It also logs any exceptions that occur during the function execution.
+    The logger may also be given as a function that returns the logger, so that it
+    is only resolved when the decorated function is called.
     """
 
+    def get_logger() -> Logger:
+        return logger if hasattr(logger, "debug") else logger()
+
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
@@ -19,14 +28,100 @@ def log_execution_time(logger: Logger) -> Callable[..., Any]:
                 return result
             except Exception as e:
                 # Log the exception
-                logger.exception(f"Exception in {func.__name__}: {e}")
+                get_logger().exception(f"Exception in {func.__name__}: {e}")
                 # Re-raise the exception to propagate it
                 raise
             finally:
                 end_time = time.time()
                 execution_time = end_time - start_time
-                logger.debug(f"Function {func.__name__} executed in {execution_time:.4f} seconds")
+                get_logger().debug(
+                    f"Function {func.__name__} executed in {execution_time:.4f} seconds"
+                )
 
         return wrapper
 
     return decorator
+
+
+class ImportProfiler:
+    """
+    Record the time spent importing modules, in the style of `python -X importtime`.
+    Only modules that are first imported while the profiler is running are recorded.
+    """
+
+    def __init__(self):
+        # (module name, nesting depth, self time in us, cumulative time in us), in completion order
+        self.records: list[tuple[str, int, int, int]] = []
+        self.elapsed: float = 0.0
+        self._child_times: list[float] = []
+        self._original_import: Optional[Callable[..., Any]] = None
+        self._started_at: float = 0.0
+
+    @staticmethod
+    def _resolve_name(name: str, globals_: Optional[dict], level: int) -> str:
+        """Resolve a relative import to the absolute module name"""
+        if level == 0 or not globals_:
+            return name
+        package = globals_.get("__package__") or globals_.get("__name__", "")
+        base = package.rsplit(".", level - 1)[0]
+        return f"{base}.{name}" if name else base
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module_name = self._resolve_name(name, globals, level)
+        if module_name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        depth = len(self._child_times)
+        self._child_times.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = self._child_times.pop()
+            if self._child_times:
+                self._child_times[-1] += cumulative
+            self.records.append(
+                (module_name, depth, int((cumulative - children) * 1e6), int(cumulative * 1e6))
+            )
+
+    def start(self) -> "ImportProfiler":
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+            self._started_at = time.perf_counter()
+        return self
+
+    def stop(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+            self.elapsed = time.perf_counter() - self._started_at
+
+    def __enter__(self) -> "ImportProfiler":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    @classmethod
+    def for_command_line(cls, argv: Optional[list[str]] = None) -> Optional["ImportProfiler"]:
+        """
+        Start a profiler if the command line includes `--profile-startup`. Entry points call
+        this before their other imports, so that the report covers the whole start-up.
+        """
+        argv = sys.argv[1:] if argv is None else argv
+        return cls().start() if PROFILE_STARTUP_FLAG in argv else None
+
+    def report(self) -> str:
+        """Format the recorded imports like `-X importtime`, followed by a summary"""
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for name, depth, self_us, cumulative_us in self.records:
+            lines.append(f"import time: {self_us:>9} | {cumulative_us:>10} | {'  ' * depth}{name}")
+
+        import_us = sum(cumulative_us for _, depth, _, cumulative_us in self.records if depth == 0)
+        lines.append(
+            f"startup: {len(self.records)} modules imported in {import_us / 1000:.1f} ms, "
+            f"of {self.elapsed * 1000:.1f} ms total"
+        )
+        return "\n".join(lines)
@@ -1,13 +1,19 @@
-import argparse
-import json
-import os
 import sys
-from argparse import Namespace
-from typing import Any, Callable, Optional
 
-from pydantic import BaseModel
+from common.utils.profiling import PROFILE_STARTUP_FLAG, ImportProfiler
 
-from common.model.models import (
+# started before the other imports, which are most of the start-up time
+startup_profiler = ImportProfiler.for_command_line()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+from argparse import Namespace  # noqa: E402
+from typing import Any, Callable, Optional  # noqa: E402
+
+from pydantic import BaseModel  # noqa: E402
+
+from common.model.models import (  # noqa: E402
     HFGetAvailableTemplatesResponse,
     HFRequestMachinesResponse,
     HFRequestReturnMachines,
@@ -15,22 +21,19 @@ from common.model.models import (
     HFReturnRequests,
     HFReturnRequestsResponse,
 )
-from common.utils.file_utils import load_json_file
-from common.utils.path_utils import (
+from common.utils.file_utils import load_json_file  # noqa: E402
+from common.utils.path_utils import (  # noqa: E402
     normalize_path,
 )
-from common.utils.version import get_version
-from gce_provider.commands.get_request_status import get_request_status
-from gce_provider.commands.get_return_requests import get_return_requests
-from gce_provider.commands.request_machines import request_machines
-from gce_provider.commands.request_return_machines import request_return_machines
-from gce_provider.config import Config, get_config
-from gce_provider.db.initialize import main as initialize_db
-from gce_provider.db.machines import MachineDao
-from gce_provider.initialize import ensure_initialized
-from gce_provider.model.models import HFGceRequestMachines
-from gce_provider.pubsub import launch_pubsub_daemon, main as monitor_events
-from gce_provider.utils.constants import CommandNames
+from common.utils.version import get_version  # noqa: E402
+from gce_provider.config import Config, get_config  # noqa: E402
+from gce_provider.initialize import ensure_initialized  # noqa: E402
+from gce_provider.model.models import HFGceRequestMachines  # noqa: E402
+from gce_provider.utils.constants import CommandNames  # noqa: E402
+
+# Command modules are imported within the command that needs them, because HostFactory invokes
+# this CLI for every poll, and read-only commands should not pay for loading the Compute and
+# Pub/Sub client libraries.
 
 
 #   1. Before running this module,
@@ -59,6 +62,9 @@ valid_commands = ValidCommands(
         CommandNames.MONITOR_EVENTS.value: lambda config, payload: cmd_monitor_events(
             config, payload
         ),
+        CommandNames.SERVE_REQUESTS.value: lambda config, payload: cmd_serve_requests(
+            config, payload
+        ),
         "trimDB": lambda config, payload: cmd_trim_db(config, payload),
         "requestMachines": lambda config, payload: cmd_request_machines(
             config, payload
@@ -82,22 +88,60 @@ class NullOutput(BaseModel):
     pass
 
 
+class RenderedOutput(BaseModel):
+    """Output that the command has already rendered"""
+
+    text: str
+
+
 def cmd_initialize_db(config: Config, _: Optional[dict] = None) -> Optional[BaseModel]:
-    """Initialize the event database"""
-    initialize_db(config)
+    """Initialize the event database, and run the full integrity check"""
+    from gce_provider.db.health import DatabaseHealth
+    from gce_provider.db.initialize import main as initialize_db
+
+    initialize_db(config, vacuum=True)
+    DatabaseHealth(config).run_integrity_check()
     return NullOutput()
 
 
 def cmd_monitor_events(_: Config, __: Optional[dict]) -> Optional[BaseModel]:
     """Monitor GCE cloud events"""
+    from gce_provider.pubsub import main as monitor_events
+
     monitor_events()
     return NullOutput()
 
-def cmd_trim_db(config: Config, __:Optional[dict] = None) -> Optional[BaseModel]:
-    """Trim the database"""
-    MachineDao(config).remove_expired_returned_machines()
+
+def cmd_serve_requests(config: Config, __: Optional[dict] = None) -> Optional[BaseModel]:
+    """Serve provider commands from a long-lived process"""
+    from gce_provider.db.connection import background_checkpoint
+    from gce_provider.server import serve
+    from gce_provider.utils import client_factory
+
+    def warm_up():
+        ensure_initialized(config)
+        client_factory.instances_client()
+        client_factory.instance_group_managers_client()
+
+    def run(command: str, payload: Optional[dict]) -> tuple[int, Optional[str]]:
+        try:
+            output = render_command(command, config, payload)
+            launch_monitor_if_needed(command, config)
+            return 0, output
+        except Exception as e:
+            return 1, f"Error: {e}"
+
+    with background_checkpoint(config):
+        serve(config, run, warm_up)
     return NullOutput()
 
+
+def cmd_trim_db(config: Config, __:Optional[dict] = None) -> Optional[BaseModel]:
+    """Trim the database, and report the rows deleted and the bytes reclaimed"""
+    from gce_provider.db.trim import trim_db
+
+    return trim_db(config, vacuum=True)
+
 def cmd_get_available_templates(
     config: Config,
     payload: Optional[dict] = None,
@@ -141,6 +185,8 @@ def cmd_request_machines(
     :param payload: the request payload
     :return: JSON response
     """
+    from gce_provider.commands.request_machines import request_machines
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_request_machines {payload}")
@@ -179,6 +225,8 @@ def cmd_request_return_machines(config: Config, payload: Optional[dict] = None):
     :param payload: the request payload
     :return: JSON response
     """
+    from gce_provider.commands.request_return_machines import request_return_machines
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_request_return_remachines {payload}")
@@ -195,13 +243,15 @@ def cmd_get_request_status(config: Config, payload: Optional[dict]):
     :param payload: the request payload
     :return: JSON response
     """
+    from gce_provider.commands.get_request_status import render_request_status
+
     if payload is None:
         raise ValueError("Must specify the requests")
     config.logger.info(f"cmd_get_request_machine_status {payload}")
 
     hf_request = HFRequestStatus(requests=payload["requests"])
     config.logger.debug(f"request: {hf_request}")
-    return get_request_status(hf_request)
+    return RenderedOutput(text=render_request_status(hf_request, config))
 
 
 def cmd_get_return_requests(
@@ -213,6 +263,8 @@ def cmd_get_return_requests(
     :param payload: the request payload
     :return: JSON response
     """
+    from gce_provider.commands.get_return_requests import get_return_requests
+
     config.logger.info(f"cmd_get_return_requests {payload}")
 
     hf_request = HFReturnRequests(machines=payload["machines"])
@@ -220,13 +272,13 @@ def cmd_get_return_requests(
     return get_return_requests(hf_request, config)
 
 
-def dispatch_command(command: str, config: Config, payload: Optional[dict]):
+def render_command(command: str, config: Config, payload: Optional[dict]) -> Optional[str]:
     """
-    Dispatch a command by executing the relevant service module
+    Execute a command by invoking the relevant service module, and render its output
     :param command: The command argument
     :param config: the configuration
     :param payload: The JSON payload
-    :return: The command's response
+    :return: The text to print, or None if the command intentionally has no output
     """
     config.logger.info(
         f"DISPATCHING|command: {command}; payload: {json.dumps(payload)}"
@@ -240,15 +292,17 @@ def dispatch_command(command: str, config: Config, payload: Optional[dict]):
         result = cmd(config, payload)
         config.logger.info(f"DISPATCHED|command: {command}; result: {result}")
         if isinstance(result, NullOutput):
-            return
+            return None
+        if isinstance(result, RenderedOutput):
+            config.logger.info(f"DISPATCHED|command: {command}; output: {result.text}")
+            return result.text
         if result is not None:
             output = result.model_dump_json(
                 indent=2,
                 exclude_none=True,
             )
             config.logger.info(f"DISPATCHED|command: {command}; output: {output}")
-            print(output)
-            return
+            return output
         else:
             ex = RuntimeError(f"DISPATCHING|command: {command}; ERROR: empty result")
             config.logger.error(ex)
@@ -257,6 +311,35 @@ def dispatch_command(command: str, config: Config, payload: Optional[dict]):
         raise Exception(f"Invalid command: {cmd}")
 
 
+def dispatch_command(command: str, config: Config, payload: Optional[dict]):
+    """
+    Dispatch a command by executing the relevant service module, and print its output
+    :param command: The command argument
+    :param config: the configuration
+    :param payload: The JSON payload
+    """
+    output = render_command(command, config, payload)
+    if output is not None:
+        print(output)
+
+
+def launch_monitor_if_needed(command: str, config: Config, monitor: bool = False) -> None:
+    """Launch the event monitor after a command, unless the command is itself long-lived"""
+    if command not in (
+        CommandNames.MONITOR_EVENTS.value,
+        CommandNames.SERVE_REQUESTS.value,
+    ) and (monitor or config.pubsub_auto_launch):
+        from gce_provider.utils.process_lock import is_locked
+
+        # checked before importing the monitor, which is only needed to launch it
+        if is_locked(config.pubsub_lockfile, config.logger):
+            return
+
+        from gce_provider.pubsub import launch_pubsub_daemon
+
+        launch_pubsub_daemon()
+
+
 def parse_args() -> Namespace:
     """
     Parse the args from the script
@@ -276,6 +359,11 @@ def parse_args() -> Namespace:
         action="store_true",
         help="Also launch a daemon that monitors VM events",
     )
+    parser.add_argument(
+        PROFILE_STARTUP_FLAG,
+        action="store_true",
+        help="Report the time spent importing modules for the command to stderr",
+    )
     parser.add_argument(
         "-v", "--version", action="version", version=f"%(prog)s {get_version()}"
     )
@@ -307,21 +395,23 @@ def extract_payload(args) -> Optional[dict]:
 
 
 def main():
+    profiler = startup_profiler
     try:
         args = parse_args()
         payload = extract_payload(args)
         config = get_config()
         dispatch_command(args.command, config, payload)
-
-        if args.command != CommandNames.MONITOR_EVENTS.value and (
-            args.monitor or config.pubsub_auto_launch
-        ):
-            launch_pubsub_daemon()
+        launch_monitor_if_needed(args.command, config, args.monitor)
 
         sys.exit(0)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            # stdout is reserved for the HostFactory response
+            print(profiler.report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
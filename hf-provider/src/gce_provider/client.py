@@ -0,0 +1,171 @@
+"""
+A thin client for the long-lived provider server.
+
+HostFactory invokes a provider script for every poll. Rather than starting the full `hf-gce`
+CLI each time, the scripts call this client, which forwards the command and its JSON payload
+to a running `hf-gce serveRequests` process over a local UNIX socket. If no server is listening,
+the client falls back to executing the command in-process, exactly as `hf-gce` would.
+
+This module deliberately depends on the standard library and the provider configuration
+constants only, so that it starts quickly.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from typing import Optional
+
+from common.utils.file_utils import load_json_file
+from common.utils.path_utils import normalize_path
+from gce_provider.config import (
+    CONFIG_VAR_SERVER_SOCKET,
+    DEFAULT_CONFIG_FILENAME,
+    DEFAULT_SERVER_SOCKET,
+    ENV_HF_PROVIDER_CONFDIR,
+    ENV_PLUGIN_CONFIG_FILENAME,
+    ENV_PLUGIN_SERVER_SOCKET,
+)
+
+# commands that may be forwarded to the server. Anything else runs in-process.
+SERVABLE_COMMANDS = frozenset(
+    {
+        "getAvailableTemplates",
+        "requestMachines",
+        "requestReturnMachines",
+        "getRequestStatus",
+        "getReturnRequests",
+    }
+)
+
+CONNECT_TIMEOUT_SECONDS = 1.0
+RESPONSE_TIMEOUT_SECONDS = 600.0
+
+
+class ServerUnavailable(RuntimeError):
+    """Indicates that no provider server is listening on the socket"""
+
+    pass
+
+
+def resolve_socket_path() -> str:
+    """
+    Determine the server socket path without loading the full provider configuration.
+    The environment variable takes precedence over the provider config file.
+    """
+    socket_path = os.environ.get(ENV_PLUGIN_SERVER_SOCKET)
+    if socket_path:
+        return socket_path
+
+    conf_dir = os.environ.get(ENV_HF_PROVIDER_CONFDIR)
+    if conf_dir:
+        conf_path = os.path.join(
+            conf_dir, os.environ.get(ENV_PLUGIN_CONFIG_FILENAME, DEFAULT_CONFIG_FILENAME)
+        )
+        try:
+            conf = load_json_file(conf_path) or {}
+            return conf.get(CONFIG_VAR_SERVER_SOCKET) or DEFAULT_SERVER_SOCKET
+        except Exception:
+            pass
+    return DEFAULT_SERVER_SOCKET
+
+
+def encode_message(message: dict) -> bytes:
+    """Encode a protocol message as a single line of JSON"""
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+def decode_message(line: bytes) -> dict:
+    """Decode a single line of JSON into a protocol message"""
+    return json.loads(line.decode("utf-8"))
+
+
+def send_request(socket_path: str, command: str, payload: Optional[dict]) -> dict:
+    """
+    Forward a command to the provider server and return its response, which contains
+    the `exit_code` and the `output` to print.
+    Raises ServerUnavailable if the server could not be reached. Once the request has been sent,
+    any failure is raised as-is, because the command may already have been executed.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT_SECONDS)
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            raise ServerUnavailable(f"No provider server at {socket_path}: {e}") from e
+
+        sock.settimeout(RESPONSE_TIMEOUT_SECONDS)
+        sock.sendall(encode_message({"command": command, "payload": payload}))
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+        if not line:
+            raise RuntimeError("Provider server closed the connection without a response")
+        return decode_message(line)
+    finally:
+        sock.close()
+
+
+def parse_args(argv: list[str]) -> Optional[argparse.Namespace]:
+    """Parse the subset of the hf-gce arguments that can be forwarded to the server"""
+    parser = argparse.ArgumentParser(prog="hf-gce-client", add_help=False)
+    parser.add_argument("command")
+    parser.add_argument("json", nargs="?")
+    parser.add_argument("-f", "--json-file")
+
+    try:
+        args, unknown = parser.parse_known_args(argv)
+    except SystemExit:
+        return None
+    if unknown or args.command not in SERVABLE_COMMANDS:
+        return None
+    return args
+
+
+def extract_payload(args: argparse.Namespace) -> Optional[dict]:
+    """Load the payload on the client side, because the server does not share our working dir"""
+    if args.json is not None:
+        return json.loads(args.json)
+    if args.json_file:
+        return load_json_file(normalize_path(os.getcwd(), args.json_file))
+    return None
+
+
+def run_in_process(argv: list[str]) -> None:
+    """Execute the command without the server, exactly as the hf-gce CLI would"""
+    if getattr(sys, "frozen", False):
+        # When running in a PyInstaller bundle, the hf-gce binary should be in the same directory
+        hf_gce_exe = os.path.join(os.path.dirname(sys.argv[0]), "hf-gce")
+        os.execv(hf_gce_exe, [hf_gce_exe, *argv])
+    else:
+        from gce_provider.__main__ import main as cli_main
+
+        sys.argv = [sys.argv[0], *argv]
+        cli_main()
+
+
+def main():
+    argv = sys.argv[1:]
+    args = parse_args(argv)
+    if args is not None:
+        try:
+            payload = extract_payload(args)
+            response = send_request(resolve_socket_path(), args.command, payload)
+        except ServerUnavailable:
+            response = None
+        except Exception as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+        if response is not None:
+            output = response.get("output")
+            if output:
+                print(output)
+            sys.exit(response.get("exit_code", 1))
+
+    run_in_process(argv)
+
+
+if __name__ == "__main__":
+    main()
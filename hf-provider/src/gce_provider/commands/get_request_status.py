@@ -1,5 +1,7 @@
+import textwrap
+import threading
 from datetime import timezone
-from typing import Optional
+from typing import Hashable, Optional, Type, Union
 
 from common.model.models import HFRequestStatus, HFRequestStatusResponse
 from common.utils.list_utils import flatten
@@ -11,28 +13,40 @@ from gce_provider.commands.helpers.request_return_machine_status_helper import (
 )
 from gce_provider.config import Config, get_config
 from gce_provider.db.machines import MachineDao
-from gce_provider.model.models import HfMachineStatus
+from gce_provider.db.records import MachineRecord
+from gce_provider.model.models import RequestStateCounts, RequestStatusSummary
+from gce_provider.utils.constants import RequestStatus
+from gce_provider.utils.lru_cache import LRUCache
+
+
+StatusEvaluator = Union[
+    Type[RequestMachineStatusEvaluator], Type[RequestReturnMachineStatusEvaluator]
+]
+
+FINAL_STATUSES = (RequestStatus.complete.value, RequestStatus.complete_with_error.value)
+
+_response_cache: Optional[LRUCache[tuple[Hashable, str]]] = None
+_response_cache_lock = threading.Lock()
 
 
 def to_machine_response(
-    machine: HfMachineStatus,
+    machine: MachineRecord,
+    status_helper: StatusEvaluator,
 ) -> HFRequestStatusResponse.Request.Machine:
     """Build a machine response object from a machine object"""
     return HFRequestStatusResponse.Request.Machine(
         machineId=machine.machine_name,
         name=machine.machine_name,
-        result=machine.hf_machine_result.value,
-        status=machine.hf_machine_status.value,
+        result=status_helper.evaluate_machine_result(machine).value,
+        status=status_helper.evaluate_machine_status(machine).value,
         privateIpAddress=machine.internal_ip,
         publicIpAddress=machine.external_ip,
         launchTime=int(machine.created_at.replace(tzinfo=timezone.utc).timestamp()),
     )
 
 
-def get_request_status(request: HFRequestStatus, config: Optional[Config] = None):
-    if config is None:
-        config = get_config()
-    config.logger.debug(f"request = {request}")
+def _get_request_ids(request: HFRequestStatus, config: Config) -> list[str]:
+    """Return the IDs of the requests to report on, in the order that they were asked for"""
     # check to see if any element of the request.requests list contains an object with a key "requestId"
     if len(request.requests) < 1 or not any(
         "requestId" in req and req["requestId"] for req in flatten([request.requests])
@@ -40,32 +54,123 @@ def get_request_status(request: HFRequestStatus, config: Optional[Config] = None
         config.logger.error("No requestId found in request")
         raise ValueError("No requestId found.")
 
-    request_list = flatten([request.requests])
-    request_responses = []
+    return [request_item["requestId"] for request_item in flatten([request.requests])]
 
-    for request_item in request_list:
-        request_id = request_item["requestId"]
-        machines: list[HfMachineStatus] = MachineDao(config).get_machines_for_request(
-            request_id
-        )
+
+def _build_request_responses(
+    dao: MachineDao, request_ids: list[str]
+) -> dict[str, HFRequestStatusResponse.Request]:
+    """Build the response of each request, keyed by request ID. Call within a DAO snapshot."""
+    # fetch every request at once, rather than one query per request. The event monitor
+    # stores each request's status as it changes; requests without a stored status are
+    # counted from their machines. Machine rows are only needed for the response.
+    counts_by_request: dict[str, RequestStateCounts] = dict(
+        dao.get_request_status_summaries(request_ids)
+    )
+    uncounted = [request_id for request_id in request_ids if request_id not in counts_by_request]
+    if uncounted:
+        counts_by_request.update(dao.get_request_state_counts(uncounted))
+    machines_by_request = dao.get_machines_for_requests(request_ids)
+
+    request_responses = {}
+    for request_id in request_ids:
+        counts = counts_by_request[request_id]
+        machines: list[MachineRecord] = machines_by_request[request_id]
 
         status_helper = (
-            RequestMachineStatusEvaluator
-            if (len(machines) > 0 and request_id == machines[0].request_id)
-            else RequestReturnMachineStatusEvaluator
+            RequestReturnMachineStatusEvaluator
+            if counts.is_return_request
+            else RequestMachineStatusEvaluator
         )
 
-        request_status = status_helper.evaluate_request_status(machines)
+        if isinstance(counts, RequestStatusSummary):
+            request_status = counts.status
+        else:
+            request_status = status_helper.evaluate_request_status_from_counts(counts)
 
-        machines_response = [to_machine_response(machine) for machine in machines]
-        request_responses.append(
-            HFRequestStatusResponse.Request(
-                requestId=request_id,
-                status=request_status.value,
-                machines=machines_response,
-            )
+        machines_response = [
+            to_machine_response(machine, status_helper) for machine in machines
+        ]
+        request_responses[request_id] = HFRequestStatusResponse.Request(
+            requestId=request_id,
+            status=request_status.value,
+            machines=machines_response,
         )
+    return request_responses
+
 
-    result = HFRequestStatusResponse(requests=request_responses)
+def get_request_status(request: HFRequestStatus, config: Optional[Config] = None):
+    if config is None:
+        config = get_config()
+    config.logger.debug(f"request = {request}")
+    request_ids = _get_request_ids(request, config)
+
+    dao = MachineDao(config)
+    with dao.snapshot():
+        request_responses = _build_request_responses(dao, request_ids)
+
+    result = HFRequestStatusResponse(
+        requests=[request_responses[request_id] for request_id in request_ids]
+    )
 
     return result
+
+
+def _get_response_cache(config: Config) -> LRUCache[tuple[Hashable, str]]:
+    """The process-wide cache of (fingerprint, response JSON) per request ID"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LRUCache(
+                config.request_status_cache_size, config.request_status_cache_ttl
+            )
+        return _response_cache
+
+
+def _render_response(request_jsons: list[str]) -> str:
+    """
+    Assemble the JSON of the requests into the JSON of the response, exactly as
+    `HFRequestStatusResponse.model_dump_json(indent=2, exclude_none=True)` renders it
+    """
+    requests = ",\n".join(textwrap.indent(request_json, "    ") for request_json in request_jsons)
+    return f'{{\n  "requests": [\n{requests}\n  ]\n}}'
+
+
+def render_request_status(request: HFRequestStatus, config: Optional[Config] = None) -> str:
+    """
+    Render the getRequestStatus response. HostFactory polls the same requests every few
+    seconds, so the JSON of each request is cached with the request's fingerprint, and is
+    reused until the request's machines change. Requests that are finished are not cached,
+    because HostFactory stops polling a request once it has received its final status.
+    """
+    if config is None:
+        config = get_config()
+    config.logger.debug(f"request = {request}")
+    request_ids = _get_request_ids(request, config)
+    cache = _get_response_cache(config)
+
+    request_jsons: dict[str, str] = {}
+    dao = MachineDao(config)
+    with dao.snapshot():
+        fingerprints = dao.get_request_fingerprints(request_ids)
+        for request_id, fingerprint in fingerprints.items():
+            cached = cache.get(request_id)
+            if cached is not None and cached[0] == fingerprint:
+                request_jsons[request_id] = cached[1]
+        changed = [request_id for request_id in request_ids if request_id not in request_jsons]
+        request_responses = _build_request_responses(dao, changed) if changed else {}
+
+    for request_id, response in request_responses.items():
+        request_json = response.model_dump_json(indent=2, exclude_none=True)
+        request_jsons[request_id] = request_json
+        fingerprint = fingerprints.get(request_id)
+        if fingerprint is None or response.status in FINAL_STATUSES:
+            cache.pop(request_id)
+        else:
+            cache.put(request_id, (fingerprint, request_json))
+    config.logger.debug(
+        f"getRequestStatus: {len(request_ids) - len(request_responses)} of "
+        f"{len(request_ids)} requests answered from the cache"
+    )
+
+    return _render_response([request_jsons[request_id] for request_id in request_ids])
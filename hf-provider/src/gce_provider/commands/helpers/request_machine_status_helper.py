@@ -1,6 +1,4 @@
-from functools import reduce
-
-from gce_provider.model.models import HfMachineStatus
+from gce_provider.model.models import HfMachineStatus, RequestStateCounts
 from gce_provider.utils.constants import (
     MachineResult,
     MachineState,
@@ -12,28 +10,32 @@ from gce_provider.utils.constants import (
 class RequestMachineStatusEvaluator:
     @classmethod
     def evaluate_request_status(cls, machines: list[HfMachineStatus]) -> RequestStatus:
-        return reduce(
-            cls.evaluate_request_status_reducer,
-            machines,
-            RequestStatus.complete,
+        for machine in machines:
+            machine.hf_machine_result = cls.evaluate_machine_result(machine)
+            machine.hf_machine_status = cls.evaluate_machine_status(machine)
+
+        return cls.evaluate_request_status_from_counts(
+            RequestStateCounts.from_machines("", machines)
         )
 
     @classmethod
-    def evaluate_request_status_reducer(
-        cls, acc: RequestStatus, machine: HfMachineStatus
-    ) -> RequestStatus:
-        """A reducer function to determine the request state"""
-        machine.hf_machine_result = cls.evaluate_machine_result(machine)
-        machine.hf_machine_status = cls.evaluate_machine_status(machine)
-
-        # we can't use match / case until Python 3.10+
-        if machine.hf_machine_result == MachineResult.executing:
+    def evaluate_request_status_from_counts(cls, counts: RequestStateCounts) -> RequestStatus:
+        """
+        Determine the request state from the number of machines in each state:
+        running while any machine is executing, otherwise complete_with_error if any failed
+        """
+        inserted = MachineState.INSERTED.value
+        executing = counts.missing_ip_counts.get(inserted, 0) + sum(
+            count for state, count in counts.machine_counts.items() if state < inserted
+        )
+        if executing > 0:
             return RequestStatus.running
 
-        if machine.hf_machine_result == MachineResult.fail:
+        failed = sum(count for state, count in counts.machine_counts.items() if state > inserted)
+        if failed > 0:
             return RequestStatus.complete_with_error
 
-        return acc or RequestStatus.complete
+        return RequestStatus.complete
 
     @classmethod
     def evaluate_machine_result(cls, machine: HfMachineStatus):
@@ -1,6 +1,4 @@
-from functools import reduce
-
-from gce_provider.model.models import HfMachineStatus
+from gce_provider.model.models import HfMachineStatus, RequestStateCounts
 from gce_provider.utils.constants import (
     MachineResult,
     MachineState,
@@ -15,28 +13,25 @@ class RequestReturnMachineStatusEvaluator:
 
     @classmethod
     def evaluate_request_status(cls, machines: list[HfMachineStatus]) -> RequestStatus:
-        return reduce(
-            cls.evaluate_request_status_reducer,
-            machines,
-            RequestStatus.complete,
+        for machine in machines:
+            machine.hf_machine_result = cls.evaluate_machine_result(machine)
+            machine.hf_machine_status = cls.evaluate_machine_status(machine)
+
+        return cls.evaluate_request_status_from_counts(
+            RequestStateCounts.from_machines("", machines, is_return_request=True)
         )
 
     @classmethod
-    def evaluate_request_status_reducer(
-        cls, acc: RequestStatus, machine: HfMachineStatus
-    ) -> RequestStatus:
-        """A reducer function to determine the request state"""
-        machine.hf_machine_result = cls.evaluate_machine_result(machine)
-        machine.hf_machine_status = cls.evaluate_machine_status(machine)
-
-        # we can't use match / case until Python 3.10+
-        if machine.hf_machine_result == MachineResult.executing:
+    def evaluate_request_status_from_counts(cls, counts: RequestStateCounts) -> RequestStatus:
+        """
+        Determine the request state from the number of machines in each state:
+        running until every machine has been deleted
+        """
+        deleted = MachineState.DELETED.value
+        if any(count for state, count in counts.machine_counts.items() if state != deleted):
             return RequestStatus.running
 
-        if machine.hf_machine_result == MachineResult.fail:
-            return RequestStatus.complete_with_error
-
-        return acc or RequestStatus.complete
+        return RequestStatus.complete
 
     @classmethod
     def evaluate_machine_result(cls, machine: HfMachineStatus) -> MachineResult:
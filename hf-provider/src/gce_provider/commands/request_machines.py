@@ -4,6 +4,7 @@ import google.cloud.compute_v1 as compute
 
 from common.model.models import HFRequestMachinesResponse
 from gce_provider.config import Config, get_config
+from gce_provider.db.health import DatabaseHealth
 from gce_provider.db.machines import MachineDao
 from gce_provider.model.models import HFGceRequestMachines
 from gce_provider.utils import client_factory
@@ -52,10 +53,9 @@ def request_machines(
     ]
 
     try:
-        # Create MachineDao instance and
-        # Run the fast and raises RuntimeError if something went wrong
+        # Run the constant-time health check; raises RuntimeError if something went wrong
+        DatabaseHealth(config).check_or_raise()
         dao = MachineDao(config)
-        dao.check_or_raise()
 
         client = client_factory.instance_group_managers_client()
         request = compute.CreateInstancesInstanceGroupManagerRequest(
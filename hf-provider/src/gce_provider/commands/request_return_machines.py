@@ -7,7 +7,7 @@ from common.utils.list_utils import flatten
 from gce_provider.config import Config, get_config
 from gce_provider.db.gce_helpers import to_resource_url
 from gce_provider.db.machines import MachineDao
-from gce_provider.model.models import HfMachine
+from gce_provider.db.records import MachineRecord
 from gce_provider.utils import client_factory
 from gce_provider.utils.string_utils import generate_unique_id
 
@@ -27,7 +27,7 @@ def request_return_machines(hfr: HFRequestReturnMachines, config: Optional[Confi
     machine_data = db_machines.get_machines_by_name(machine_names)
 
     # group the machines into instance groups and zones
-    machines: dict[str, dict[str, list[HfMachine]]] = {}
+    machines: dict[str, dict[str, list[MachineRecord]]] = {}
     for machine in machine_data:
         if machine.instance_group_manager in machines:
             instance_group = machines[machine.instance_group_manager]
@@ -9,6 +9,7 @@ from socket import gethostname
 import common.utils.path_utils as path_utils
 from common.utils.file_utils import load_json_file
 from logging.handlers import RotatingFileHandler
+from gce_provider.utils.constants import EventSource
 
 # Load environment variables from .env file (if it exists)
 load_dotenv()
@@ -35,17 +36,46 @@ DEFAULT_CONFIG_FILENAME = "gcpgceinstprov_config.json"
 DEFAULT_DB_FILENAME = DEFAULT_HF_PROVIDER_NAME
 DEFAULT_AUTO_RUN_TRIM_DB_CMD = True
 DEFAULT_RETURNED_VM_TTL = "30" # 30 days
+DEFAULT_TRIM_DB_INTERVAL = "3600" # 1 hour
+DEFAULT_TRIM_DB_BATCH_SIZE = "500"
+DEFAULT_DB_ARCHIVE_INTERVAL = "300" # 5 minutes
+DEFAULT_DB_ARCHIVE_DELAY = "600" # 10 minutes
 DEFAULT_GCP_CREDENTIALS_FILE = None
 DEFAULT_PUBSUB_TIMEOUT_SECONDS = "600"
 DEFAULT_PUBSUB_TOPIC = "hf-gce-vm-events"
 DEFAULT_PUBSUB_SUBSCRIPTION = "hf-gce-vm-events-sub"
 DEFAULT_PUBSUB_LOCKFILE = "/tmp/sym_hf_gcp_pubsub.lock"
 DEFAULT_PUBSUB_AUTOLAUNCH = True
+DEFAULT_PUBSUB_SUPERVISE = False
+DEFAULT_PUBSUB_BATCH_MAX_MESSAGES = "100"
+DEFAULT_PUBSUB_BATCH_MAX_LATENCY_MS = "50"
+DEFAULT_PUBSUB_MAX_OUTSTANDING_MESSAGES = "1000"
+DEFAULT_PUBSUB_MAX_OUTSTANDING_BYTES = "104857600" # 100 MiB
+DEFAULT_PUBSUB_CALLBACK_THREADS = "10"
+DEFAULT_PUBSUB_STREAMS = "1"
+DEFAULT_POST_ACK_WORKERS = "10"
+DEFAULT_POST_ACK_MAX_PENDING = "1000"
+DEFAULT_POST_ACK_STATS_INTERVAL = "60" # 1 minute
+DEFAULT_IP_RESOLVE_INTERVAL = "5" # 5 seconds
+DEFAULT_PUBSUB_DEDUP_CACHE_SIZE = "10000"
+DEFAULT_PUBSUB_DEDUP_RETENTION = "604800" # 7 days
+DEFAULT_PENDING_TASK_INTERVAL = "1" # 1 second
+DEFAULT_EVENT_SOURCE = EventSource.PUBSUB.value
+DEFAULT_RECONCILE_INTERVAL = "60" # 1 minute
+DEFAULT_SERVER_SOCKET = "/tmp/sym_hf_gcp_provider.sock"
+DEFAULT_REQUEST_STATUS_CACHE_SIZE = "4096"
+DEFAULT_REQUEST_STATUS_CACHE_TTL = "300" # 5 minutes
+DEFAULT_DB_CHECKPOINT_INTERVAL = "60" # 60 seconds
+DEFAULT_DB_INTEGRITY_CHECK_INTERVAL = "3600" # 1 hour
 
 CONFIG_VAR_HF_DBDIR = "HF_DBDIR"
 CONFIG_VAR_DB_FILENAME = "DB_FILENAME" 
 CONFIG_VAR_AUTO_RUN_TRIM_DB_CMD = "AUTO_RUN_TRIM_DB_CMD"
 CONFIG_VAR_RETURNED_VM_TTL = "RETURNED_VM_TTL"
+CONFIG_VAR_TRIM_DB_INTERVAL = "TRIM_DB_INTERVAL"
+CONFIG_VAR_TRIM_DB_BATCH_SIZE = "TRIM_DB_BATCH_SIZE"
+CONFIG_VAR_DB_ARCHIVE_INTERVAL = "DB_ARCHIVE_INTERVAL"
+CONFIG_VAR_DB_ARCHIVE_DELAY = "DB_ARCHIVE_DELAY"
 CONFIG_VAR_HF_TEMPLATES_FILENAME = "HF_TEMPLATES_FILENAME"
 CONFIG_VAR_GCP_CREDENTIALS_FILE = "GCP_CREDENTIALS_FILE"
 CONFIG_VAR_GCP_PROJECT_ID = "GCP_PROJECT_ID"
@@ -59,6 +89,27 @@ CONFIG_VAR_PUBSUB_TOPIC = "PUBSUB_TOPIC"
 CONFIG_VAR_PUBSUB_SUBSCRIPTION = "PUBSUB_SUBSCRIPTION"
 CONFIG_VAR_PUBSUB_LOCKFILE = "PUBSUB_LOCKFILE"
 CONFIG_VAR_PUBSUB_AUTOLAUNCH = "PUBSUB_AUTOLAUNCH"
+CONFIG_VAR_PUBSUB_SUPERVISE = "PUBSUB_SUPERVISE"
+CONFIG_VAR_PUBSUB_BATCH_MAX_MESSAGES = "PUBSUB_BATCH_MAX_MESSAGES"
+CONFIG_VAR_PUBSUB_BATCH_MAX_LATENCY_MS = "PUBSUB_BATCH_MAX_LATENCY_MS"
+CONFIG_VAR_PUBSUB_MAX_OUTSTANDING_MESSAGES = "PUBSUB_MAX_OUTSTANDING_MESSAGES"
+CONFIG_VAR_PUBSUB_MAX_OUTSTANDING_BYTES = "PUBSUB_MAX_OUTSTANDING_BYTES"
+CONFIG_VAR_PUBSUB_CALLBACK_THREADS = "PUBSUB_CALLBACK_THREADS"
+CONFIG_VAR_PUBSUB_STREAMS = "PUBSUB_STREAMS"
+CONFIG_VAR_POST_ACK_WORKERS = "POST_ACK_WORKERS"
+CONFIG_VAR_POST_ACK_MAX_PENDING = "POST_ACK_MAX_PENDING"
+CONFIG_VAR_POST_ACK_STATS_INTERVAL = "POST_ACK_STATS_INTERVAL"
+CONFIG_VAR_IP_RESOLVE_INTERVAL = "IP_RESOLVE_INTERVAL"
+CONFIG_VAR_PUBSUB_DEDUP_CACHE_SIZE = "PUBSUB_DEDUP_CACHE_SIZE"
+CONFIG_VAR_PUBSUB_DEDUP_RETENTION = "PUBSUB_DEDUP_RETENTION"
+CONFIG_VAR_PENDING_TASK_INTERVAL = "PENDING_TASK_INTERVAL"
+CONFIG_VAR_EVENT_SOURCE = "EVENT_SOURCE"
+CONFIG_VAR_RECONCILE_INTERVAL = "RECONCILE_INTERVAL"
+CONFIG_VAR_SERVER_SOCKET = "SERVER_SOCKET"
+CONFIG_VAR_REQUEST_STATUS_CACHE_SIZE = "REQUEST_STATUS_CACHE_SIZE"
+CONFIG_VAR_REQUEST_STATUS_CACHE_TTL = "REQUEST_STATUS_CACHE_TTL"
+CONFIG_VAR_DB_CHECKPOINT_INTERVAL = "DB_CHECKPOINT_INTERVAL"
+CONFIG_VAR_DB_INTEGRITY_CHECK_INTERVAL = "DB_INTEGRITY_CHECK_INTERVAL"
 
 
 def prepend_env_var(var: str) -> str:
@@ -68,6 +119,7 @@ def prepend_env_var(var: str) -> str:
 # Environment vars to configure this plugin
 ENV_PLUGIN_DB_FILENAME = prepend_env_var("DB_FILENAME")
 ENV_PLUGIN_CONFIG_FILENAME = prepend_env_var("CONFIG_FILENAME")
+ENV_PLUGIN_SERVER_SOCKET = prepend_env_var("SERVER_SOCKET")
 
 HF_PROVIDER_NAME = os.environ.get(ENV_HF_PROVIDER_NAME, DEFAULT_HF_PROVIDER_NAME)
 HF_PROVIDER_LOGDIR = os.environ.get(
@@ -179,6 +231,20 @@ class Config:
         )
         self.db_path = path_utils.normalize_path(self.hf_db_dir, self.db_name)
 
+        # Long-lived processes checkpoint the write-ahead log in the background; 0 disables
+        self.db_checkpoint_interval = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_DB_CHECKPOINT_INTERVAL, DEFAULT_DB_CHECKPOINT_INTERVAL
+            )
+        )
+
+        # The full integrity check is O(database size), so the monitor runs it in the background
+        self.db_integrity_check_interval = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_DB_INTEGRITY_CHECK_INTERVAL, DEFAULT_DB_INTEGRITY_CHECK_INTERVAL
+            )
+        )
+
         # Trim and TTL settings
         self.auto_run_trim_db: bool = bool(
             hf_provider_conf.get(
@@ -190,6 +256,25 @@ class Config:
                 CONFIG_VAR_RETURNED_VM_TTL, DEFAULT_RETURNED_VM_TTL
             )
         )
+        # The monitor trims the database in the background, one bounded batch per transaction
+        self.trim_db_interval = int(
+            hf_provider_conf.get(CONFIG_VAR_TRIM_DB_INTERVAL, DEFAULT_TRIM_DB_INTERVAL)
+        )
+        self.trim_db_batch_size = max(
+            1,
+            int(
+                hf_provider_conf.get(
+                    CONFIG_VAR_TRIM_DB_BATCH_SIZE, DEFAULT_TRIM_DB_BATCH_SIZE
+                )
+            ),
+        )
+        # Returned machines move to the archive table once they are no longer updated
+        self.db_archive_interval = int(
+            hf_provider_conf.get(CONFIG_VAR_DB_ARCHIVE_INTERVAL, DEFAULT_DB_ARCHIVE_INTERVAL)
+        )
+        self.db_archive_delay = int(
+            hf_provider_conf.get(CONFIG_VAR_DB_ARCHIVE_DELAY, DEFAULT_DB_ARCHIVE_DELAY)
+        )
 
         # Configure Google Cloud Pub/Sub settings
         self.pubsub_timeout_seconds = int(
@@ -214,6 +299,112 @@ class Config:
                 CONFIG_VAR_PUBSUB_AUTOLAUNCH, DEFAULT_PUBSUB_AUTOLAUNCH
             )
         )
+        self.pubsub_supervise: bool = bool(
+            hf_provider_conf.get(CONFIG_VAR_PUBSUB_SUPERVISE, DEFAULT_PUBSUB_SUPERVISE)
+        )
+
+        # The event listener applies messages in batches, one database transaction per batch
+        self.pubsub_batch_max_messages = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_PUBSUB_BATCH_MAX_MESSAGES, DEFAULT_PUBSUB_BATCH_MAX_MESSAGES
+            )
+        )
+        self.pubsub_batch_max_latency_ms = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_PUBSUB_BATCH_MAX_LATENCY_MS, DEFAULT_PUBSUB_BATCH_MAX_LATENCY_MS
+            )
+        )
+
+        # Flow control and threads of the subscriber's streaming pulls, per stream
+        self.pubsub_max_outstanding_messages = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_PUBSUB_MAX_OUTSTANDING_MESSAGES,
+                DEFAULT_PUBSUB_MAX_OUTSTANDING_MESSAGES,
+            )
+        )
+        self.pubsub_max_outstanding_bytes = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_PUBSUB_MAX_OUTSTANDING_BYTES, DEFAULT_PUBSUB_MAX_OUTSTANDING_BYTES
+            )
+        )
+        self.pubsub_callback_threads = max(
+            1,
+            int(
+                hf_provider_conf.get(
+                    CONFIG_VAR_PUBSUB_CALLBACK_THREADS, DEFAULT_PUBSUB_CALLBACK_THREADS
+                )
+            ),
+        )
+        self.pubsub_streams = int(
+            hf_provider_conf.get(CONFIG_VAR_PUBSUB_STREAMS, DEFAULT_PUBSUB_STREAMS)
+        )
+
+        # The work that follows acknowledged events, such as waiting for instance IPs
+        self.post_ack_workers = int(
+            hf_provider_conf.get(CONFIG_VAR_POST_ACK_WORKERS, DEFAULT_POST_ACK_WORKERS)
+        )
+        self.post_ack_max_pending = int(
+            hf_provider_conf.get(CONFIG_VAR_POST_ACK_MAX_PENDING, DEFAULT_POST_ACK_MAX_PENDING)
+        )
+        self.post_ack_stats_interval = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_POST_ACK_STATS_INTERVAL, DEFAULT_POST_ACK_STATS_INTERVAL
+            )
+        )
+
+        # The event listener resolves the IPs of new machines in bulk, per zone
+        self.ip_resolve_interval = int(
+            hf_provider_conf.get(CONFIG_VAR_IP_RESOLVE_INTERVAL, DEFAULT_IP_RESOLVE_INTERVAL)
+        )
+
+        # The event listener skips the messages that Pub/Sub redelivers after applying them
+        self.pubsub_dedup_cache_size = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_PUBSUB_DEDUP_CACHE_SIZE, DEFAULT_PUBSUB_DEDUP_CACHE_SIZE
+            )
+        )
+        self.pubsub_dedup_retention = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_PUBSUB_DEDUP_RETENTION, DEFAULT_PUBSUB_DEDUP_RETENTION
+            )
+        )
+
+        # The event listener retries the pending work of acknowledged messages when it is due
+        self.pending_task_interval = int(
+            hf_provider_conf.get(CONFIG_VAR_PENDING_TASK_INTERVAL, DEFAULT_PENDING_TASK_INTERVAL)
+        )
+
+        # The event monitor learns of machine changes from Pub/Sub, from reconciling the
+        # instance groups, or from both
+        event_source = hf_provider_conf.get(CONFIG_VAR_EVENT_SOURCE, DEFAULT_EVENT_SOURCE)
+        try:
+            self.event_source = EventSource(event_source.lower())
+        except ValueError:
+            raise RuntimeError(
+                f"Invalid {CONFIG_VAR_EVENT_SOURCE} '{event_source}', expected one of "
+                f"{[source.value for source in EventSource]}"
+            )
+        self.reconcile_interval = int(
+            hf_provider_conf.get(CONFIG_VAR_RECONCILE_INTERVAL, DEFAULT_RECONCILE_INTERVAL)
+        )
+
+        # Configure the long-lived provider server; the environment variable takes precedence
+        self.server_socket = os.environ.get(
+            ENV_PLUGIN_SERVER_SOCKET,
+            hf_provider_conf.get(CONFIG_VAR_SERVER_SOCKET, DEFAULT_SERVER_SOCKET),
+        )
+
+        # The provider server caches the getRequestStatus response of each unchanged request
+        self.request_status_cache_size = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_REQUEST_STATUS_CACHE_SIZE, DEFAULT_REQUEST_STATUS_CACHE_SIZE
+            )
+        )
+        self.request_status_cache_ttl = int(
+            hf_provider_conf.get(
+                CONFIG_VAR_REQUEST_STATUS_CACHE_TTL, DEFAULT_REQUEST_STATUS_CACHE_TTL
+            )
+        )
 
         # configure logging
         self.hf_provider_log_file = hf_provider_conf.get(
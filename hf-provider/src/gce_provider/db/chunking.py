@@ -0,0 +1,66 @@
+"""
+Helpers for queries that filter on a list of values, with `IN ({in_params})` or
+`VALUES {in_params}`.
+
+SQLite limits the number of host parameters per statement (999 on older builds), and every
+distinct number of placeholders is a distinct statement to prepare. Lists are therefore split
+into chunks, and each chunk is padded with NULLs up to a power of two. NULL never compares equal,
+so the padding never matches a row, and each chunk size maps to one cached prepared statement.
+"""
+
+from typing import Any, Iterator, Sequence
+
+from gce_provider.db.transaction import Statement
+
+MAX_CHUNK_SIZE = 512
+
+
+def bucket_size(count: int, max_chunk_size: int = MAX_CHUNK_SIZE) -> int:
+    """Round a number of values up to the next power of two, capped at the maximum chunk size"""
+    size = 1
+    while size < count:
+        size *= 2
+    return min(size, max_chunk_size)
+
+
+def chunked(
+    values: Sequence[Any], max_chunk_size: int = MAX_CHUNK_SIZE
+) -> Iterator[list[Any]]:
+    """Split the values into chunks, each padded with NULLs to its bucket size"""
+    for i in range(0, len(values), max_chunk_size):
+        chunk = list(values[i : i + max_chunk_size])
+        yield chunk + [None] * (bucket_size(len(chunk), max_chunk_size) - len(chunk))
+
+
+def placeholders(count: int, placeholder: str = "?") -> str:
+    return ",".join(placeholder for _ in range(count))
+
+
+def chunked_queries(
+    query: str,
+    values: Sequence[Any],
+    params: Sequence[Any] = (),
+    placeholder: str = "?",
+    max_chunk_size: int = MAX_CHUNK_SIZE,
+) -> Iterator[tuple[str, list[Any]]]:
+    """
+    Yield a (query, parameters) pair per chunk of values. The query's `{in_params}` is replaced by
+    the chunk's placeholders, and its parameters are the given params followed by the chunk.
+    """
+    for chunk in chunked(values, max_chunk_size):
+        yield query.format(in_params=placeholders(len(chunk), placeholder)), [*params, *chunk]
+
+
+def chunked_statements(
+    query: str,
+    values: Sequence[Any],
+    params: Sequence[Any] = (),
+    max_chunk_size: int = MAX_CHUNK_SIZE,
+) -> list[Statement]:
+    """Build one statement per chunk of values, to execute within a single transaction"""
+    return [
+        Statement(chunk_query, chunk_params)
+        for chunk_query, chunk_params in chunked_queries(
+            query, values, params, max_chunk_size=max_chunk_size
+        )
+    ]
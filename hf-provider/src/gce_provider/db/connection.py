@@ -0,0 +1,139 @@
+"""
+Manages the SQLite connections used by the provider.
+
+The database runs in WAL mode, so that the Pub/Sub monitor can write while HostFactory polls
+the database: readers see the last committed snapshot and never wait for the single writer,
+and the writer never waits for readers. Connections are cached per thread, and query paths
+use read-only connections. The connections of threads that have finished, such as the
+per-request threads of the provider server, are closed when another thread connects.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from gce_provider.config import Config, get_config
+from gce_provider.utils.scheduler import PeriodicTask
+
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+# applied to every connection. In WAL mode, synchronous=NORMAL is safe from corruption and
+# durable across application crashes; only a power loss may roll back the latest commits.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 67108864",  # 64 MiB
+    "PRAGMA cache_size = -16384",  # 16 MiB
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class ConnectionManager:
+    """Hands out per-thread cached connections to a single database"""
+
+    def __init__(self, db_path: str, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # keyed by (thread, read-only). The thread itself is the key, rather than its ident,
+        # which is recycled once the thread has finished.
+        self._connections: dict[tuple[threading.Thread, bool], sqlite3.Connection] = {}
+
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        if readonly:
+            connection = sqlite3.connect(
+                f"{Path(self.db_path).absolute().as_uri()}?mode=ro",
+                uri=True,
+                timeout=self.timeout,
+                check_same_thread=False,
+            )
+        else:
+            connection = sqlite3.connect(
+                self.db_path, timeout=self.timeout, check_same_thread=False
+            )
+            # the journal mode is persistent, so this is a no-op once the database uses WAL
+            connection.execute("PRAGMA journal_mode = WAL")
+
+        connection.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def _get(self, readonly: bool) -> sqlite3.Connection:
+        key = (threading.current_thread(), readonly)
+        with self._lock:
+            connection = self._connections.get(key)
+        if connection is None:
+            connection = self._connect(readonly)
+            with self._lock:
+                self._connections[key] = connection
+                stale = [
+                    self._connections.pop(stale_key)
+                    for stale_key in list(self._connections)
+                    if not stale_key[0].is_alive()
+                ]
+            for stale_connection in stale:
+                stale_connection.close()
+        return connection
+
+    def reader(self) -> sqlite3.Connection:
+        """Return the read-only connection of the calling thread"""
+        return self._get(readonly=True)
+
+    def writer(self) -> sqlite3.Connection:
+        """Return the read-write connection of the calling thread"""
+        return self._get(readonly=False)
+
+    def checkpoint(self, mode: str = "PASSIVE") -> tuple[int, int, int]:
+        """
+        Copy committed transactions from the WAL back into the database file.
+        Returns (busy, WAL frames, checkpointed frames), as reported by SQLite.
+        """
+        row = self.writer().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return tuple(row)
+
+    def close(self) -> None:
+        """Close every cached connection"""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+
+_managers: dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(config: Optional[Config] = None) -> ConnectionManager:
+    """Return the process-wide connection manager for the configured database"""
+    if config is None:
+        config = get_config()
+
+    with _managers_lock:
+        manager = _managers.get(config.db_path)
+        if manager is None:
+            manager = ConnectionManager(config.db_path)
+            _managers[config.db_path] = manager
+        return manager
+
+
+def background_checkpoint(config: Optional[Config] = None) -> PeriodicTask:
+    """
+    Create a task that checkpoints the WAL of the configured database every
+    `db_checkpoint_interval` seconds. SQLite also checkpoints automatically on commit once
+    the WAL grows large; this keeps the WAL short while the monitor is writing steadily.
+    """
+    if config is None:
+        config = get_config()
+    manager = get_connection_manager(config)
+
+    def checkpoint():
+        busy, frames, checkpointed = manager.checkpoint()
+        config.logger.debug(
+            f"WAL checkpoint: busy={busy}, frames={frames}, checkpointed={checkpointed}"
+        )
+
+    return PeriodicTask(
+        "db-checkpoint", config.db_checkpoint_interval, checkpoint, config.logger
+    )
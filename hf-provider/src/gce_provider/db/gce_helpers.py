@@ -1,31 +1,105 @@
 import re
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, Sequence
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Sequence
 
-import google.cloud.compute_v1 as compute
-from tenacity import retry, wait_exponential
+from tenacity import retry, stop_after_delay, wait_exponential
 
 from gce_provider.model.models import InstanceIps, ResourceIdentifier
 from gce_provider.utils import client_factory
 
+if TYPE_CHECKING:
+    import google.cloud.compute_v1 as compute
+
+# instances.list rejects long filter expressions, so name filters are split to stay under this
+MAX_FILTER_LENGTH = 2000
+# the largest page that instances.list returns
+LIST_PAGE_SIZE = 500
+# give up listing a zone after this many seconds, and leave the retry to the caller
+LIST_DEADLINE_SECONDS = 120
+
 
 def fetch_managed_instance_list(
     project: str, zone: str, instance_group: str
-) -> Sequence[compute.Instance]:
+) -> Sequence["compute.Instance"]:
     """List instances in an instance group"""
+    response = fetch_managed_instances(project, zone, instance_group)
+    return [instance.instance for instance in response]  # returns full URI of instances
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=1, max=30),
+    stop=stop_after_delay(LIST_DEADLINE_SECONDS),
+    reraise=True,
+)
+def list_zone_instances(project: str, zone: str, filter: str) -> Sequence["compute.Instance"]:
+    """List the instances in a zone that match a filter, following every page of the results"""
+    import google.cloud.compute_v1 as compute
+
+    client = client_factory.instances_client()
+
+    request = compute.ListInstancesRequest(
+        project=project, zone=zone, filter=filter, max_results=LIST_PAGE_SIZE
+    )
+    return list(client.list(request=request))
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=1, max=30),
+    stop=stop_after_delay(LIST_DEADLINE_SECONDS),
+    reraise=True,
+)
+def fetch_managed_instances(
+    project: str, zone: str, instance_group: str
+) -> Sequence["compute.ManagedInstance"]:
+    """
+    List the managed instances of an instance group, with their current action and status,
+    following every page of the results
+    """
+    import google.cloud.compute_v1 as compute
+
     client = client_factory.instance_group_managers_client()
 
     request = compute.ListManagedInstancesInstanceGroupManagersRequest(
         project=project,
         zone=zone,
         instance_group_manager=instance_group,
+        max_results=LIST_PAGE_SIZE,
     )
-    response = client.list_managed_instances(request=request)
-    return [instance.instance for instance in response]  # returns full URI of instances
+    return list(client.list_managed_instances(request=request))
+
+
+def name_filters(names: Iterable[str], max_length: int = MAX_FILTER_LENGTH) -> Iterator[str]:
+    """Generate instances.list filters that together match exactly the given names"""
+    escaped_names: list[str] = []
+    length = 0
+    for name in names:
+        escaped = re.escape(name)
+        # each name adds its separator
+        if escaped_names and length + len(escaped) + 1 > max_length:
+            yield f'name eq "({"|".join(escaped_names)})"'
+            escaped_names, length = [], 0
+        escaped_names.append(escaped)
+        length += len(escaped) + 1
+    if escaped_names:
+        yield f'name eq "({"|".join(escaped_names)})"'
+
+
+def fetch_instances_bulk(
+    project: str, zone: str, names: Iterable[str]
+) -> Sequence["compute.Instance"]:
+    """
+    Get the instances with the given names in a zone, listing them with one instances.list per
+    chunk of names rather than one instances.get per instance. Instances that do not exist are
+    left out.
+    """
+    instances = []
+    for name_filter in name_filters(sorted(set(names))):
+        instances.extend(list_zone_instances(project, zone, name_filter))
+    return instances
 
 
 @retry(wait=wait_exponential(multiplier=1, min=4, max=60))
-def fetch_instance(ident: ResourceIdentifier) -> Optional[compute.Instance]:
+def fetch_instance(ident: ResourceIdentifier) -> Optional["compute.Instance"]:
     """Given instance identifiers, get the info about the instance"""
     client = client_factory.instances_client()
     return client.get(
@@ -57,26 +131,26 @@ def to_resource_url(project: str, zone: str, name: str, resource_type: str = "in
     return f"/compute/v1/projects/{project}/zones/{zone}/{resource_type}/{name}"
 
 
-def fetch_instance_by_url(instance_url: str) -> Optional[compute.Instance]:
+def fetch_instance_by_url(instance_url: str) -> Optional["compute.Instance"]:
     """Given an instance URL, get the info about the instance"""
     return fetch_instance(parse_resource_url(instance_url))
 
 
 def fetch_instances(
     instances: Sequence[ResourceIdentifier],
-) -> Sequence[compute.Instance]:
+) -> Sequence["compute.Instance"]:
     """Simultaneously get multiple instances"""
     with ThreadPoolExecutor(max_workers=10) as executor:
         return list(executor.map(fetch_instance, instances))
 
 
-def fetch_instances_by_url(instance_urls) -> Sequence[compute.Instance]:
+def fetch_instances_by_url(instance_urls) -> Sequence["compute.Instance"]:
     """Simultaneously get multiple instances"""
     with ThreadPoolExecutor(max_workers=10) as executor:
         return list(executor.map(fetch_instance_by_url, instance_urls))
 
 
-def extract_instance_ips(instance: compute.Instance) -> InstanceIps:
+def extract_instance_ips(instance: "compute.Instance") -> InstanceIps:
     # Get the primary internal and external IP
     network_interface = instance.network_interfaces[0]
     internal_ip = network_interface.network_i_p
@@ -0,0 +1,152 @@
+"""
+Tiered health checks for the provider database.
+
+The fast check runs before every provisioning call and takes constant time, regardless of
+the database size: it stats the file, reads the schema version, and stamps a single row to
+prove that the database is writable. The full check (`PRAGMA quick_check` and an insert/delete
+probe) is O(database size), so the monitor runs it periodically in the background, and its
+result is cached in the database, where every process can read it.
+"""
+
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from gce_provider.config import Config, get_config
+from gce_provider.db.connection import get_connection_manager
+from gce_provider.db.machines import MachineDao
+from gce_provider.db.migrations import LATEST_VERSION
+from gce_provider.db.transaction import Statement, Transaction
+from gce_provider.utils.scheduler import PeriodicTask
+
+# errors from a lock that another connection holds, which say nothing about the database
+BUSY_ERRORS = ("database is locked", "database is busy")
+
+
+class DatabaseHealth:
+    def __init__(self, config: Optional[Config] = None):
+        if config is None:
+            config = get_config()
+        self.config = config
+        self.logger = config.logger
+
+    def _fast_check(self) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Return (ok, details) where the details include:
+            - file (ok or error text)
+            - schema_version (int)
+            - writable (boolean)
+            - integrity (ok, error text, or unknown if never checked)
+            - integrity_checked_at (timestamp of the last full check)
+        """
+        details: Dict[str, Any] = {
+            "file": "unknown",
+            "schema_version": 0,
+            "writable": False,
+            "integrity": "unknown",
+            "integrity_checked_at": None,
+        }
+
+        db_path = self.config.db_path
+        if not os.path.isfile(db_path):
+            details["file"] = "missing"
+            return (False, details)
+        # WAL mode also needs to create the -wal and -shm files next to the database
+        if not os.access(db_path, os.R_OK | os.W_OK) or not os.access(
+            os.path.dirname(os.path.abspath(db_path)), os.W_OK
+        ):
+            details["file"] = "permission denied"
+            return (False, details)
+        details["file"] = "ok"
+
+        try:
+            conn = get_connection_manager(self.config).reader()
+            row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+            details["schema_version"] = row[0] or 0
+            if details["schema_version"] < LATEST_VERSION:
+                return (False, details)
+
+            with Transaction(self.config) as trans:
+                trans.execute(
+                    [
+                        Statement(
+                            "UPDATE db_health SET stamped_at=CURRENT_TIMESTAMP WHERE id=1",
+                            [],
+                        )
+                    ]
+                )
+                details["writable"] = trans.cursor.rowcount == 1
+            if not details["writable"]:
+                return (False, details)
+
+            row = conn.execute(
+                "SELECT integrity, integrity_checked_at FROM db_health WHERE id=1"
+            ).fetchone()
+        except Exception as e:
+            details["file"] = f"Error: {e}"
+            return (False, details)
+
+        details["integrity"] = row[0] or "unknown"
+        details["integrity_checked_at"] = row[1]
+        # an integrity check that has not run yet is not a failure
+        return (details["integrity"] in ("ok", "unknown"), details)
+
+    def check_or_raise(self) -> None:
+        """
+        Constant-time pre-flight check, relying on the cached result of the full check.
+        Raises a RuntimeError with a short message if something looks wrong.
+        """
+        ok, details = self._fast_check()
+        if not ok:
+            err = "DB health check failed: " + "; ".join(
+                f"{i}={j}" for i, j in details.items() if j not in (True, "ok")
+            )
+            self.logger.error(err)
+            raise RuntimeError(err)
+
+    def run_integrity_check(self) -> bool:
+        """
+        Run the full check, and cache its result for the fast check, unless the database was
+        too busy to check. Returns whether it passed.
+        """
+        ok, details = MachineDao(self.config)._quick_check()
+        integrity = (
+            "ok"
+            if ok
+            else "; ".join(f"{i}={j}" for i, j in details.items() if j not in (True, "ok"))
+        )
+        if not ok and any(error in integrity for error in BUSY_ERRORS):
+            # keep the previous result; the check runs again at the next interval
+            self.logger.warning(f"DB integrity check skipped, the database is busy: {integrity}")
+            return False
+        if not ok:
+            self.logger.error(f"DB integrity check failed: {integrity}")
+
+        with Transaction(self.config) as trans:
+            trans.execute(
+                [
+                    Statement(
+                        "UPDATE db_health "
+                        "SET integrity=?, integrity_checked_at=CURRENT_TIMESTAMP "
+                        "WHERE id=1",
+                        [integrity],
+                    )
+                ]
+            )
+        return ok
+
+
+def background_integrity_check(config: Optional[Config] = None) -> PeriodicTask:
+    """
+    Create a task that runs the full integrity check every `db_integrity_check_interval`
+    seconds
+    """
+    if config is None:
+        config = get_config()
+    health = DatabaseHealth(config)
+
+    return PeriodicTask(
+        "db-integrity-check",
+        config.db_integrity_check_interval,
+        health.run_integrity_check,
+        config.logger,
+    )
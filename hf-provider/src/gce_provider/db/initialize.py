@@ -3,54 +3,33 @@ from typing import Optional
 
 from common.utils.path_utils import ensure_path_exists
 from gce_provider.config import Config, get_config
+from gce_provider.db.migrations import complete_pending_vacuum, migrate
 
 
-def main(config: Optional[Config] = None):
+def main(config: Optional[Config] = None, vacuum: bool = False):
+    """
+    Create or migrate the database. With `vacuum`, also run the one-time VACUUM that a
+    migration left pending, which the implicit initialization before a command never does.
+    """
     if config is None:
         config = get_config()
     logger = config.logger
 
-    # @formatter:off
-    schema = """
-    CREATE TABLE IF NOT EXISTS machines (
-      machine_name VARCHAR(32) NOT NULL,
-      request_id VARCHAR(32) NOT NULL,
-      gcp_zone VARCHAR(32) NOT NULL,
-      instance_group_manager VARCHAR(32) NOT NULL,
-      machine_state INT DEFAULT 0,
-      operation_id VARCHAR(32) NOT NULL,
-      return_request_id VARCHAR(32),
-      delete_operation_request_id VARCHAR(32),
-      delete_operation_id VARCHAR(32),
-      delete_grace_period INT,
-      internal_ip VARCHAR(15),
-      external_ip VARCHAR(15),
-      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP);
-
-      CREATE UNIQUE INDEX IF NOT EXISTS idx_machine_name ON machines(machine_name);
-      CREATE UNIQUE INDEX IF NOT EXISTS
-           idx_request_id_machine_name
-        ON machines(request_id, machine_name);
-      CREATE UNIQUE INDEX IF NOT EXISTS
-           idx_insert_id_machine_name
-        ON machines(operation_id, machine_name);
-
-    CREATE TRIGGER IF NOT EXISTS set_updated_at
-        AFTER UPDATE ON machines
-        FOR EACH ROW
-    BEGIN
-        UPDATE machines SET updated_at = CURRENT_TIMESTAMP WHERE machine_name = OLD.machine_name;
-    END;
-
-    """
-
     logger.info(f"Initializing the database at {config.db_path}")
     ensure_path_exists(config.hf_db_dir)
 
-    with sqlite3.connect(config.db_path) as conn:
-        conn.executescript(schema)
-    logger.info("Database initialization complete.")
+    conn = sqlite3.connect(config.db_path)
+    try:
+        # migrated first, so that a new database gets its auto-vacuum mode before WAL mode
+        # writes its header
+        version = migrate(conn, logger)
+        # WAL lets readers and the writer proceed concurrently. The mode is persistent.
+        conn.execute("PRAGMA journal_mode = WAL")
+        if vacuum:
+            complete_pending_vacuum(conn, logger)
+    finally:
+        conn.close()
+    logger.info(f"Database initialization complete, at schema version {version}.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+"""
+Resolves the IPs of new machines in bulk.
+
+Rather than each createInstances operation polling `instances.get` for its own machines, the
+monitor periodically lists the machines waiting for an IP, a zone at a time, and stores the IPs
+of all of them in one transaction. The number of API calls grows with the number of zones, not
+with the number of machines.
+"""
+
+from typing import Optional
+
+from gce_provider.config import Config, get_config
+from gce_provider.db.gce_helpers import fetch_instances_bulk
+from gce_provider.db.machines import MachineDao
+from gce_provider.utils.scheduler import PeriodicTask
+
+
+def resolve_missing_ips(config: Optional[Config] = None) -> int:
+    """Look up the IPs of the machines waiting for one. Returns the number of machines updated."""
+    if config is None:
+        config = get_config()
+    logger = config.logger
+
+    dao = MachineDao(config)
+    machines_by_zone = dao.get_machines_missing_ip()
+    if not machines_by_zone:
+        return 0
+
+    instances = []
+    for zone, machine_names in machines_by_zone.items():
+        try:
+            zone_instances = fetch_instances_bulk(config.gcp_project_id, zone, machine_names)
+        except Exception as e:
+            # the next tick will try again
+            logger.warning(f"Could not list the instances in zone {zone}: {e}")
+            continue
+        instances.extend(
+            instance
+            for instance in zone_instances
+            if instance.network_interfaces
+            and instance.network_interfaces[0].network_i_p
+        )
+
+    updated = dao.store_instance_ips(instances)
+    logger.info(
+        f"Resolved the IPs of {updated} of {sum(map(len, machines_by_zone.values()))} "
+        f"machines in {len(machines_by_zone)} zone(s)"
+    )
+    return updated
+
+
+def background_ip_resolver(config: Optional[Config] = None) -> PeriodicTask:
+    """Create a task that resolves the IPs of new machines every `ip_resolve_interval` seconds"""
+    if config is None:
+        config = get_config()
+
+    return PeriodicTask(
+        "ip-resolver",
+        config.ip_resolve_interval,
+        lambda: resolve_missing_ips(config),
+        config.logger,
+    )
@@ -1,27 +1,311 @@
+import json
+import logging
 import sqlite3
-import asyncio
+from contextlib import contextmanager
 from types import SimpleNamespace
-from typing import Any, Callable, Optional, Dict, Tuple
-
-import google.cloud.compute_v1 as compute
-from tenacity import retry, stop_after_attempt, wait_exponential, wait_random
-from debouncer import debounce, DebounceOptions
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Optional, Dict, Sequence, Tuple
 
 from common.model.models import HFReturnRequestsResponse
-from common.utils.list_utils import flatten
+from gce_provider.commands.helpers.request_machine_status_helper import (
+    RequestMachineStatusEvaluator,
+)
+from gce_provider.commands.helpers.request_return_machine_status_helper import (
+    RequestReturnMachineStatusEvaluator,
+)
 from gce_provider.config import Config, get_config
+from gce_provider.db.chunking import chunked_queries, chunked_statements
+from gce_provider.db.connection import get_connection_manager
 from gce_provider.db.gce_helpers import (
     extract_instance_ips,
-    fetch_instances,
+    fetch_instances_bulk,
     parse_resource_url,
 )
 from gce_provider.db.transaction import Statement, Transaction
-from gce_provider.model.models import HfMachine, HfMachineStatus, ResourceIdentifier
-from gce_provider.utils.constants import MachineState
+from gce_provider.db.records import MACHINE_COLUMNS, MachineRecord
+from gce_provider.model.models import RequestStateCounts, RequestStatusSummary
+from gce_provider.utils.constants import MachineState, OperationType
 from gce_provider.utils.instances import set_instance_labels
 
+if TYPE_CHECKING:
+    import google.cloud.compute_v1 as compute
+
+# the machine that the quick check inserts and deletes, always within a rolled back savepoint
+QUICK_CHECK_PROBE_NAME = "__quick_check_probe__"
+
+# Read queries. Each is expected to use an index; see db/migrations.py and the
+# query plan tests. Request IDs, operation IDs and instance groups are stored once, in their
+# own tables, and machines refer to them by integer keys; the machine_records and
+# archived_machine_records views resolve the keys.
+# @formatter:off
+SELECT_MACHINES_MISSING_IP = """
+    SELECT machines.machine_name, instance_groups.gcp_zone
+    FROM operations
+    JOIN machines ON machines.operation_key = operations.id
+    JOIN instance_groups ON instance_groups.id = machines.instance_group_key
+    WHERE operations.gcp_operation_id=?
+      AND machines.internal_ip IS NULL
+      AND machines.machine_state BETWEEN ? AND ?
+    """
+
+# the IS NULL test is a literal, so that the partial index on machines missing an IP applies
+SELECT_ALL_MACHINES_MISSING_IP = """
+    SELECT machines.machine_name, instance_groups.gcp_zone
+    FROM machines
+    JOIN instance_groups ON instance_groups.id = machines.instance_group_key
+    WHERE machines.internal_ip IS NULL
+      AND machines.machine_state BETWEEN ? AND ?
+    """
+
+SELECT_LIVE_MACHINES = """
+    SELECT instance_groups.gcp_zone, instance_groups.instance_group_manager,
+           machines.machine_name, machines.machine_state, machines.internal_ip
+    FROM machines
+    JOIN instance_groups ON instance_groups.id = machines.instance_group_key
+    WHERE machines.machine_state < ?
+    """
+
+UPDATE_MACHINE_IPS = (
+    "UPDATE machines "
+    "SET internal_ip=:internal_ip, external_ip=:external_ip, "
+    "updated_at=CURRENT_TIMESTAMP "
+    "WHERE machine_name=:machine_name"
+)
+
+# selects the columns that make up a MachineRecord
+_MACHINE_COLUMN_LIST = ", ".join(f"machine_records.{column}" for column in MACHINE_COLUMNS)
+_ARCHIVE_COLUMN_LIST = ", ".join(
+    f"archived_machine_records.{column}" for column in MACHINE_COLUMNS
+)
 
-def _generate_instance_creation_params(instance: compute.Instance):
+# formatted with one "(?)" per request ID (see db/chunking.py). Each branch of the UNION ALL
+# searches its own index, which a single "request_key=? OR return_request_key=?" query cannot do;
+# CROSS JOIN keeps the requested keys as the outer loop. Returned machines may have been moved to
+# the archive, so requests are also looked up there, within the same statement and snapshot.
+SELECT_MACHINES_FOR_REQUESTS = f"""
+    WITH requested(hf_request_id, request_key) AS (
+        SELECT requests.hf_request_id, requests.id
+        FROM requests
+        WHERE requests.hf_request_id IN (VALUES {{in_params}}))
+    SELECT requested.hf_request_id, {_MACHINE_COLUMN_LIST}
+    FROM requested
+    CROSS JOIN machine_records ON machine_records.request_key = requested.request_key
+    UNION ALL
+    SELECT requested.hf_request_id, {_MACHINE_COLUMN_LIST}
+    FROM requested
+    CROSS JOIN machine_records ON machine_records.return_request_key = requested.request_key
+    UNION ALL
+    SELECT requested.hf_request_id, {_ARCHIVE_COLUMN_LIST}
+    FROM requested
+    CROSS JOIN archived_machine_records
+        ON archived_machine_records.request_key = requested.request_key
+    UNION ALL
+    SELECT requested.hf_request_id, {_ARCHIVE_COLUMN_LIST}
+    FROM requested
+    CROSS JOIN archived_machine_records
+        ON archived_machine_records.return_request_key = requested.request_key
+    """
+
+# formatted with one "(?)" per request ID (see db/chunking.py). Counts the machines of each
+# request, and those missing an internal IP, per machine state, in both the machines table and
+# the archive.
+SELECT_REQUEST_STATE_COUNTS = """
+    WITH requested(hf_request_id, request_key) AS (
+        SELECT requests.hf_request_id, requests.id
+        FROM requests
+        WHERE requests.hf_request_id IN (VALUES {in_params}))
+    SELECT requested.hf_request_id, 0, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM requested JOIN machines ON machines.request_key = requested.request_key
+    GROUP BY requested.hf_request_id, machine_state
+    UNION ALL
+    SELECT requested.hf_request_id, 1, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM requested JOIN machines ON machines.return_request_key = requested.request_key
+    GROUP BY requested.hf_request_id, machine_state
+    UNION ALL
+    SELECT requested.hf_request_id, 0, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM requested JOIN machines_archive ON machines_archive.request_key = requested.request_key
+    GROUP BY requested.hf_request_id, machine_state
+    UNION ALL
+    SELECT requested.hf_request_id, 1, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM requested
+    JOIN machines_archive ON machines_archive.return_request_key = requested.request_key
+    GROUP BY requested.hf_request_id, machine_state
+    """
+
+# formatted with one "(?)" per request key (see db/chunking.py). The same counts as above, for
+# refreshing the request status summaries within a write transaction.
+SELECT_REQUEST_KEY_STATE_COUNTS = """
+    WITH refreshed(request_key) AS (VALUES {in_params})
+    SELECT refreshed.request_key, 0, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM refreshed JOIN machines ON machines.request_key = refreshed.request_key
+    GROUP BY refreshed.request_key, machine_state
+    UNION ALL
+    SELECT refreshed.request_key, 1, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM refreshed JOIN machines ON machines.return_request_key = refreshed.request_key
+    GROUP BY refreshed.request_key, machine_state
+    UNION ALL
+    SELECT refreshed.request_key, 0, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM refreshed JOIN machines_archive ON machines_archive.request_key = refreshed.request_key
+    GROUP BY refreshed.request_key, machine_state
+    UNION ALL
+    SELECT refreshed.request_key, 1, machine_state, COUNT(*), SUM(internal_ip IS NULL)
+    FROM refreshed
+    JOIN machines_archive ON machines_archive.return_request_key = refreshed.request_key
+    GROUP BY refreshed.request_key, machine_state
+    """
+
+# formatted with one placeholder per request ID (see db/chunking.py)
+SELECT_REQUEST_STATUS = """
+    SELECT requests.hf_request_id, request_status.is_return_request,
+           request_status.machine_counts, request_status.missing_ip_counts,
+           request_status.ip_ready_count, request_status.status, request_status.updated_at
+    FROM requests
+    JOIN request_status ON request_status.request_key = requests.id
+    WHERE requests.hf_request_id IN ({in_params})
+    """
+
+# formatted with one placeholder per request ID (see db/chunking.py). Every change to a request's
+# machines refreshes its summary, so the summary's version and timestamp identify the change.
+SELECT_REQUEST_FINGERPRINTS = """
+    SELECT requests.hf_request_id, request_status.version, request_status.updated_at
+    FROM requests
+    JOIN request_status ON request_status.request_key = requests.id
+    WHERE requests.hf_request_id IN ({in_params})
+    """
+
+# formatted with one placeholder per machine name (see db/chunking.py).
+# The requests whose status summaries change when the machines change.
+SELECT_REQUEST_KEYS_BY_NAME = """
+    SELECT request_key, return_request_key
+    FROM machines
+    WHERE machine_name IN ({in_params})
+    """
+
+SELECT_ARCHIVED_REQUEST_KEYS_BY_NAME = """
+    SELECT request_key, return_request_key
+    FROM machines_archive
+    WHERE machine_name IN ({in_params})
+    """
+
+SELECT_REQUEST_KEYS_BY_OPERATION = """
+    SELECT DISTINCT request_key, return_request_key
+    FROM machines
+    WHERE operation_key = (SELECT id FROM operations WHERE gcp_operation_id = ?)
+    """
+
+# formatted with one placeholder per machine name (see db/chunking.py)
+SELECT_MACHINES_BY_NAME = f"""
+    SELECT {_MACHINE_COLUMN_LIST}
+    FROM machine_records
+    WHERE machine_name IN ({{in_params}})
+    """
+
+SELECT_UNRETURNED_DELETED_MACHINES = """
+    SELECT machine_name, delete_grace_period
+    FROM machines
+    WHERE return_request_key IS NULL
+    AND machine_state IN (?, ?)
+    """
+
+# the state is a literal, so that the partial index on deleted machines applies,
+# and updated_at is compared as-is, so that the index can seek to the cutoff.
+# Selects at most one batch of machines.
+SELECT_EXPIRED_MACHINES = f"""
+    SELECT machine_name
+    FROM machines
+    WHERE machine_state = {MachineState.DELETED.value}
+    AND updated_at <= ?
+    LIMIT ?
+    """
+
+SELECT_EXPIRED_ARCHIVED_MACHINES = """
+    SELECT machine_name
+    FROM machines_archive
+    WHERE updated_at <= ?
+    LIMIT ?
+    """
+
+# requests and operations that no machine refers to anymore, once machines were trimmed
+DELETE_ORPHANED_KEYS = [
+    """
+    DELETE FROM requests WHERE id NOT IN (
+        SELECT request_key FROM machines
+        UNION SELECT return_request_key FROM machines WHERE return_request_key IS NOT NULL
+        UNION SELECT request_key FROM machines_archive
+        UNION SELECT return_request_key FROM machines_archive
+          WHERE return_request_key IS NOT NULL)
+    """,
+    """
+    DELETE FROM operations WHERE id NOT IN (
+        SELECT operation_key FROM machines
+        UNION SELECT delete_operation_key FROM machines WHERE delete_operation_key IS NOT NULL
+        UNION SELECT operation_key FROM machines_archive
+        UNION SELECT delete_operation_key FROM machines_archive
+          WHERE delete_operation_key IS NOT NULL)
+    """,
+]
+
+# deleted machines that HostFactory returned, and that are no longer updated.
+# Selects at most one batch of machines.
+SELECT_ARCHIVABLE_MACHINES = f"""
+    SELECT machine_name
+    FROM machines
+    WHERE machine_state = {MachineState.DELETED.value}
+    AND return_request_key IS NOT NULL
+    AND updated_at <= ?
+    LIMIT ?
+    """
+
+# formatted with one placeholder per machine name (see db/chunking.py).
+# A machine name may be reused after its machine was archived, hence the REPLACE.
+ARCHIVE_MACHINES = """
+    INSERT OR REPLACE INTO machines_archive
+    (machine_name, request_key, instance_group_key, machine_state, operation_key,
+     return_request_key, delete_operation_request_id, delete_operation_key,
+     delete_grace_period, internal_ip, external_ip, created_at, updated_at)
+    SELECT machine_name, request_key, instance_group_key, machine_state, operation_key,
+           return_request_key, delete_operation_request_id, delete_operation_key,
+           delete_grace_period, internal_ip, external_ip, created_at, updated_at
+    FROM machines
+    WHERE machine_name IN ({in_params})
+    """
+
+# Write statements. Keys are created on first use, then looked up by the statements that
+# refer to them, through the unique indexes on the identifiers.
+INSERT_REQUEST = "INSERT OR IGNORE INTO requests (hf_request_id) VALUES (?)"
+INSERT_OPERATION = "INSERT OR IGNORE INTO operations (gcp_operation_id) VALUES (?)"
+INSERT_INSTANCE_GROUP = (
+    "INSERT OR IGNORE INTO instance_groups (gcp_zone, instance_group_manager) VALUES (?, ?)"
+)
+
+UPSERT_REQUEST_STATUS = """
+    INSERT INTO request_status
+    (request_key, is_return_request, machine_counts, missing_ip_counts, ip_ready_count, status,
+     updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (request_key) DO UPDATE SET
+        is_return_request=excluded.is_return_request,
+        machine_counts=excluded.machine_counts,
+        missing_ip_counts=excluded.missing_ip_counts,
+        ip_ready_count=excluded.ip_ready_count,
+        status=excluded.status,
+        updated_at=excluded.updated_at,
+        version=request_status.version + 1
+    """
+
+INSERT_MACHINE = """
+    INSERT INTO machines
+    (machine_name, request_key, operation_key, instance_group_key)
+    VALUES
+    (:machine_name,
+     (SELECT id FROM requests WHERE hf_request_id = :request_id),
+     (SELECT id FROM operations WHERE gcp_operation_id = :operation_id),
+     (SELECT id FROM instance_groups
+      WHERE gcp_zone = :gcp_zone AND instance_group_manager = :instance_group_manager))
+    """
+# @formatter:on
+
+
+def _generate_instance_creation_params(instance: "compute.Instance"):
     instance_ips = extract_instance_ips(instance)
     return {
         "machine_name": instance.name,
@@ -36,11 +320,132 @@ class MachineDao:
             config = get_config()
         self.config = config
         self.logger = config.logger
+        # the requests whose status summaries are refreshed when the current batch ends
+        self._deferred_request_keys: Optional[set[int]] = None
+
+    def _reader(self) -> sqlite3.Connection:
+        """Return this thread's read-only connection, which never waits for the writer"""
+        return get_connection_manager(self.config).reader()
+
+    def _read_chunked(
+        self, query: str, values: list[Any], placeholder: str = "?"
+    ) -> list[tuple]:
+        """Run a query with an `{in_params}` list once per chunk of values, returning all rows"""
+        conn = self._reader()
+        rows: list[tuple] = []
+        for chunk_query, chunk_params in chunked_queries(
+            query, values, placeholder=placeholder
+        ):
+            rows.extend(conn.execute(chunk_query, chunk_params).fetchall())
+        return rows
+
+    @contextmanager
+    def snapshot(self) -> Iterator[None]:
+        """Run the reads within the block against one consistent snapshot of the database"""
+        conn = self._reader()
+        conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            conn.rollback()
+
+    @contextmanager
+    def batch(self) -> Iterator[Transaction]:
+        """
+        Apply the updates within the block in one transaction. The status summaries of the
+        requests that they change are refreshed once, when the batch ends, rather than once
+        per update.
+        """
+        with Transaction(self.config) as trans:
+            self._deferred_request_keys = set()
+            try:
+                yield trans
+                request_keys = self._deferred_request_keys
+            finally:
+                self._deferred_request_keys = None
+            self._refresh_request_status(trans, request_keys)
+
+    def _request_keys(
+        self, trans: Transaction, query: str, values: list[Any]
+    ) -> set[int]:
+        """Run a query for (request_key, return_request_key) rows, returning the distinct keys"""
+        keys: set[int] = set()
+        for chunk_query, chunk_params in chunked_queries(query, values):
+            trans.execute([Statement(chunk_query, chunk_params)])
+            for request_key, return_request_key in trans.cursor.fetchall():
+                keys.add(request_key)
+                if return_request_key is not None:
+                    keys.add(return_request_key)
+        return keys
+
+    def _refresh_request_status(self, trans: Transaction, request_keys: Iterable[int]) -> None:
+        """
+        Recount the machines of the requests, and store their status summaries, within the
+        transaction that changed the machines. Requests without machines lose their summary.
+        """
+        if self._deferred_request_keys is not None:
+            self._deferred_request_keys.update(request_keys)
+            return
+
+        request_keys = sorted(request_keys)
+        if not request_keys:
+            return
+
+        counts = {
+            request_key: RequestStateCounts(request_id=str(request_key))
+            for request_key in request_keys
+        }
+        for chunk_query, chunk_params in chunked_queries(
+            SELECT_REQUEST_KEY_STATE_COUNTS, request_keys, placeholder="(?)"
+        ):
+            trans.execute([Statement(chunk_query, chunk_params)])
+            for row in trans.cursor.fetchall():
+                request_key, is_return_request, machine_state, count, missing_ip_count = row
+                counts[request_key].is_return_request = bool(is_return_request)
+                counts[request_key].add(machine_state, count, missing_ip_count)
+
+        summaries = []
+        for request_key, request_counts in counts.items():
+            if not request_counts.machine_counts:
+                continue
+            status_helper = (
+                RequestReturnMachineStatusEvaluator
+                if request_counts.is_return_request
+                else RequestMachineStatusEvaluator
+            )
+            status = status_helper.evaluate_request_status_from_counts(request_counts)
+            summaries.append(
+                (
+                    request_key,
+                    int(request_counts.is_return_request),
+                    json.dumps(request_counts.machine_counts),
+                    json.dumps(request_counts.missing_ip_counts),
+                    sum(request_counts.machine_counts.values())
+                    - sum(request_counts.missing_ip_counts.values()),
+                    status.value,
+                )
+            )
+
+        empty = [key for key, request_counts in counts.items() if not request_counts.machine_counts]
+        trans.executemany([Statement(UPSERT_REQUEST_STATUS, summaries)])
+        trans.execute(
+            chunked_statements(
+                "DELETE FROM request_status WHERE request_key IN ({in_params})", empty
+            )
+        )
+
+    def _refresh_request_status_of_machines(
+        self, trans: Transaction, machine_names: list[str]
+    ) -> None:
+        """Refresh the status summaries of the requests that the machines belong to"""
+        self._refresh_request_status(
+            trans, self._request_keys(trans, SELECT_REQUEST_KEYS_BY_NAME, machine_names)
+        )
 
     def store_request_machines(
         self,
         operation_id: str,
-        request: compute.InstanceGroupManagersCreateInstancesRequest,
+        request: "compute.InstanceGroupManagersCreateInstancesRequest",
     ) -> None:
         """Store an HF requestMachines request"""
         params = list(
@@ -57,30 +462,26 @@ class MachineDao:
         )
 
         with Transaction(self.config) as trans:
-            trans.executemany(
+            trans.execute(
                 [
+                    Statement(INSERT_REQUEST, [request.request_id]),
+                    Statement(INSERT_OPERATION, [operation_id]),
                     Statement(
-                        # @formatter:off
-                        """
-                        INSERT INTO machines
-                        (machine_name, request_id, operation_id, instance_group_manager, gcp_zone)
-                        VALUES
-                        (:machine_name,
-                         :request_id,
-                         :operation_id,
-                         :instance_group_manager,
-                         :gcp_zone)
-                        """,
-                        params,
-                    )
-                ],
+                        INSERT_INSTANCE_GROUP,
+                        [request.zone, request.instance_group_manager],
+                    ),
+                ]
+            )
+            trans.executemany([Statement(INSERT_MACHINE, params)])
+            self._refresh_request_status_of_machines(
+                trans, [param["machine_name"] for param in params]
             )
 
     def store_delete_machines(
         self,
         request_id: str,
         operation_id: str,
-        request: compute.InstanceGroupManagersDeleteInstancesRequest,
+        request: "compute.InstanceGroupManagersDeleteInstancesRequest",
     ) -> None:
         """Store an HF requestReturnMachines request"""
         machines = [
@@ -101,11 +502,23 @@ class MachineDao:
 
         query = """
                 UPDATE machines
-                SET return_request_id=:return_request_id,
-                    delete_operation_id=:delete_operation_id,
-                    delete_operation_request_id=:delete_operation_request_id
+                SET return_request_key=(
+                        SELECT id FROM requests WHERE hf_request_id=:return_request_id),
+                    delete_operation_key=(
+                        SELECT id FROM operations WHERE gcp_operation_id=:delete_operation_id),
+                    delete_operation_request_id=:delete_operation_request_id,
+                    updated_at=CURRENT_TIMESTAMP
                 WHERE machine_name=:machine_name"""
+        machine_names = [machine.name for machine in machines]
         with Transaction(self.config) as trans:
+            # a machine may move from an earlier return request to this one
+            request_keys = self._request_keys(trans, SELECT_REQUEST_KEYS_BY_NAME, machine_names)
+            trans.execute(
+                [
+                    Statement(INSERT_REQUEST, [request_id]),
+                    Statement(INSERT_OPERATION, [operation_id]),
+                ]
+            )
             trans.executemany(
                 [
                     Statement(
@@ -114,83 +527,149 @@ class MachineDao:
                     )
                 ],
             )
+            request_keys |= self._request_keys(trans, SELECT_REQUEST_KEYS_BY_NAME, machine_names)
+            self._refresh_request_status(trans, request_keys)
 
     class RetryRequired(RuntimeError):
         """Indicates that a retry is requred"""
 
         pass
 
-    @retry(
-        wait=wait_exponential(multiplier=1, min=1, max=60),
-        stop=stop_after_attempt(1000),
-    )
     def _update_instance_ips(self, message: SimpleNamespace) -> None:
+        """
+        Store the IPs of the machines of a createInstances operation. Raises RetryRequired while
+        some do not have one yet; the event monitor then schedules another attempt.
+        """
         operation_id = message.operation.id
         self.logger.info(f"Updating instance IPs for operation {operation_id}")
 
-        query = """
-            SELECT machine_name, gcp_zone
-            FROM machines
-            WHERE operation_id=?
-              AND internal_ip IS NULL
-              AND machine_state >= ?
-            """
-
-        with sqlite3.connect(self.config.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                query,
-                (operation_id, MachineState.CREATED.value),
-            )
-            rows = cur.fetchall()
+        rows = self._reader().execute(
+            SELECT_MACHINES_MISSING_IP,
+            # machines that were deleted meanwhile will never get an IP
+            (operation_id, MachineState.CREATED.value, MachineState.INSERTED.value),
+        ).fetchall()
+        self.logger.debug(f"We are missing IP address for {len(rows)} machines.")
 
-            machines_needing_ip = [
-                ResourceIdentifier(
-                    project=self.config.gcp_project_id, zone=zone, name=machine_name
-                )
-                for machine_name, zone in rows
-            ]
+        if self.config.ip_resolve_interval > 0:
+            self._await_ip_resolver(rows)
+        else:
+            self._look_up_instance_ips(rows)
 
-        self.logger.debug(
-            f"We are missing IP address for {len(machines_needing_ip)} machines."
-        )
+        self.logger.info(f"All machines of operation {operation_id} have an IP address")
 
-        # get the IP addresses for each machine
-        instances = fetch_instances(machines_needing_ip)
-        params = [
-            _generate_instance_creation_params(instance) for instance in instances
-        ]
+    def _await_ip_resolver(self, rows: Sequence[tuple[str, str]]) -> None:
+        """
+        Leave the lookup of the machines' IPs to the monitor's IP resolver, which lists all
+        machines per zone in bulk. Raises RetryRequired while some do not have one yet.
+        """
+        if rows:
+            raise MachineDao.RetryRequired(f"{len(rows)} machines are waiting for the IP resolver")
 
-        query = (
-            "UPDATE machines "
-            "SET internal_ip=:internal_ip, external_ip=:external_ip "
-            "WHERE machine_name=:machine_name"
-        )
-        with Transaction(self.config) as trans:
-            trans.executemany(
-                [
-                    Statement(
-                        query,
-                        params,
-                    )
-                ],
-            )
+    def _look_up_instance_ips(self, rows: Sequence[tuple[str, str]]) -> None:
+        """
+        Look up and store the IPs of an operation's machines, listing each zone's at once.
+        Raises RetryRequired while some do not have one yet.
+        """
+        machines_by_zone: dict[str, list[str]] = {}
+        for machine_name, zone in rows:
+            machines_by_zone.setdefault(zone, []).append(machine_name)
+        instances = [
+            instance
+            for zone, machine_names in machines_by_zone.items()
+            for instance in fetch_instances_bulk(self.config.gcp_project_id, zone, machine_names)
+        ]
+        self.store_instance_ips(instances)
 
         # these exceptions should trigger a retry
-        if len(instances) < len(machines_needing_ip):
-            msg = f"Only {len(instances)} machines found, of {len(machines_needing_ip)} needed."
+        if len(instances) < len(rows):
+            msg = f"Only {len(instances)} machines found, of {len(rows)} needed."
             self.logger.debug(msg)
             raise MachineDao.RetryRequired(msg)
 
-        for param in params:
-            if not param["internal_ip"]:
-                msg = "At least one machine does not yet have its IP assigned"
-                self.logger.debug(msg)
-                raise MachineDao.RetryRequired(msg)
+        if any(not extract_instance_ips(instance).internal_ip for instance in instances):
+            msg = "At least one machine does not yet have its IP assigned"
+            self.logger.debug(msg)
+            raise MachineDao.RetryRequired(msg)
 
-        self.logger.info(
-            f"Successfully updated IP address for operation {operation_id}"
-        )
+    def store_instance_ips(self, instances: Sequence["compute.Instance"]) -> int:
+        """Store the IPs of the instances in one transaction. Returns the number of machines."""
+        params = [_generate_instance_creation_params(instance) for instance in instances]
+        if not params:
+            return 0
+
+        with Transaction(self.config) as trans:
+            trans.executemany([Statement(UPDATE_MACHINE_IPS, params)])
+            self._refresh_request_status_of_machines(
+                trans, [param["machine_name"] for param in params]
+            )
+        return len(params)
+
+    def get_live_machines(self) -> dict[tuple[str, str], list[tuple[str, int, Optional[str]]]]:
+        """
+        Return the name, state and internal IP of the machines that are not deleted, keyed by
+        the zone and name of their instance group manager
+        """
+        rows = self._reader().execute(SELECT_LIVE_MACHINES, (MachineState.DELETED.value,))
+        machines_by_group: dict[tuple[str, str], list[tuple[str, int, Optional[str]]]] = {}
+        for zone, instance_group_manager, machine_name, machine_state, internal_ip in rows:
+            machines_by_group.setdefault((zone, instance_group_manager), []).append(
+                (machine_name, machine_state, internal_ip)
+            )
+        return machines_by_group
+
+    def apply_reconciled_states(
+        self,
+        machine_states: dict[str, MachineState],
+        instances: Sequence["compute.Instance"] = (),
+    ) -> None:
+        """
+        Move machines forward to the states observed in their instance groups, and store the
+        IPs of instances, all in one transaction. A machine never moves back to an earlier
+        state, so that a late observation cannot undo an event.
+        """
+        names_by_state: dict[MachineState, list[str]] = {}
+        for machine_name, state in machine_states.items():
+            names_by_state.setdefault(state, []).append(machine_name)
+        params = [_generate_instance_creation_params(instance) for instance in instances]
+        if not names_by_state and not params:
+            return
+
+        with Transaction(self.config) as trans:
+            for state, machine_names in names_by_state.items():
+                # as when the deletion of an instance is logged
+                grace_period = (
+                    ", delete_grace_period=0" if state == MachineState.DELETED else ""
+                )
+                trans.execute(
+                    chunked_statements(
+                        f"""
+                        UPDATE machines
+                        SET machine_state={state.value}{grace_period},
+                            updated_at=CURRENT_TIMESTAMP
+                        WHERE machine_name IN ({{in_params}})
+                        AND machine_state<{state.value}""",
+                        machine_names,
+                    )
+                )
+            trans.executemany([Statement(UPDATE_MACHINE_IPS, params)])
+            self._refresh_request_status_of_machines(
+                trans,
+                list(machine_states) + [param["machine_name"] for param in params],
+            )
+
+    def get_machines_missing_ip(self) -> dict[str, list[str]]:
+        """
+        Return the names of the machines that were created but do not have an internal IP yet,
+        keyed by zone
+        """
+        rows = self._reader().execute(
+            SELECT_ALL_MACHINES_MISSING_IP,
+            (MachineState.CREATED.value, MachineState.INSERTED.value),
+        ).fetchall()
+        machines_by_zone: dict[str, list[str]] = {}
+        for machine_name, zone in rows:
+            machines_by_zone.setdefault(zone, []).append(machine_name)
+        return machines_by_zone
 
     def _handle_instances_created(
         self, message: SimpleNamespace
@@ -203,18 +682,17 @@ class MachineDao:
 
         request = message.protoPayload.request
         machine_names = [x.name for x in request.instances]
-        machine_name_param = ",".join("?" for _ in machine_names)
         with Transaction(self.config) as trans:
             trans.execute(
-                [
-                    Statement(
-                        "UPDATE MACHINES "
-                        f"SET machine_state={MachineState.CREATED.value} "
-                        f"WHERE machine_name IN ({machine_name_param})",
-                        machine_names,
-                    )
-                ],
+                chunked_statements(
+                    "UPDATE MACHINES "
+                    f"SET machine_state={MachineState.CREATED.value}, "
+                    "updated_at=CURRENT_TIMESTAMP "
+                    "WHERE machine_name IN ({in_params})",
+                    machine_names,
+                ),
             )
+            self._refresh_request_status_of_machines(trans, machine_names)
 
         self.logger.info(
             f"Finished handling instance creation for operation {message.operation.id}"
@@ -259,20 +737,19 @@ class MachineDao:
         resource_urls = [message.protoPayload.resourceName]
         resources = [parse_resource_url(x) for x in resource_urls]
         machine_names = [x.name for x in resources]
-        machine_name_param = ",".join("?" for _ in machine_names)
         with Transaction(self.config) as trans:
             trans.execute(
-                [
-                    Statement(
-                        f"""
-                        UPDATE machines
-                        SET machine_state={MachineState.INSERTED.value}
-                        WHERE machine_name IN ({machine_name_param})
-                        AND machine_state<{MachineState.INSERTED.value}""",
-                        machine_names,
-                    )
-                ],
+                chunked_statements(
+                    f"""
+                    UPDATE machines
+                    SET machine_state={MachineState.INSERTED.value},
+                        updated_at=CURRENT_TIMESTAMP
+                    WHERE machine_name IN ({{in_params}})
+                    AND machine_state<{MachineState.INSERTED.value}""",
+                    machine_names,
+                ),
             )
+            self._refresh_request_status_of_machines(trans, machine_names)
 
         self.logger.info(
             f"Finished handling instance insertion for operation {message.operation.id}"
@@ -288,18 +765,17 @@ class MachineDao:
         resources = [parse_resource_url(x) for x in request.instances]
         machine_names = [x.name for x in resources]
 
-        machine_name_param = ",".join("?" for _ in machine_names)
         with Transaction(self.config) as trans:
             trans.execute(
-                [
-                    Statement(
-                        "UPDATE MACHINES SET "
-                        f"machine_state={MachineState.DELETE_REQUESTED.value} "
-                        f"WHERE machine_name IN ({machine_name_param})",
-                        machine_names,
-                    )
-                ],
+                chunked_statements(
+                    "UPDATE MACHINES SET "
+                    f"machine_state={MachineState.DELETE_REQUESTED.value}, "
+                    "updated_at=CURRENT_TIMESTAMP "
+                    "WHERE machine_name IN ({in_params})",
+                    machine_names,
+                ),
             )
+            self._refresh_request_status_of_machines(trans, machine_names)
 
         self.logger.info(
             f"Finished handling instance deletion for operation {message.operation.id}"
@@ -318,32 +794,28 @@ class MachineDao:
         resources = [parse_resource_url(x) for x in resource_urls]
         operation_id = message.operation.id
         machine_names = [x.name for x in resources]
-        params = flatten([operation_id, machine_names])
-        machine_name_param = ",".join("?" for _ in machine_names)
         with Transaction(self.config) as trans:
             trans.execute(
-                [
-                    Statement(
-                        f"""
-                        UPDATE machines
-                        SET machine_state={MachineState.DELETED.value},
-                            delete_operation_id=?,
-                            delete_grace_period=0
-                        WHERE machine_name IN ({machine_name_param})""",
-                        params,
-                    )
-                ],
+                [Statement(INSERT_OPERATION, [operation_id])]
+                + chunked_statements(
+                    f"""
+                    UPDATE machines
+                    SET machine_state={MachineState.DELETED.value},
+                        delete_operation_key=(
+                            SELECT id FROM operations WHERE gcp_operation_id=?),
+                        delete_grace_period=0,
+                        updated_at=CURRENT_TIMESTAMP
+                    WHERE machine_name IN ({{in_params}})""",
+                    machine_names,
+                    params=[operation_id],
+                ),
             )
+            self._refresh_request_status_of_machines(trans, machine_names)
 
         self.logger.info(
             f"Finished handling instance deletion for operation {message.operation.id}"
         )
 
-        # Check if auto trim command is enabled
-        if self.config.auto_run_trim_db:
-            # Check for possible cleanup of expired returned machines
-            self.remove_expired_returned_machines()
-
         return None
 
     def _handle_instance_preempted(self, message: SimpleNamespace) -> None:
@@ -358,23 +830,20 @@ class MachineDao:
         # we convert to a list just in case in the future we need to support multiple values
         resource_urls = [message.protoPayload.resourceName]
         resources = [parse_resource_url(x) for x in resource_urls]
-        operation_id = message.operation.id
         machine_names = [x.name for x in resources]
-        params = flatten([operation_id, machine_names])
-        machine_name_param = ",".join("?" for _ in machine_names)
         with Transaction(self.config) as trans:
             trans.execute(
-                [
-                    Statement(
-                        # default (and possibly universal) grace period is 30 seconds
-                        f"""
-                        UPDATE machines
-                        SET machine_state={MachineState.PREEMPTED.value}, delete_grace_period=30
-                        WHERE machine_name IN ({machine_name_param})""",
-                        params,
-                    )
-                ],
+                chunked_statements(
+                    # default (and possibly universal) grace period is 30 seconds
+                    f"""
+                    UPDATE machines
+                    SET machine_state={MachineState.PREEMPTED.value}, delete_grace_period=30,
+                        updated_at=CURRENT_TIMESTAMP
+                    WHERE machine_name IN ({{in_params}})""",
+                    machine_names,
+                ),
             )
+            self._refresh_request_status_of_machines(trans, machine_names)
 
         self.logger.info(
             f"Finished handling instance preemption for operation {message.operation.id}"
@@ -389,12 +858,18 @@ class MachineDao:
                 [
                     Statement(
                         "UPDATE MACHINES "
-                        f"SET machine_state={MachineState.LOGGED.value} "
-                        f"WHERE machine_state < {MachineState.LOGGED.value} and operation_id = ?",
+                        f"SET machine_state={MachineState.LOGGED.value}, "
+                        "updated_at=CURRENT_TIMESTAMP "
+                        f"WHERE machine_state < {MachineState.LOGGED.value} and operation_key = "
+                        "(SELECT id FROM operations WHERE gcp_operation_id = ?)",
                         [operation_id],
                     )
                 ],
             )
+            self._refresh_request_status(
+                trans,
+                self._request_keys(trans, SELECT_REQUEST_KEYS_BY_OPERATION, [operation_id]),
+            )
 
     def update_machine_state(
         self, message: SimpleNamespace
@@ -426,28 +901,29 @@ class MachineDao:
                 except Exception:
                     request = None
 
-                self.logger.debug(f"Checking request {request}, response {response}")
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"Checking request {request}, response {response}")
                 operation_type = response.operationType
 
                 # check to see if instances have been created
-                if operation_type == "compute.instanceGroupManagers.createInstances":
+                if operation_type == OperationType.CREATE_INSTANCES.value:
                     return self._handle_instances_created(message)
 
                 # check to see if instances have been inserted
-                if operation_type == "insert":
+                if operation_type == OperationType.INSERT.value:
                     return self._handle_instances_inserted(message)
 
                 # check to see if instances have been deleted by the Instance Group Manager
-                elif operation_type == "compute.instanceGroupManagers.deleteInstances":
+                elif operation_type == OperationType.DELETE_INSTANCES.value:
                     return self._handle_group_instances_deleted(message)
 
                 # check to see if any of my managed instances was deleted outside
                 # the Instance Group Manager
-                elif operation_type == "delete":
+                elif operation_type == OperationType.DELETE.value:
                     return self._handle_instance_deleted(message)
 
                 # check to see if any of my managed instances was preempted
-                elif operation_type == "compute.instances.preempted":
+                elif operation_type == OperationType.PREEMPTED.value:
                     self.logger.info(f"Got a preemption {message}")
                     return self._handle_instance_preempted(message)
 
@@ -464,82 +940,107 @@ class MachineDao:
             raise e
         return None
 
-    def get_machines_for_request(self, request_id: str) -> list[HfMachineStatus]:
-        query = """
-                SELECT *
-                FROM machines
-                WHERE (request_id=:request_id OR return_request_id=:request_id)
-                """
-
-        with sqlite3.connect(
-            self.config.db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-        ) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                query,
-                {"request_id": request_id},
-            )
-            rows = cur.fetchall()
-            columns = [col[0] for col in cur.description]
-            machines: list[HfMachineStatus] = [
-                HfMachineStatus(**dict(zip(columns, row))) for row in rows
-            ]
+    def get_machines_for_request(self, request_id: str) -> list[MachineRecord]:
+        return self.get_machines_for_requests([request_id])[request_id]
+
+    def get_machines_for_requests(
+        self, request_ids: list[str]
+    ) -> dict[str, list[MachineRecord]]:
+        """
+        Return the machines of each request or return request, keyed by request ID,
+        fetching the whole batch in a single query
+        """
+        request_ids = list(dict.fromkeys(request_ids))
+        machines: dict[str, list[MachineRecord]] = {
+            request_id: [] for request_id in request_ids
+        }
+        if not request_ids:
             return machines
 
-    def get_machines_by_name(self, machine_names: list[str]) -> list[HfMachine]:
-        """Return a list of machines matching the names provided"""
-        machine_name_param = ",".join("?" for _ in machine_names)
-
-        query = f"""
-                SELECT *
-                FROM machines
-                WHERE machine_name IN ({machine_name_param})
-                """
-
-        with sqlite3.connect(
-            self.config.db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-        ) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                query,
-                machine_names,
+        rows = self._read_chunked(SELECT_MACHINES_FOR_REQUESTS, request_ids, "(?)")
+        # the first column is the request ID that matched
+        for row in rows:
+            machines[row[0]].append(MachineRecord.from_row(row[1:]))
+        return machines
+
+    def get_request_state_counts(
+        self, request_ids: list[str]
+    ) -> dict[str, RequestStateCounts]:
+        """Return the number of machines per machine state of each request, keyed by request ID"""
+        request_ids = list(dict.fromkeys(request_ids))
+        counts = {
+            request_id: RequestStateCounts(request_id=request_id)
+            for request_id in request_ids
+        }
+        if not request_ids:
+            return counts
+
+        rows = self._read_chunked(SELECT_REQUEST_STATE_COUNTS, request_ids, "(?)")
+        for request_id, is_return_request, machine_state, count, missing_ip_count in rows:
+            request_counts = counts[request_id]
+            request_counts.is_return_request = bool(is_return_request)
+            request_counts.add(machine_state, count, missing_ip_count)
+        return counts
+
+    def get_request_status_summaries(
+        self, request_ids: list[str]
+    ) -> dict[str, RequestStatusSummary]:
+        """
+        Return the stored status summary of each request, keyed by request ID, reading one row
+        per request. Requests without a summary are left out.
+        """
+        request_ids = list(dict.fromkeys(request_ids))
+        summaries: dict[str, RequestStatusSummary] = {}
+        for row in self._read_chunked(SELECT_REQUEST_STATUS, request_ids):
+            (
+                request_id,
+                is_return_request,
+                machine_counts,
+                missing_ip_counts,
+                ip_ready_count,
+                status,
+                updated_at,
+            ) = row
+            summaries[request_id] = RequestStatusSummary(
+                request_id=request_id,
+                is_return_request=bool(is_return_request),
+                machine_counts=json.loads(machine_counts),
+                missing_ip_counts=json.loads(missing_ip_counts),
+                ip_ready_count=ip_ready_count,
+                status=status,
+                updated_at=updated_at,
             )
-            rows = cur.fetchall()
-            columns = [col[0] for col in cur.description]
-            machines: list[HfMachine] = [
-                HfMachine(**dict(zip(columns, row))) for row in rows
-            ]
-            return machines
+        return summaries
+
+    def get_request_fingerprints(self, request_ids: list[str]) -> dict[str, tuple[int, str]]:
+        """
+        Return a fingerprint of each request, keyed by request ID, that changes whenever the
+        request's machines change. Requests without a status summary are left out.
+        """
+        rows = self._read_chunked(SELECT_REQUEST_FINGERPRINTS, list(dict.fromkeys(request_ids)))
+        return {request_id: (version, updated_at) for request_id, version, updated_at in rows}
+
+    def get_machines_by_name(self, machine_names: list[str]) -> list[MachineRecord]:
+        """Return a list of machines matching the names provided"""
+        rows = self._read_chunked(SELECT_MACHINES_BY_NAME, machine_names)
+        return [MachineRecord.from_row(row) for row in rows]
 
     def get_deleted_or_preempted_machines(
         self,
     ) -> list[HFReturnRequestsResponse.Request]:
         """Gets all deleted or preempted machines that have no associated return requests"""
-        query = f"""
-                SELECT machine_name, delete_grace_period
-                FROM machines
-                WHERE return_request_id IS NULL
-                AND machine_state IN (?, ?)
-                """
-        with sqlite3.connect(
-            self.config.db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-        ) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                query, (MachineState.PREEMPTED.value, MachineState.DELETED.value)
-            )
-            rows = cur.fetchall()
-            return [
-                HFReturnRequestsResponse.Request(machine=row[0], gracePeriod=row[1])
-                for row in rows
-            ]
+        rows = self._reader().execute(
+            SELECT_UNRETURNED_DELETED_MACHINES,
+            (MachineState.PREEMPTED.value, MachineState.DELETED.value),
+        ).fetchall()
+        return [
+            HFReturnRequestsResponse.Request(machine=row[0], gracePeriod=row[1])
+            for row in rows
+        ]
 
     def check_or_raise(self) -> None:
         """
-        Fast pre-flight check:
+        Full check, which is O(database size); see db/health.py for the fast check:
             - DB reachable and writable
             - Table exists
             - DB integrity quick check passes
@@ -560,9 +1061,8 @@ class MachineDao:
             - table_exists (boolean)
             - writable (boolean)
             - integrity (ok or error text)
-            - insert_ok (boolean) # False if schema required values
-            - delete_ok (boolean) # True when insert_ok is True
-            - needs_required_values (boolean)
+            - insert_ok (boolean)
+            - delete_ok (boolean)
         We just used SAVEPOINT/ROLLBACK and never commit any changes
         """
 
@@ -572,7 +1072,6 @@ class MachineDao:
             "integrity": "unknown",
             "insert_ok": False,
             "delete_ok": False,
-            "needs_required_values": False,
         }
 
         try:
@@ -628,19 +1127,23 @@ class MachineDao:
                     "Step 4: Insert/Delete probe inside SAVEPOINT (rollback always)"
                 )
                 try:
-                    # Check Insert
+                    # Check Insert; the keys need not exist, as foreign keys are not enforced
                     cur.execute("SAVEPOINT check_tx")
-                    cur.execute("INSERT INTO machines DEFAULT VALUES")
-                    rowId = cur.lastrowid
-                    details["insert_ok"] = True
+                    cur.execute(
+                        "INSERT INTO machines "
+                        "(machine_name, request_key, instance_group_key, operation_key) "
+                        "VALUES (?, 0, 0, 0)",
+                        (QUICK_CHECK_PROBE_NAME,),
+                    )
+                    details["insert_ok"] = cur.rowcount == 1
 
                     # Check Delete
-                    cur.execute("DELETE FROM machines WHERE rowid = ?", (rowId,))
+                    cur.execute(
+                        "DELETE FROM machines WHERE machine_name = ?", (QUICK_CHECK_PROBE_NAME,)
+                    )
                     details["delete_ok"] = cur.rowcount == 1
-                except sqlite3.IntegrityError:
-                    details["needs_required_values"] = True
-                except sqlite3.OperationalError as e:
-                    details["integrity"] = f"Insert/Delete Operational Error: {e}"
+                except sqlite3.DatabaseError as e:
+                    details["integrity"] = f"Insert/Delete Error: {e}"
                     self.logger.error(details["integrity"])
                     conn.execute("ROLLBACK TO check_tx")
                     conn.execute("RELEASE check_tx")
@@ -651,6 +1154,8 @@ class MachineDao:
                         conn.execute("RELEASE check_tx")
                     except sqlite3.OperationalError:
                         pass
+                if not (details["insert_ok"] and details["delete_ok"]):
+                    return (False, details)
                 self.logger.debug("[DONE] - DB is healthy")
                 return (True, details)  # means db is healthy :)
 
@@ -659,60 +1164,106 @@ class MachineDao:
             self.logger.error(details["integrity"])
             return (False, details)
 
-    @debounce(wait=5.0, options=DebounceOptions(trailing=False, leading=True))  
-    async def _remove_expired_returned_machines_async(self) -> int:
-        """Asynchronously delete machine rows where return_ttl has expired."""
-
-        def _blocking_db_work():
-            selectQuery = f"""
-                SELECT machine_name
-                    FROM machines
-                WHERE machine_state IN ({MachineState.DELETED.value})
-                AND DATETIME(updated_at, '+{self.config.returned_vm_ttl} days') <= CURRENT_TIMESTAMP
-            """
-
-            with sqlite3.connect(
-                self.config.db_path,
-                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-            ) as conn:
-                cur = conn.cursor()
-                cur.execute(selectQuery)
-                candidate_for_deletion = [row[0] for row in cur.fetchall()]
-
-            if not candidate_for_deletion:
-                self.logger.debug("No expired returned machines found for cleanup.")
-                return 0
+    def _cutoff(self, modifier: str, amount: int) -> str:
+        """Return the timestamp `amount` units (days, seconds, ...) ago, in SQLite's format"""
+        return (
+            self._reader()
+            .execute(f"SELECT DATETIME('now', '-' || ? || ' {modifier}')", (amount,))
+            .fetchone()[0]
+        )
 
-            deleted_count = len(candidate_for_deletion)
+    def _delete_in_batches(
+        self, table: str, select_query: str, keys_query: str, cutoff: str, batch_size: int
+    ) -> int:
+        """
+        Delete the rows selected by a query limited to `batch_size` rows, until it selects a
+        partial batch, each batch in its own short transaction, so that the Pub/Sub monitor
+        never waits long for the write lock. Returns the number of rows deleted.
+        """
+        deleted_count = 0
+        while True:
+            with Transaction(self.config) as trans:
+                trans.execute([Statement(select_query, [cutoff, batch_size])])
+                machine_names = [row[0] for row in trans.cursor.fetchall()]
+                if machine_names:
+                    request_keys = self._request_keys(trans, keys_query, machine_names)
+                    trans.execute(
+                        chunked_statements(
+                            f"DELETE FROM {table} WHERE machine_name IN ({{in_params}})",
+                            machine_names,
+                        )
+                    )
+                    self._refresh_request_status(trans, request_keys)
+            deleted_count += len(machine_names)
+            if len(machine_names) < batch_size:
+                return deleted_count
 
-            placeholders = ", ".join(["?"] * deleted_count)
-            deleteQuery = f"DELETE FROM machines WHERE machine_name IN ({placeholders})"
+    def remove_expired_returned_machines(self, batch_size: Optional[int] = None) -> int:
+        """
+        Delete the rows of machines deleted more than `returned_vm_ttl` days ago, from both the
+        machines table and the archive. Returns the number of rows deleted.
+        """
+        if batch_size is None:
+            batch_size = self.config.trim_db_batch_size
+        # computed once, so that rows expiring during the trim do not prolong it
+        cutoff = self._cutoff("days", self.config.returned_vm_ttl)
+
+        deleted_count = self._delete_in_batches(
+            "machines",
+            SELECT_EXPIRED_MACHINES,
+            SELECT_REQUEST_KEYS_BY_NAME,
+            cutoff,
+            batch_size,
+        )
+        deleted_count += self._delete_in_batches(
+            "machines_archive",
+            SELECT_EXPIRED_ARCHIVED_MACHINES,
+            SELECT_ARCHIVED_REQUEST_KEYS_BY_NAME,
+            cutoff,
+            batch_size,
+        )
 
+        if deleted_count:
             with Transaction(self.config) as trans:
-                trans.execute(
-                    [
-                        Statement(deleteQuery, candidate_for_deletion)
-                    ]
-                )
-
-            return deleted_count
-    
-        deleted_count = await asyncio.to_thread(_blocking_db_work)
-        self.logger.info(f"Successfully cleaned up {deleted_count} expired returned machines.")
+                trans.execute([Statement(query, []) for query in DELETE_ORPHANED_KEYS])
+            self.logger.info(f"Cleaned up {deleted_count} expired returned machines.")
+        else:
+            self.logger.debug("No expired returned machines found for cleanup.")
         return deleted_count
 
-    def remove_expired_returned_machines(self) -> int:
-        """Delete machine rows where return_ttl has expired."""
-        try:
-            l = asyncio.get_event_loop()
-            if l.is_running():
-                asyncio.create_task(self._remove_expired_returned_machines_async())
-                return 0
-            else:
-                return asyncio.run(self._remove_expired_returned_machines_async())
-        except RuntimeError:
-            # No event loop in current thread
-            return asyncio.run(self._remove_expired_returned_machines_async())
-        except Exception as e:
-            self.logger.error(f"Error during cleanup of expired returned machines: {e}")
-            return 0
\ No newline at end of file
+    def archive_returned_machines(self, batch_size: Optional[int] = None) -> int:
+        """
+        Move the machines that were returned and deleted more than `db_archive_delay` seconds
+        ago to the archive, so that the machines table only holds live capacity.
+        Returns the number of machines archived.
+        """
+        if batch_size is None:
+            batch_size = self.config.trim_db_batch_size
+        cutoff = self._cutoff("seconds", self.config.db_archive_delay)
+
+        archived_count = 0
+        while True:
+            with Transaction(self.config) as trans:
+                trans.execute([Statement(SELECT_ARCHIVABLE_MACHINES, [cutoff, batch_size])])
+                machine_names = [row[0] for row in trans.cursor.fetchall()]
+                if machine_names:
+                    # a machine whose name was reused replaces the archived machine of an
+                    # earlier request, which no longer counts towards that request
+                    replaced_request_keys = self._request_keys(
+                        trans, SELECT_ARCHIVED_REQUEST_KEYS_BY_NAME, machine_names
+                    )
+                    trans.execute(
+                        chunked_statements(ARCHIVE_MACHINES, machine_names)
+                        + chunked_statements(
+                            "DELETE FROM machines WHERE machine_name IN ({in_params})",
+                            machine_names,
+                        )
+                    )
+                    self._refresh_request_status(trans, replaced_request_keys)
+            archived_count += len(machine_names)
+            if len(machine_names) < batch_size:
+                break
+
+        if archived_count:
+            self.logger.info(f"Archived {archived_count} returned machines.")
+        return archived_count
@@ -0,0 +1,532 @@
+"""
+Versioned schema migrations for the provider database.
+
+Each migration is applied at most once, in version order, and recorded in the `schema_version`
+table. A migration records its version before running its script, in the same transaction, so
+that a process racing another one to apply the same migration fails on the version's primary
+key and skips it. Earlier migrations are idempotent (`IF NOT EXISTS`, ...), because databases
+created before versioning already contain the baseline schema.
+"""
+
+import sqlite3
+from logging import Logger
+
+
+class Migration:
+    """
+    Defines a schema migration. A migration runs in a single transaction, unless it is not
+    `transactional`, which is required for statements such as VACUUM.
+    """
+
+    def __init__(
+        self, version: int, description: str, script: str, transactional: bool = True
+    ):
+        self.version = version
+        self.description = description
+        self.script = script
+        self.transactional = transactional
+
+
+# @formatter:off
+MIGRATIONS: list[Migration] = [
+    Migration(
+        1,
+        "baseline schema",
+        """
+        CREATE TABLE IF NOT EXISTS machines (
+          machine_name VARCHAR(32) NOT NULL,
+          request_id VARCHAR(32) NOT NULL,
+          gcp_zone VARCHAR(32) NOT NULL,
+          instance_group_manager VARCHAR(32) NOT NULL,
+          machine_state INT DEFAULT 0,
+          operation_id VARCHAR(32) NOT NULL,
+          return_request_id VARCHAR(32),
+          delete_operation_request_id VARCHAR(32),
+          delete_operation_id VARCHAR(32),
+          delete_grace_period INT,
+          internal_ip VARCHAR(15),
+          external_ip VARCHAR(15),
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_machine_name ON machines(machine_name);
+        CREATE UNIQUE INDEX IF NOT EXISTS
+             idx_request_id_machine_name
+          ON machines(request_id, machine_name);
+        CREATE UNIQUE INDEX IF NOT EXISTS
+             idx_insert_id_machine_name
+          ON machines(operation_id, machine_name);
+
+        CREATE TRIGGER IF NOT EXISTS set_updated_at
+            AFTER UPDATE ON machines
+            FOR EACH ROW
+        BEGIN
+            UPDATE machines SET updated_at = CURRENT_TIMESTAMP WHERE machine_name = OLD.machine_name;
+        END;
+        """,
+    ),
+    Migration(
+        2,
+        "indexes for return requests, unreturned deletions and the TTL trim",
+        """
+        -- getRequestStatus / getReturnRequests: lookups by return request.
+        -- Most machines have never been returned, so only index those that have.
+        CREATE INDEX IF NOT EXISTS
+             idx_return_request_id
+          ON machines(return_request_id)
+          WHERE return_request_id IS NOT NULL;
+
+        -- getReturnRequests: deleted or preempted machines that HostFactory did not return.
+        -- Covers every column the query references, so the table is never visited.
+        CREATE INDEX IF NOT EXISTS
+             idx_unreturned_machine_state
+          ON machines(machine_state, machine_name, delete_grace_period, return_request_id)
+          WHERE return_request_id IS NULL;
+
+        -- trimDB: deleted machines (MachineState.DELETED) by age
+        CREATE INDEX IF NOT EXISTS
+             idx_deleted_updated_at
+          ON machines(updated_at)
+          WHERE machine_state = 400;
+        """,
+    ),
+    Migration(
+        3,
+        "drop the set_updated_at trigger",
+        """
+        -- The trigger issued a second UPDATE for every updated row. MachineDao now sets
+        -- updated_at in the UPDATE statements themselves.
+        DROP TRIGGER IF EXISTS set_updated_at;
+        """,
+    ),
+    Migration(
+        4,
+        "single-row table for database health checks",
+        """
+        -- stamped by the constant-time health check, to prove that the database is writable,
+        -- and holding the cached result of the last full integrity check
+        CREATE TABLE IF NOT EXISTS db_health (
+          id INTEGER PRIMARY KEY CHECK (id = 1),
+          stamped_at TIMESTAMP,
+          integrity TEXT,
+          integrity_checked_at TIMESTAMP);
+
+        INSERT OR IGNORE INTO db_health (id) VALUES (1);
+        """,
+    ),
+    Migration(
+        5,
+        "incremental auto-vacuum",
+        """
+        -- lets the TTL trim return free pages to the file system with PRAGMA incremental_vacuum.
+        -- New databases are created with it (see migrate). Switching an existing database
+        -- from auto_vacuum=NONE requires a one-time VACUUM, which is O(database size), so it is
+        -- left to the initializeDB and trimDB commands; see complete_pending_vacuum
+        PRAGMA auto_vacuum = INCREMENTAL;
+        """,
+        transactional=False,
+    ),
+    Migration(
+        6,
+        "archive table for returned machines",
+        """
+        -- returned, deleted machines are moved here shortly after their return, so that the
+        -- machines table only holds live capacity. Rows stay until the TTL trim.
+        CREATE TABLE IF NOT EXISTS machines_archive (
+          machine_name VARCHAR(32) NOT NULL,
+          request_id VARCHAR(32) NOT NULL,
+          gcp_zone VARCHAR(32) NOT NULL,
+          instance_group_manager VARCHAR(32) NOT NULL,
+          machine_state INT DEFAULT 0,
+          operation_id VARCHAR(32) NOT NULL,
+          return_request_id VARCHAR(32),
+          delete_operation_request_id VARCHAR(32),
+          delete_operation_id VARCHAR(32),
+          delete_grace_period INT,
+          internal_ip VARCHAR(15),
+          external_ip VARCHAR(15),
+          created_at TIMESTAMP,
+          updated_at TIMESTAMP,
+          archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS
+             idx_archive_machine_name
+          ON machines_archive(machine_name);
+        CREATE INDEX IF NOT EXISTS
+             idx_archive_request_id
+          ON machines_archive(request_id);
+        CREATE INDEX IF NOT EXISTS
+             idx_archive_return_request_id
+          ON machines_archive(return_request_id);
+        CREATE INDEX IF NOT EXISTS
+             idx_archive_updated_at
+          ON machines_archive(updated_at);
+        """,
+    ),
+    Migration(
+        7,
+        "normalized schema with integer keys",
+        """
+        -- HostFactory request IDs, Google Cloud operation IDs and instance groups are stored
+        -- once, and machines refer to them by integer keys, which keeps rows and indexes small.
+        -- machines is keyed by machine name, without a separate rowid.
+        CREATE TABLE requests (
+          id INTEGER PRIMARY KEY,
+          hf_request_id VARCHAR(64) NOT NULL UNIQUE);
+
+        CREATE TABLE operations (
+          id INTEGER PRIMARY KEY,
+          gcp_operation_id VARCHAR(64) NOT NULL UNIQUE);
+
+        CREATE TABLE instance_groups (
+          id INTEGER PRIMARY KEY,
+          gcp_zone VARCHAR(32) NOT NULL,
+          instance_group_manager VARCHAR(64) NOT NULL,
+          UNIQUE (gcp_zone, instance_group_manager));
+
+        INSERT OR IGNORE INTO requests (hf_request_id)
+        SELECT request_id FROM machines
+        UNION SELECT return_request_id FROM machines WHERE return_request_id IS NOT NULL
+        UNION SELECT request_id FROM machines_archive
+        UNION SELECT return_request_id FROM machines_archive WHERE return_request_id IS NOT NULL;
+
+        INSERT OR IGNORE INTO operations (gcp_operation_id)
+        SELECT operation_id FROM machines
+        UNION SELECT delete_operation_id FROM machines WHERE delete_operation_id IS NOT NULL
+        UNION SELECT operation_id FROM machines_archive
+        UNION SELECT delete_operation_id FROM machines_archive
+          WHERE delete_operation_id IS NOT NULL;
+
+        INSERT OR IGNORE INTO instance_groups (gcp_zone, instance_group_manager)
+        SELECT gcp_zone, instance_group_manager FROM machines
+        UNION SELECT gcp_zone, instance_group_manager FROM machines_archive;
+
+        CREATE TABLE machines_normalized (
+          machine_name VARCHAR(32) NOT NULL PRIMARY KEY,
+          request_key INTEGER NOT NULL REFERENCES requests(id),
+          instance_group_key INTEGER NOT NULL REFERENCES instance_groups(id),
+          machine_state INT DEFAULT 0,
+          operation_key INTEGER NOT NULL REFERENCES operations(id),
+          return_request_key INTEGER REFERENCES requests(id),
+          delete_operation_request_id VARCHAR(32),
+          delete_operation_key INTEGER REFERENCES operations(id),
+          delete_grace_period INT,
+          internal_ip VARCHAR(15),
+          external_ip VARCHAR(15),
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP) WITHOUT ROWID;
+
+        INSERT INTO machines_normalized
+        SELECT old.machine_name,
+               requests.id,
+               instance_groups.id,
+               old.machine_state,
+               operations.id,
+               return_requests.id,
+               old.delete_operation_request_id,
+               delete_operations.id,
+               old.delete_grace_period,
+               old.internal_ip,
+               old.external_ip,
+               old.created_at,
+               old.updated_at
+        FROM machines AS old
+        JOIN requests ON requests.hf_request_id = old.request_id
+        JOIN instance_groups
+          ON instance_groups.gcp_zone = old.gcp_zone
+          AND instance_groups.instance_group_manager = old.instance_group_manager
+        JOIN operations ON operations.gcp_operation_id = old.operation_id
+        LEFT JOIN requests AS return_requests
+          ON return_requests.hf_request_id = old.return_request_id
+        LEFT JOIN operations AS delete_operations
+          ON delete_operations.gcp_operation_id = old.delete_operation_id;
+
+        DROP TABLE machines;
+        ALTER TABLE machines_normalized RENAME TO machines;
+
+        CREATE TABLE machines_archive_normalized (
+          machine_name VARCHAR(32) NOT NULL PRIMARY KEY,
+          request_key INTEGER NOT NULL REFERENCES requests(id),
+          instance_group_key INTEGER NOT NULL REFERENCES instance_groups(id),
+          machine_state INT DEFAULT 0,
+          operation_key INTEGER NOT NULL REFERENCES operations(id),
+          return_request_key INTEGER REFERENCES requests(id),
+          delete_operation_request_id VARCHAR(32),
+          delete_operation_key INTEGER REFERENCES operations(id),
+          delete_grace_period INT,
+          internal_ip VARCHAR(15),
+          external_ip VARCHAR(15),
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP,
+          archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP) WITHOUT ROWID;
+
+        INSERT INTO machines_archive_normalized
+        SELECT old.machine_name,
+               requests.id,
+               instance_groups.id,
+               old.machine_state,
+               operations.id,
+               return_requests.id,
+               old.delete_operation_request_id,
+               delete_operations.id,
+               old.delete_grace_period,
+               old.internal_ip,
+               old.external_ip,
+               old.created_at,
+               old.updated_at,
+               old.archived_at
+        FROM machines_archive AS old
+        JOIN requests ON requests.hf_request_id = old.request_id
+        JOIN instance_groups
+          ON instance_groups.gcp_zone = old.gcp_zone
+          AND instance_groups.instance_group_manager = old.instance_group_manager
+        JOIN operations ON operations.gcp_operation_id = old.operation_id
+        LEFT JOIN requests AS return_requests
+          ON return_requests.hf_request_id = old.return_request_id
+        LEFT JOIN operations AS delete_operations
+          ON delete_operations.gcp_operation_id = old.delete_operation_id;
+
+        DROP TABLE machines_archive;
+        ALTER TABLE machines_archive_normalized RENAME TO machines_archive;
+
+        -- the primary key (machine_name) is part of every index of a WITHOUT ROWID table
+        CREATE INDEX idx_request_key ON machines(request_key);
+        CREATE INDEX idx_operation_key ON machines(operation_key);
+        CREATE INDEX idx_return_request_key
+          ON machines(return_request_key)
+          WHERE return_request_key IS NOT NULL;
+        CREATE INDEX idx_unreturned_machine_state
+          ON machines(machine_state, delete_grace_period, return_request_key)
+          WHERE return_request_key IS NULL;
+        CREATE INDEX idx_deleted_updated_at
+          ON machines(updated_at)
+          WHERE machine_state = 400;
+
+        CREATE INDEX idx_archive_request_key ON machines_archive(request_key);
+        CREATE INDEX idx_archive_return_request_key ON machines_archive(return_request_key);
+        CREATE INDEX idx_archive_updated_at ON machines_archive(updated_at);
+
+        -- machines and archived machines, with their keys resolved
+        CREATE VIEW IF NOT EXISTS machine_records AS
+        SELECT machines.machine_name,
+               requests.hf_request_id AS request_id,
+               instance_groups.gcp_zone,
+               instance_groups.instance_group_manager,
+               machines.machine_state,
+               operations.gcp_operation_id AS operation_id,
+               return_requests.hf_request_id AS return_request_id,
+               machines.delete_operation_request_id,
+               delete_operations.gcp_operation_id AS delete_operation_id,
+               machines.delete_grace_period,
+               machines.internal_ip,
+               machines.external_ip,
+               machines.created_at,
+               machines.updated_at,
+               machines.request_key,
+               machines.return_request_key
+        FROM machines
+        JOIN requests ON requests.id = machines.request_key
+        JOIN instance_groups ON instance_groups.id = machines.instance_group_key
+        JOIN operations ON operations.id = machines.operation_key
+        LEFT JOIN requests AS return_requests
+          ON return_requests.id = machines.return_request_key
+        LEFT JOIN operations AS delete_operations
+          ON delete_operations.id = machines.delete_operation_key;
+
+        CREATE VIEW IF NOT EXISTS archived_machine_records AS
+        SELECT machines_archive.machine_name,
+               requests.hf_request_id AS request_id,
+               instance_groups.gcp_zone,
+               instance_groups.instance_group_manager,
+               machines_archive.machine_state,
+               operations.gcp_operation_id AS operation_id,
+               return_requests.hf_request_id AS return_request_id,
+               machines_archive.delete_operation_request_id,
+               delete_operations.gcp_operation_id AS delete_operation_id,
+               machines_archive.delete_grace_period,
+               machines_archive.internal_ip,
+               machines_archive.external_ip,
+               machines_archive.created_at,
+               machines_archive.updated_at,
+               machines_archive.request_key,
+               machines_archive.return_request_key
+        FROM machines_archive
+        JOIN requests ON requests.id = machines_archive.request_key
+        JOIN instance_groups ON instance_groups.id = machines_archive.instance_group_key
+        JOIN operations ON operations.id = machines_archive.operation_key
+        LEFT JOIN requests AS return_requests
+          ON return_requests.id = machines_archive.return_request_key
+        LEFT JOIN operations AS delete_operations
+          ON delete_operations.id = machines_archive.delete_operation_key;
+        """,
+    ),
+    Migration(
+        8,
+        "request status summaries",
+        """
+        -- maintained by MachineDao in the transaction that changes a request's machines, so
+        -- that getRequestStatus reads one row per request. The counts are JSON objects that
+        -- map a machine state to a number of machines. Requests without a row are counted
+        -- from their machines.
+        CREATE TABLE IF NOT EXISTS request_status (
+          request_key INTEGER PRIMARY KEY REFERENCES requests(id),
+          is_return_request INT NOT NULL DEFAULT 0,
+          machine_counts TEXT NOT NULL,
+          missing_ip_counts TEXT NOT NULL,
+          ip_ready_count INT NOT NULL DEFAULT 0,
+          status VARCHAR(32) NOT NULL,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        """,
+    ),
+    Migration(
+        9,
+        "request status versions",
+        """
+        -- incremented whenever a request's summary is refreshed. updated_at only has a
+        -- resolution of one second, so the version tells the changes within a second apart.
+        ALTER TABLE request_status ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+        """,
+    ),
+    Migration(
+        10,
+        "machines missing an IP",
+        """
+        -- the IP resolver looks for these on every tick; they are few, and short-lived
+        CREATE INDEX IF NOT EXISTS idx_missing_ip
+          ON machines(machine_state)
+          WHERE internal_ip IS NULL;
+        """,
+    ),
+    Migration(
+        11,
+        "processed Pub/Sub messages",
+        """
+        -- the messages that the event monitor has applied, so that redeliveries are skipped
+        CREATE TABLE IF NOT EXISTS processed_messages (
+          insert_id TEXT NOT NULL,
+          operation_id TEXT NOT NULL,
+          processed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          PRIMARY KEY (insert_id, operation_id));
+        CREATE INDEX IF NOT EXISTS idx_processed_at ON processed_messages(processed_at);
+        """,
+    ),
+    Migration(
+        12,
+        "pending tasks",
+        """
+        -- the work that acknowledged messages still need, such as resolving the IPs of new
+        -- machines; a restarted event monitor resumes it
+        CREATE TABLE IF NOT EXISTS pending_tasks (
+          operation_id TEXT PRIMARY KEY,
+          task TEXT NOT NULL,
+          payload TEXT NOT NULL,
+          attempts INTEGER NOT NULL DEFAULT 0,
+          next_run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP);
+        CREATE INDEX IF NOT EXISTS idx_next_run_at ON pending_tasks(next_run_at);
+        """,
+    ),
+]
+# @formatter:on
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# the value of PRAGMA auto_vacuum once the database has been switched to incremental auto-vacuum
+INCREMENTAL_AUTO_VACUUM = 2
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Return the version of the most recent migration applied to the database"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+          version INTEGER PRIMARY KEY,
+          description TEXT,
+          applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+        """
+    )
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, logger: Logger) -> int:
+    """Apply every pending migration, in version order. Returns the schema version."""
+    # the auto-vacuum mode of an empty database applies without a VACUUM, as long as it is set
+    # before anything is written to the file
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    version = current_version(conn)
+    conn.commit()
+    initial_version = version
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+
+        logger.info(
+            f"Applying database migration {migration.version}: {migration.description}"
+        )
+        try:
+            if migration.transactional:
+                # executescript commits any open transaction before it runs, so the version is
+                # recorded within the script, and the description once the script has run
+                conn.executescript(
+                    f"""
+                    BEGIN IMMEDIATE;
+                    INSERT INTO schema_version (version) VALUES ({int(migration.version)});
+                    {migration.script}
+                    """
+                )
+                conn.execute(
+                    "UPDATE schema_version SET description=? WHERE version=?",
+                    (migration.description, migration.version),
+                )
+            else:
+                conn.executescript(migration.script)
+                conn.execute(
+                    "INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)",
+                    (migration.version, migration.description),
+                )
+            conn.commit()
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if isinstance(e, sqlite3.IntegrityError) and "schema_version" in str(e):
+                # another process applied this migration after we read the schema version
+                logger.info(f"Database migration {migration.version} was already applied")
+                version = migration.version
+                continue
+
+            logger.error(f"Database migration {migration.version} failed")
+            raise
+        version = migration.version
+
+    if version > initial_version and vacuum_pending(conn):
+        logger.warning(
+            "The database needs a one-time VACUUM to switch to incremental auto-vacuum; "
+            "run the initializeDB or trimDB command to complete it"
+        )
+    return version
+
+
+def vacuum_pending(conn: sqlite3.Connection) -> bool:
+    """Whether the database still needs the VACUUM that switches it to incremental auto-vacuum"""
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL_AUTO_VACUUM
+
+
+def complete_pending_vacuum(conn: sqlite3.Connection, logger: Logger) -> bool:
+    """
+    Run the one-time VACUUM that switches the database to incremental auto-vacuum, if it is
+    pending. The VACUUM rewrites the whole database and needs exclusive access, so it only runs
+    from the initializeDB and trimDB commands, never before a provisioning call nor alongside
+    the event monitor's batches. Returns whether it ran.
+    """
+    if not vacuum_pending(conn):
+        return False
+
+    logger.info("Switching the database to incremental auto-vacuum, with a one-time VACUUM")
+    # the pragma only applies to the connection that runs the VACUUM
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info("The database now uses incremental auto-vacuum")
+    return True
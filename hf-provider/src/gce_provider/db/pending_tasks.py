@@ -0,0 +1,86 @@
+"""
+Keeps the work that acknowledged Pub/Sub messages still need.
+
+Some messages need more work once they are applied, such as waiting for the IPs of new
+instances and labelling them. A task for that work is stored in the transaction that applies
+the message, so before the message is acknowledged, and deleted once it succeeds. A task that
+needs another attempt is rescheduled with an exponential backoff. A restarted monitor resumes the
+tasks that are due, rather than leaving their machines without an IP.
+"""
+
+from typing import NamedTuple, Optional
+
+from gce_provider.config import Config, get_config
+from gce_provider.db.connection import get_connection_manager
+from gce_provider.db.transaction import Statement, Transaction
+
+# the backoff between attempts, in seconds, and the attempts before a task is abandoned
+MIN_BACKOFF_SECONDS = 1
+MAX_BACKOFF_SECONDS = 60
+MAX_ATTEMPTS = 1000
+
+INSERT_PENDING_TASK = """
+    INSERT OR IGNORE INTO pending_tasks (operation_id, task, payload) VALUES (?, ?, ?)
+    """
+
+SELECT_DUE_TASKS = """
+    SELECT operation_id, task, payload, attempts
+    FROM pending_tasks
+    WHERE next_run_at <= CURRENT_TIMESTAMP
+    ORDER BY next_run_at
+    LIMIT ?
+    """
+
+RESCHEDULE_PENDING_TASK = """
+    UPDATE pending_tasks
+    SET attempts=attempts + 1,
+        next_run_at=DATETIME('now', '+' || ? || ' seconds')
+    WHERE operation_id=?
+    """
+
+DELETE_PENDING_TASK = "DELETE FROM pending_tasks WHERE operation_id=?"
+
+
+class PendingTask(NamedTuple):
+    operation_id: str
+    task: str
+    payload: str
+    attempts: int
+
+
+class PendingTasks:
+    """The tasks of acknowledged messages, keyed by operation ID"""
+
+    def __init__(self, config: Optional[Config] = None):
+        if config is None:
+            config = get_config()
+        self.config = config
+        self.logger = config.logger
+
+    def add(self, trans: Transaction, operation_id: str, task: str, payload: str) -> None:
+        """Store a task within the transaction that applies its message"""
+        trans.execute([Statement(INSERT_PENDING_TASK, [operation_id, task, payload])])
+
+    def due(self, limit: int) -> list[PendingTask]:
+        """Return up to `limit` tasks whose next attempt is due, the longest overdue first"""
+        rows = get_connection_manager(self.config).reader().execute(SELECT_DUE_TASKS, (limit,))
+        return [PendingTask(*row) for row in rows.fetchall()]
+
+    def complete(self, operation_id: str) -> None:
+        with Transaction(self.config) as trans:
+            trans.execute([Statement(DELETE_PENDING_TASK, [operation_id])])
+
+    def reschedule(self, task: PendingTask) -> None:
+        """Schedule the next attempt at a task, or abandon it after `MAX_ATTEMPTS` attempts"""
+        attempts = task.attempts + 1
+        if attempts >= MAX_ATTEMPTS:
+            self.logger.error(
+                f"Abandoning task {task.task} for operation {task.operation_id} "
+                f"after {attempts} attempts"
+            )
+            self.complete(task.operation_id)
+            return
+
+        delay = min(MAX_BACKOFF_SECONDS, MIN_BACKOFF_SECONDS * 2 ** min(attempts - 1, 16))
+        with Transaction(self.config) as trans:
+            trans.execute([Statement(RESCHEDULE_PENDING_TASK, [delay, task.operation_id])])
@@ -0,0 +1,132 @@
+"""
+Remembers the Pub/Sub messages that the event monitor has applied.
+
+Pub/Sub delivers each message at least once, and redelivers a message whose acknowledgement
+deadline expires, which is common while the monitor is busy. Each applied message is recorded by
+its insertId and operation ID, in the transaction that applies it, so that a redelivered message
+is acknowledged without any work, even after the monitor restarts. A bounded LRU cache answers
+most lookups without reading the database.
+"""
+
+import threading
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
+
+from gce_provider.config import Config, get_config
+from gce_provider.db.connection import get_connection_manager
+from gce_provider.db.transaction import Statement, Transaction
+from gce_provider.utils.lru_cache import LRUCache
+
+INSERT_PROCESSED_MESSAGE = """
+    INSERT OR IGNORE INTO processed_messages (insert_id, operation_id) VALUES (?, ?)
+    """
+
+SELECT_PROCESSED_MESSAGE = """
+    SELECT 1 FROM processed_messages WHERE insert_id=? AND operation_id=?
+    """
+
+DELETE_EXPIRED_PROCESSED_MESSAGES = """
+    DELETE FROM processed_messages
+    WHERE rowid IN (
+      SELECT rowid FROM processed_messages WHERE processed_at <= ? LIMIT ?)
+    """
+
+MessageKey = tuple[str, str]
+
+
+def message_key(message_obj: SimpleNamespace) -> Optional[MessageKey]:
+    """Return the key that identifies a decoded message, if it has one"""
+    insert_id = getattr(message_obj, "insertId", None)
+    if not insert_id:
+        return None
+    return insert_id, message_obj.operation.id
+
+
+class DedupStats(NamedTuple):
+    lookups: int
+    duplicates: int
+    cache_hits: int
+
+    def __str__(self) -> str:
+        duplicate_rate = self.duplicates / self.lookups if self.lookups else 0.0
+        cache_hit_rate = self.cache_hits / self.duplicates if self.duplicates else 0.0
+        return (
+            f"{self.lookups} messages checked, {self.duplicates} duplicates "
+            f"({duplicate_rate:.1%}), {cache_hit_rate:.1%} of them found in the cache"
+        )
+
+
+class ProcessedMessages:
+    """The messages applied within the last `pubsub_dedup_retention` seconds"""
+
+    def __init__(self, config: Optional[Config] = None):
+        if config is None:
+            config = get_config()
+        self.config = config
+        self.logger = config.logger
+        self._cache: LRUCache[bool] = LRUCache(
+            config.pubsub_dedup_cache_size, config.pubsub_dedup_retention
+        )
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._duplicates = 0
+        self._cache_hits = 0
+
+    def is_processed(self, key: Optional[MessageKey]) -> bool:
+        """Whether the message with this key was applied already"""
+        if key is None:
+            return False
+        cached = self._cache.get(key) is not None
+        processed = (
+            cached
+            or get_connection_manager(self.config)
+            .reader()
+            .execute(SELECT_PROCESSED_MESSAGE, key)
+            .fetchone()
+            is not None
+        )
+        if processed and not cached:
+            self._cache.put(key, True)
+        with self._lock:
+            self._lookups += 1
+            self._duplicates += processed
+            self._cache_hits += cached
+        return processed
+
+    def record(self, trans: Transaction, key: Optional[MessageKey]) -> bool:
+        """
+        Record, within a transaction, that the message with this key is applied. Returns False
+        if it was recorded already, in which case the message should not be applied again.
+        """
+        if key is None:
+            return True
+        trans.execute([Statement(INSERT_PROCESSED_MESSAGE, key)])
+        return trans.cursor.rowcount > 0
+
+    def remember(self, key: Optional[MessageKey]) -> None:
+        """Cache the key of a message, once the transaction that recorded it has committed"""
+        if key is not None:
+            self._cache.put(key, True)
+
+    def stats(self) -> DedupStats:
+        with self._lock:
+            return DedupStats(self._lookups, self._duplicates, self._cache_hits)
+
+    def remove_expired(self, batch_size: Optional[int] = None) -> int:
+        """Delete the records older than the retention period. Returns the number deleted."""
+        if batch_size is None:
+            batch_size = self.config.trim_db_batch_size
+        conn = get_connection_manager(self.config).reader()
+        cutoff = conn.execute(
+            "SELECT DATETIME('now', '-' || ? || ' seconds')",
+            (self.config.pubsub_dedup_retention,),
+        ).fetchone()[0]
+
+        deleted_count = 0
+        while True:
+            with Transaction(self.config) as trans:
+                trans.execute([Statement(DELETE_EXPIRED_PROCESSED_MESSAGES, [cutoff, batch_size])])
+                deleted = trans.cursor.rowcount
+            deleted_count += deleted
+            if deleted < batch_size:
+                return deleted_count
@@ -0,0 +1,149 @@
+"""
+Reconciles the machines in the database with their instance groups.
+
+The audit-log entries that Pub/Sub delivers arrive through a log sink, which adds latency, and
+stop arriving without any error when the sink is misconfigured. The reconciler periodically
+lists the managed instances of each instance group that has live machines, and moves each machine
+forward to the state that its current action and status show. It also picks up the IPs of
+running instances. It can be the monitor's only source of events, or repair the drift of the
+Pub/Sub events. As the only source, it also labels the instances that it sees running, from
+the metadata of their per-instance configs, which the Pub/Sub monitor does once it applies the
+creation of the instances.
+"""
+
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Optional
+
+from gce_provider.config import Config, get_config
+from gce_provider.db.gce_helpers import fetch_instances_bulk, fetch_managed_instances
+from gce_provider.db.machines import MachineDao
+from gce_provider.utils.constants import EventSource, MachineState
+from gce_provider.utils.instances import set_instance_labels
+from gce_provider.utils.scheduler import PeriodicTask
+
+if TYPE_CHECKING:
+    import google.cloud.compute_v1 as compute
+
+CREATING_ACTIONS = frozenset({"CREATING", "CREATING_WITHOUT_RETRIES", "VERIFYING"})
+CREATING_STATUSES = frozenset({"PROVISIONING", "STAGING"})
+DELETING_ACTIONS = frozenset({"DELETING", "ABANDONING"})
+
+
+def observed_state(managed_instance: "compute.ManagedInstance") -> Optional[MachineState]:
+    """The machine state that a managed instance's current action and status show, if any"""
+    if managed_instance.current_action in DELETING_ACTIONS:
+        return MachineState.DELETE_REQUESTED
+    if managed_instance.instance_status == "RUNNING":
+        return MachineState.INSERTED
+    if (
+        managed_instance.current_action in CREATING_ACTIONS
+        or managed_instance.instance_status in CREATING_STATUSES
+    ):
+        return MachineState.CREATED
+    return None
+
+
+def _labelled_instance(
+    machine_name: str, managed_instance: "compute.ManagedInstance"
+) -> SimpleNamespace:
+    """The instance, with the metadata of its per-instance config, as set_instance_labels expects"""
+    preserved_state = managed_instance.preserved_state_from_config
+    metadata = preserved_state.metadata if preserved_state else {}
+    return SimpleNamespace(
+        name=machine_name,
+        preservedState=SimpleNamespace(
+            metadatas=[SimpleNamespace(key=key, value=value) for key, value in metadata.items()]
+        ),
+    )
+
+
+def reconcile(config: Optional[Config] = None) -> int:
+    """
+    Apply the states and IPs observed in the instance groups of the live machines.
+    Returns the number of state changes and IPs applied.
+    """
+    if config is None:
+        config = get_config()
+    logger = config.logger
+
+    dao = MachineDao(config)
+    machine_states: dict[str, MachineState] = {}
+    instances = []
+    # without Pub/Sub, nothing else labels the instances
+    label_instances = config.event_source == EventSource.RECONCILER
+    to_label: dict[str, list[SimpleNamespace]] = defaultdict(list)
+    groups = dao.get_live_machines()
+    for (zone, instance_group_manager), machines in groups.items():
+        try:
+            managed_instances = fetch_managed_instances(
+                config.gcp_project_id, zone, instance_group_manager
+            )
+        except Exception as e:
+            # nothing is concluded from a group that could not be listed
+            logger.warning(f"Could not list the instances of {instance_group_manager}: {e}")
+            continue
+        managed_instances_by_name = {
+            managed_instance.name or managed_instance.instance.rsplit("/", 1)[-1]: (
+                managed_instance
+            )
+            for managed_instance in managed_instances
+        }
+
+        missing_ip = []
+        for machine_name, machine_state, internal_ip in machines:
+            managed_instance = managed_instances_by_name.get(machine_name)
+            if managed_instance is None:
+                # a machine that was created, and is no longer in its group, is gone; one that
+                # was only requested may not be listed yet
+                if machine_state >= MachineState.CREATED.value:
+                    machine_states[machine_name] = MachineState.DELETED
+                continue
+            state = observed_state(managed_instance)
+            if state is None or state.value < machine_state:
+                continue
+            if state.value > machine_state:
+                machine_states[machine_name] = state
+                if state == MachineState.INSERTED and label_instances:
+                    to_label[zone].append(_labelled_instance(machine_name, managed_instance))
+            if state == MachineState.INSERTED and internal_ip is None:
+                missing_ip.append(machine_name)
+
+        if missing_ip:
+            try:
+                instances.extend(
+                    instance
+                    for instance in fetch_instances_bulk(config.gcp_project_id, zone, missing_ip)
+                    if instance.network_interfaces and instance.network_interfaces[0].network_i_p
+                )
+            except Exception as e:
+                logger.warning(f"Could not list the instances in zone {zone}: {e}")
+
+    dao.apply_reconciled_states(machine_states, instances)
+    for zone, zone_instances in to_label.items():
+        failed_instances = set_instance_labels(zone_instances, zone, config)
+        if failed_instances:
+            logger.warning(
+                f"Failed to set labels for instance(s): {', '.join(failed_instances)}"
+            )
+    logger.info(
+        f"Reconciled {len(groups)} instance group(s): {len(machine_states)} state change(s), "
+        f"{len(instances)} IP(s)"
+    )
+    return len(machine_states) + len(instances)
+
+
+def background_reconciler(config: Optional[Config] = None) -> PeriodicTask:
+    """
+    Create a task that reconciles the machines every `reconcile_interval` seconds, unless the
+    event source is Pub/Sub alone
+    """
+    if config is None:
+        config = get_config()
+
+    return PeriodicTask(
+        "reconciler",
+        config.reconcile_interval if config.event_source != EventSource.PUBSUB else 0,
+        lambda: reconcile(config),
+        config.logger,
+    )
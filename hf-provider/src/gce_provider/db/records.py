@@ -0,0 +1,116 @@
+"""
+Lightweight records for rows read from the provider database.
+
+Rows were validated when they were written, so they are not validated again on the way out:
+a record is a plain `__slots__` object, and timestamps are only parsed when they are accessed.
+Pydantic validation applies at the HostFactory JSON boundary instead.
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Optional, Union
+
+from gce_provider.utils.constants import MachineResult, MachineStatus
+
+# the columns of the machine_records view, in view order
+MACHINE_COLUMNS = (
+    "machine_name",
+    "request_id",
+    "gcp_zone",
+    "instance_group_manager",
+    "machine_state",
+    "operation_id",
+    "return_request_id",
+    "delete_operation_request_id",
+    "delete_operation_id",
+    "delete_grace_period",
+    "internal_ip",
+    "external_ip",
+    "created_at",
+    "updated_at",
+)
+
+
+def _to_datetime(value: Union[str, datetime, None]) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class MachineRecord:
+    """A row of the machines table. Exposes the same attributes as HfMachineStatus."""
+
+    __slots__ = (
+        "machine_name",
+        "request_id",
+        "gcp_zone",
+        "instance_group_manager",
+        "machine_state",
+        "operation_id",
+        "return_request_id",
+        "delete_operation_request_id",
+        "delete_operation_id",
+        "delete_grace_period",
+        "internal_ip",
+        "external_ip",
+        "_created_at",
+        "_updated_at",
+        "hf_machine_status",
+        "hf_machine_result",
+    )
+
+    def __init__(
+        self,
+        machine_name: str,
+        request_id: str,
+        gcp_zone: str,
+        instance_group_manager: str,
+        machine_state: int,
+        operation_id: str,
+        return_request_id: Optional[str] = None,
+        delete_operation_request_id: Optional[str] = None,
+        delete_operation_id: Optional[str] = None,
+        delete_grace_period: Optional[int] = None,
+        internal_ip: Optional[str] = None,
+        external_ip: Optional[str] = None,
+        created_at: Union[str, datetime, None] = None,
+        updated_at: Union[str, datetime, None] = None,
+    ):
+        self.machine_name = machine_name
+        self.request_id = request_id
+        self.gcp_zone = gcp_zone
+        self.instance_group_manager = instance_group_manager
+        self.machine_state = machine_state
+        self.operation_id = operation_id
+        self.return_request_id = return_request_id
+        self.delete_operation_request_id = delete_operation_request_id
+        self.delete_operation_id = delete_operation_id
+        self.delete_grace_period = delete_grace_period
+        self.internal_ip = internal_ip
+        self.external_ip = external_ip
+        # raw SQLite timestamp text, until first accessed
+        self._created_at = created_at
+        self._updated_at = updated_at
+        self.hf_machine_status: Optional[MachineStatus] = None
+        self.hf_machine_result: Optional[MachineResult] = None
+
+    @classmethod
+    def from_row(cls, row: Union[tuple, sqlite3.Row]) -> "MachineRecord":
+        """Build a record from a row holding the MACHINE_COLUMNS, in order"""
+        return cls(*row)
+
+    @property
+    def created_at(self) -> Optional[datetime]:
+        self._created_at = _to_datetime(self._created_at)
+        return self._created_at
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        self._updated_at = _to_datetime(self._updated_at)
+        return self._updated_at
+
+    def __repr__(self) -> str:
+        return (
+            f"MachineRecord(machine_name={self.machine_name!r}, "
+            f"request_id={self.request_id!r}, machine_state={self.machine_state!r})"
+        )
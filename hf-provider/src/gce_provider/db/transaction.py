@@ -1,8 +1,13 @@
 import sqlite3
+import threading
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 from typing import Any, List, Optional, Union
 
 from gce_provider.config import Config, get_config
+from gce_provider.db.connection import get_connection_manager
+
+# the number of transactions open on each thread, per database
+_open_transactions = threading.local()
 
 
 class Statement:
@@ -18,7 +23,13 @@ class Statement:
 
 
 class Transaction:
-    """Automates the process of executing a database transaction"""
+    """
+    Automates the process of executing a database transaction.
+
+    A transaction opened while another is open on the same thread and database runs as a
+    savepoint of the outer transaction: its statements are committed with the outer
+    transaction, and if it fails, only its own statements are rolled back.
+    """
 
     def __init__(self, config: Optional[Config] = None, timeout: float = 30.0):
         if config is None:
@@ -29,28 +40,58 @@ class Transaction:
         self.logger = config.logger
         self.connection: Optional[sqlite3.Connection] = None
         self.cursor: Optional[sqlite3.Cursor] = None
+        self.savepoint: Optional[str] = None
+
+    def _depths(self) -> dict[str, int]:
+        if not hasattr(_open_transactions, "depths"):
+            _open_transactions.depths = {}
+        return _open_transactions.depths
 
     def __enter__(self):
-        # set up a connection & a transaction
-        self.connection = sqlite3.connect(
-            self.config.db_path, timeout=self.timeout, check_same_thread=False
-        )
+        # reuse this thread's cached connection & set up a transaction
+        self.connection = get_connection_manager(self.config).writer()
+        depths = self._depths()
+        depth = depths.get(self.config.db_path, 0)
+        if depth > 0:
+            self.cursor = self.connection.cursor()
+            self.savepoint = f"nested_{depth}"
+            self.cursor.execute(f"SAVEPOINT {self.savepoint}")
+            depths[self.config.db_path] = depth + 1
+            return self
+
+        if self.connection.in_transaction:
+            # a failed commit may have left the previous transaction open
+            self.connection.rollback()
 
         self.connection.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)};")
 
         self.cursor = self.connection.cursor()
-        self.cursor.execute("BEGIN")
+        # take the write lock up front, so that the transaction never has to upgrade
+        # a read snapshot that a concurrent writer has already invalidated
+        self.cursor.execute("BEGIN IMMEDIATE")
+        depths[self.config.db_path] = 1
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        # commit or rollback the transaction
+        depths = self._depths()
+        depths[self.config.db_path] -= 1
+        if self.savepoint is not None:
+            try:
+                if exc_type is not None:
+                    self.cursor.execute(f"ROLLBACK TO {self.savepoint}")
+                self.cursor.execute(f"RELEASE {self.savepoint}")
+            finally:
+                self.cursor.close()
+            return
+
+        # commit or rollback the transaction; the connection stays cached for reuse
         try:
             if exc_type is None:
                 self.connection.commit()
             else:
                 self.connection.rollback()
         finally:
-            self.connection.close()
+            self.cursor.close()
 
     def _retryable(self, fn, *args, **kwargs):
         try:
@@ -0,0 +1,91 @@
+"""
+Keeps the provider database proportional to live capacity.
+
+Returned machines are moved to the `machines_archive` table shortly after they were deleted,
+and both tables are trimmed once rows expire, along with the records of processed Pub/Sub
+messages. Rows are deleted in small batches through the partial index on deleted machines, so
+that each batch holds the write lock only briefly. The database uses incremental auto-vacuum,
+so the pages freed by the trim are then returned to the file system with
+`PRAGMA incremental_vacuum`.
+"""
+
+import sqlite3
+import time
+from typing import Optional
+
+from gce_provider.config import Config, get_config
+from gce_provider.db.connection import get_connection_manager
+from gce_provider.db.machines import MachineDao
+from gce_provider.db.migrations import complete_pending_vacuum
+from gce_provider.db.processed_messages import ProcessedMessages
+from gce_provider.model.models import TrimReport
+from gce_provider.utils.scheduler import PeriodicTask
+
+
+def _database_size(conn: sqlite3.Connection) -> int:
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+
+def trim_db(config: Optional[Config] = None, vacuum: bool = False) -> TrimReport:
+    """
+    Delete the expired machine rows, and release the freed pages. With `vacuum`, as for the
+    trimDB command, first run the one-time VACUUM that a migration left pending; the periodic
+    trim never does, as it would hold the write lock for as long as the VACUUM takes.
+    """
+    if config is None:
+        config = get_config()
+
+    start = time.monotonic()
+    conn = get_connection_manager(config).writer()
+    if vacuum:
+        complete_pending_vacuum(conn, config.logger)
+    size_before = _database_size(conn)
+
+    rows_deleted = MachineDao(config).remove_expired_returned_machines()
+    rows_deleted += ProcessedMessages(config).remove_expired()
+    if rows_deleted:
+        # the pragma frees one page per result row, so it must be stepped to completion
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    report = TrimReport(
+        rowsDeleted=rows_deleted,
+        durationSeconds=round(time.monotonic() - start, 3),
+        bytesReclaimed=max(0, size_before - _database_size(conn)),
+    )
+    config.logger.info(
+        f"Trimmed the database: {report.rowsDeleted} rows deleted, "
+        f"{report.bytesReclaimed} bytes reclaimed in {report.durationSeconds}s"
+    )
+    return report
+
+
+def background_trim(config: Optional[Config] = None) -> PeriodicTask:
+    """
+    Create a task that trims the database every `trim_db_interval` seconds, unless
+    `auto_run_trim_db` is disabled
+    """
+    if config is None:
+        config = get_config()
+
+    return PeriodicTask(
+        "db-trim",
+        config.trim_db_interval if config.auto_run_trim_db else 0,
+        lambda: trim_db(config),
+        config.logger,
+    )
+
+
+def background_archive(config: Optional[Config] = None) -> PeriodicTask:
+    """Create a task that archives returned machines every `db_archive_interval` seconds"""
+    if config is None:
+        config = get_config()
+    dao = MachineDao(config)
+
+    return PeriodicTask(
+        "db-archive",
+        config.db_archive_interval,
+        dao.archive_returned_machines,
+        config.logger,
+    )
@@ -1,10 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Optional
 
 from pydantic import BaseModel, Field
 
 from common.model.models import HFRequestMachines
-from gce_provider.utils.constants import MachineResult, MachineStatus
+from gce_provider.utils.constants import MachineResult, MachineStatus, RequestStatus
 
 
 class HFGceRequestMachines(HFRequestMachines):
@@ -86,3 +86,51 @@ class HfMachineStatus(HfMachine):
         default=None,
         description="The machine result, in the context of a getRequestStatus request",
     )
+
+
+class RequestStateCounts(BaseModel):
+    request_id: str = Field(..., description="(mandatory) The ID of the request")
+    is_return_request: bool = Field(
+        default=False, description="Whether the request is a return request"
+    )
+    machine_counts: dict[int, int] = Field(
+        default_factory=dict, description="The number of machines in each machine state"
+    )
+    missing_ip_counts: dict[int, int] = Field(
+        default_factory=dict,
+        description="The number of machines in each machine state without an internal IP",
+    )
+
+    def add(self, machine_state: int, count: int, missing_ip_count: int) -> None:
+        self.machine_counts[machine_state] = self.machine_counts.get(machine_state, 0) + count
+        self.missing_ip_counts[machine_state] = (
+            self.missing_ip_counts.get(machine_state, 0) + missing_ip_count
+        )
+
+    @classmethod
+    def from_machines(
+        cls, request_id: str, machines: Iterable[HfMachine], is_return_request: bool = False
+    ) -> "RequestStateCounts":
+        """Count machines that have already been loaded"""
+        counts = cls(request_id=request_id, is_return_request=is_return_request)
+        for machine in machines:
+            counts.add(machine.machine_state, 1, int(machine.internal_ip is None))
+        return counts
+
+
+class RequestStatusSummary(RequestStateCounts):
+    status: RequestStatus = Field(..., description="(mandatory) The HostFactory request status")
+    ip_ready_count: int = Field(
+        default=0, description="The number of machines with an internal IP"
+    )
+    updated_at: Optional[datetime] = Field(
+        default=None, description="The timestamp the summary last changed"
+    )
+
+
+class TrimReport(BaseModel):
+    rowsDeleted: int = Field(..., description="The number of expired machine rows deleted")
+    durationSeconds: float = Field(..., description="The time taken by the trim, in seconds")
+    bytesReclaimed: int = Field(
+        ..., description="The number of bytes released from the database file"
+    )
@@ -1,49 +1,281 @@
-import json
+import logging
 import os
+import queue
 import subprocess
 import sys
-from concurrent.futures import TimeoutError
-from pprint import pprint
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
-import google.cloud.pubsub_v1 as pubsub
-
-from gce_provider.config import get_config
+from gce_provider.config import Config, get_config
+from gce_provider.db.connection import background_checkpoint
+from gce_provider.db.health import background_integrity_check
+from gce_provider.db.ip_resolver import background_ip_resolver
 from gce_provider.db.machines import MachineDao
+from gce_provider.db.pending_tasks import PendingTask, PendingTasks
+from gce_provider.db.processed_messages import ProcessedMessages, message_key
+from gce_provider.db.reconciler import background_reconciler
+from gce_provider.db.transaction import Transaction
+from gce_provider.db.trim import background_archive, background_trim
 from gce_provider.utils import client_factory
-from gce_provider.utils.model_utils import to_simple_namespace
-from gce_provider.utils.process_lock import LockManager, LockManagerError
+from gce_provider.utils.audit_log import decode_entry
+from gce_provider.utils.constants import EventSource
+from gce_provider.utils.process_lock import LockManager, LockManagerError, is_locked
+from gce_provider.utils.scheduler import PeriodicTask
+from gce_provider.utils.work_queue import KeyedWorkQueue
+
+if TYPE_CHECKING:
+    import google.cloud.pubsub_v1 as pubsub
 
 
 # Documentation at https://cloud.google.com/pubsub/docs/publish-receive-messages-client-library
 
+# the delays before a supervised listener is restarted, and the run after which it is healthy
+SUPERVISOR_MIN_BACKOFF_SECONDS = 1
+SUPERVISOR_MAX_BACKOFF_SECONDS = 300
+SUPERVISOR_HEALTHY_RUN_SECONDS = 600
 
-def callback(message: pubsub.subscriber.message.Message) -> None:
-    config = get_config()
-    logger = config.logger
-    logger.debug(f"Received message:\n{pprint(message)}\n")
 
-    try:
-        data_bytes = message.data.decode("utf-8")
-        data_json = json.loads(data_bytes)
-        logger.debug(f"Message data:\n{json.dumps(data_json)}\n\n")
-        message_obj = to_simple_namespace(data_json)
-        hf_callback = MachineDao(config).update_machine_state(message_obj)
-
-        message.ack()
-        if hf_callback is not None:
-            logger.info(f"Invoking HF callback {hf_callback}")
+class MessageBatcher:
+    """
+    Applies Pub/Sub messages in batches, each within a single database transaction.
+
+    The subscriber calls `submit` from its own threads. One worker thread collects up to
+    `pubsub_batch_max_messages` messages, or those that arrive within
+    `pubsub_batch_max_latency_ms` of the first, applies them, and acknowledges them once the
+    transaction has committed. A message that fails is rolled back on its own and is not
+    acknowledged, so that Pub/Sub redelivers it.
+
+    The post-processing that a message may need once it is acknowledged, such as waiting for
+    the IPs of new instances, runs on a bounded pool of `post_ack_workers` threads. The work is
+    keyed by operation ID, so that redelivered messages do not repeat work that is pending. The
+    work is stored as a pending task before its message is acknowledged, and a task that needs
+    another attempt is retried when it is due, also by the next monitor after a restart.
+
+    Messages that were applied already, and are redelivered, are acknowledged without any work.
+    """
+
+    def __init__(self, config: Optional[Config] = None):
+        if config is None:
+            config = get_config()
+        self.config = config
+        self.logger = config.logger
+        self.max_messages = max(1, config.pubsub_batch_max_messages)
+        self.max_latency_seconds = max(0, config.pubsub_batch_max_latency_ms) / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.post_ack = KeyedWorkQueue(
+            "post-ack", config.post_ack_workers, config.post_ack_max_pending, self.logger
+        )
+        self.processed = ProcessedMessages(config)
+        self.pending_tasks = PendingTasks(config)
+        self._pending_task_sweep = PeriodicTask(
+            "pending-tasks", config.pending_task_interval, self.resume_pending_tasks, self.logger
+        )
+        self._post_ack_stats = PeriodicTask(
+            "post-ack-stats", config.post_ack_stats_interval, self._log_stats, self.logger
+        )
+
+    def _log_stats(self) -> None:
+        self.logger.info(f"Post-ack work queue: {self.post_ack.stats()}")
+        self.logger.info(f"Message deduplication: {self.processed.stats()}")
+
+    def submit(self, message: "pubsub.subscriber.message.Message") -> None:
+        """Decode a message, and queue it for the next batch"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Received message:\n{message}\n{message.data.decode('utf-8')}\n")
+        try:
+            message_obj = decode_entry(message.data)
+        except Exception as e:
+            self.logger.error(f"Error decoding message {message.message_id}: {e}")
+            return
+        if message_obj is None:
+            # an operation that the monitor does not act on
+            message.ack()
+            return
+        if self.processed.is_processed(message_key(message_obj)):
+            self.logger.debug(f"Acknowledging redelivered message {message.message_id}")
+            message.ack()
+            return
+        self._queue.put((message, message_obj))
+
+    def _next_batch(self) -> list[tuple[Any, SimpleNamespace]]:
+        """Wait briefly for a first message, then collect the rest of its batch"""
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_latency_seconds
+        while len(batch) < self.max_messages:
+            try:
+                batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def apply(self, batch: list[tuple[Any, SimpleNamespace]]) -> None:
+        """Apply a batch of messages in one transaction, then acknowledge them"""
+        dao = MachineDao(self.config)
+        applied: list[tuple[Any, SimpleNamespace, Optional[Callable]]] = []
+        duplicates = []
+        failed = []
+        try:
+            with dao.batch():
+                for message, message_obj in batch:
+                    try:
+                        # a savepoint, so that a failed message does not fail its batch
+                        with Transaction(self.config) as trans:
+                            if not self.processed.record(trans, message_key(message_obj)):
+                                # redelivered while the first delivery was queued
+                                duplicates.append(message)
+                                continue
+                            hf_callback = dao.update_machine_state(message_obj)
+                            if hf_callback is not None:
+                                self.pending_tasks.add(
+                                    trans,
+                                    message_obj.operation.id,
+                                    hf_callback.__name__,
+                                    message.data.decode("utf-8"),
+                                )
+                        applied.append((message, message_obj, hf_callback))
+                    except Exception as e:
+                        self.logger.error(f"Error handling message {message.message_id}: {e}")
+                        failed.append(message)
+        except Exception as e:
+            self.logger.error(f"Error committing a batch of {len(batch)} messages: {e}")
+            for message, _ in batch:
+                message.nack()
+            return
+
+        for message in failed:
+            message.nack()
+        for message in duplicates:
+            message.ack()
+        for message, message_obj, hf_callback in applied:
+            self.processed.remember(message_key(message_obj))
+            message.ack()
+            if hf_callback is not None:
+                operation_id = message_obj.operation.id
+                task = PendingTask(operation_id, hf_callback.__name__, "", 0)
+                self.post_ack.submit(operation_id, self._run_task, task, hf_callback, message_obj)
+        self.logger.debug(f"Applied a batch of {len(applied)} of {len(batch)} messages")
+
+    def _run_task(
+        self, task: PendingTask, hf_callback: Callable, message_obj: SimpleNamespace
+    ) -> None:
+        """Attempt a pending task, then delete it, or schedule its next attempt"""
+        self.logger.info(f"Invoking HF callback {task.task} for operation {task.operation_id}")
+        try:
             hf_callback(message_obj)
-            logger.info(f"HF Callback {hf_callback} completed.")
-    except Exception as e:
-        logger.error("Error handling HF callback", e)
+        except Exception as e:
+            self.logger.info(f"HF callback {task.task} will be retried: {e}")
+            self.pending_tasks.reschedule(task)
+            return
+        self.pending_tasks.complete(task.operation_id)
+        self.logger.info(f"HF Callback {task.task} completed.")
+
+    def resume_pending_tasks(self) -> int:
+        """Queue the pending tasks that are due. Returns the number of tasks queued."""
+        dao = MachineDao(self.config)
+        queued = 0
+        for task in self.pending_tasks.due(self.post_ack.max_pending):
+            message_obj = decode_entry(task.payload)
+            # only the callbacks that update_machine_state returns are stored
+            hf_callback = (
+                getattr(dao, task.task, None)
+                if message_obj is not None and task.task.endswith("_callback")
+                else None
+            )
+            if hf_callback is None:
+                self.logger.error(f"Dropping unknown task {task.task} for {task.operation_id}")
+                self.pending_tasks.complete(task.operation_id)
+                continue
+            queued += self.post_ack.submit(
+                task.operation_id, self._run_task, task, hf_callback, message_obj
+            )
+        return queued
+
+    def _run(self) -> None:
+        # after a stop, drain the messages that were already queued
+        while not self._stopped.is_set() or not self._queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self.apply(batch)
 
-    return
+    def start(self) -> "MessageBatcher":
+        if self._thread is None:
+            self.post_ack.start()
+            # the work that the previous monitor left, before any new work
+            self.resume_pending_tasks()
+            self._pending_task_sweep.start()
+            self._post_ack_stats.start()
+            self._thread = threading.Thread(target=self._run, name="pubsub-batcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # the work that is not running yet is stored, and the next monitor resumes it
+        self._pending_task_sweep.stop()
+        self.post_ack.stop(drain=False)
+        self._post_ack_stats.stop()
+
+    def __enter__(self) -> "MessageBatcher":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+
+def subscribe(
+    subscriber: "pubsub.SubscriberClient",
+    subscription_path: str,
+    callback: Callable[["pubsub.subscriber.message.Message"], None],
+    config: Config,
+) -> list["pubsub.subscriber.futures.StreamingPullFuture"]:
+    """
+    Open `pubsub_streams` streaming pulls on the subscription. Each stream leases at most
+    `pubsub_max_outstanding_messages` messages and `pubsub_max_outstanding_bytes` bytes at a
+    time, and runs the callback on its own pool of `pubsub_callback_threads` threads.
+    """
+    from google.cloud.pubsub_v1 import types
+    from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+
+    flow_control = types.FlowControl(
+        max_messages=config.pubsub_max_outstanding_messages,
+        max_bytes=config.pubsub_max_outstanding_bytes,
+    )
+    return [
+        subscriber.subscribe(
+            subscription_path,
+            callback=callback,
+            flow_control=flow_control,
+            # a scheduler is shut down with its stream, so streams cannot share one
+            scheduler=ThreadScheduler(
+                executor=ThreadPoolExecutor(
+                    max_workers=config.pubsub_callback_threads,
+                    thread_name_prefix=f"pubsub-stream-{stream}",
+                )
+            ),
+        )
+        for stream in range(max(1, config.pubsub_streams))
+    ]
 
 
 def launch_pubsub_daemon():
     config = get_config()
     logger = config.logger
-    logger.info("Launching or refreshing pubsub daemon")
+    if is_locked(config.pubsub_lockfile, logger):
+        logger.debug("The pubsub daemon is running")
+        return
+    logger.info("Launching pubsub daemon")
 
     if getattr(sys, "frozen", False):
         # When running in a PyInstaller bundle, we need to invoke the hf-monitor binary. This should be in the same
@@ -74,6 +306,81 @@ def launch_pubsub_daemon():
         )
 
 
+def run_monitor(config: Config, pubsub_timeout: Optional[float] = None) -> None:
+    """Listen for messages until the timeout, or until a stream ends"""
+    logger = config.logger
+
+    # database maintenance runs alongside the listener
+    checkpoint = background_checkpoint(config)
+    integrity_check = background_integrity_check(config)
+    archive, trim = background_archive(config), background_trim(config)
+    ip_resolver = background_ip_resolver(config)
+    reconciler = background_reconciler(config)
+    if config.event_source == EventSource.RECONCILER:
+        with checkpoint, integrity_check, archive, trim, ip_resolver, reconciler:
+            logger.info(
+                f"Reconciling the instance groups every {config.reconcile_interval} seconds ..."
+            )
+            if not threading.Event().wait(pubsub_timeout):
+                logger.info(f"Monitor reached timeout after {pubsub_timeout} seconds.")
+        return
+
+    batcher = MessageBatcher(config)
+    with checkpoint, integrity_check, archive, trim, ip_resolver, reconciler, batcher:
+        project_id = config.gcp_project_id or None
+        subscription_id = config.pubsub_subscription
+
+        subscriber = client_factory.pubsub_subscriber_client()
+        # The `subscription_path` method creates a fully qualified identifier
+        # in the form `projects/{project_id}/subscriptions/{subscription_id}`
+        subscription_path = subscriber.subscription_path(project_id, subscription_id)
+
+        streams = subscribe(subscriber, subscription_path, batcher.submit, config)
+        logger.info(
+            f"Listening for messages on {subscription_path} "
+            f"with {len(streams)} stream(s) ...\n"
+        )
+        if pubsub_timeout:
+            logger.info(f"Listener will timeout after {pubsub_timeout} seconds.\n")
+
+        # Wrap subscriber in a 'with' block to automatically call close() when done.
+        with subscriber:
+            # returns when the timeout is reached, or as soon as any stream ends
+            done, _ = wait(streams, timeout=pubsub_timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(
+                    f"Pubsub timer reached timeout after {pubsub_timeout} seconds. Shutting down."
+                )
+            for stream in streams:
+                stream.cancel()  # Trigger the shutdown.
+            for stream in streams:
+                stream.result()  # Block until the shutdown is complete.
+
+
+def supervise(
+    config: Config, run: Callable[[], None], sleep: Callable[[float], None] = time.sleep
+) -> None:
+    """
+    Keep running the monitor, restarting it whenever it stops or fails. The delay before a
+    restart doubles after each short run, up to `SUPERVISOR_MAX_BACKOFF_SECONDS`, and is reset
+    once the monitor has run for `SUPERVISOR_HEALTHY_RUN_SECONDS`.
+    """
+    logger = config.logger
+    backoff = SUPERVISOR_MIN_BACKOFF_SECONDS
+    while True:
+        started = time.monotonic()
+        try:
+            run()
+            logger.warning("The pubsub listener stopped")
+        except Exception as e:
+            logger.error(f"The pubsub listener failed: {e}")
+        if time.monotonic() - started >= SUPERVISOR_HEALTHY_RUN_SECONDS:
+            backoff = SUPERVISOR_MIN_BACKOFF_SECONDS
+        logger.info(f"Restarting the pubsub listener in {backoff} seconds")
+        sleep(backoff)
+        backoff = min(backoff * 2, SUPERVISOR_MAX_BACKOFF_SECONDS)
+
+
 def main():
     config = get_config()
     logger = config.logger
@@ -81,41 +388,19 @@ def main():
     # If we are auto-launching, we can timeout the listener because HostFactory will repeatedly call the script.
     # If this script is being manually launched, we do not want to set up a timeout because the sys admin
     # will want to control this on their own.
+    # A supervised listener is restarted rather than timed out.
 
-    if not config.pubsub_auto_launch:
+    if not config.pubsub_auto_launch or config.pubsub_supervise:
         pubsub_timeout = None
     else:
         pubsub_timeout = config.pubsub_timeout_seconds or None
 
     try:
         with LockManager(config.pubsub_lockfile):
-            project_id = config.gcp_project_id or None
-            subscription_id = config.pubsub_subscription
-
-            subscriber = client_factory.pubsub_subscriber_client()
-            # The `subscription_path` method creates a fully qualified identifier
-            # in the form `projects/{project_id}/subscriptions/{subscription_id}`
-            subscription_path = subscriber.subscription_path(
-                project_id, subscription_id
-            )
-
-            streaming_pull_future = subscriber.subscribe(
-                subscription_path, callback=callback
-            )
-            logger.info(f"Listening for messages on {subscription_path} ...\n")
-            if pubsub_timeout:
-                logger.info(f"Listener will timeout after {pubsub_timeout} seconds.\n")
-
-            # Wrap subscriber in a 'with' block to automatically call close() when done.
-            with subscriber:
-                try:
-                    streaming_pull_future.result(pubsub_timeout)
-                except TimeoutError:
-                    logger.info(
-                        f"Pubsub timer reached timeout after {pubsub_timeout} seconds. Shutting down."
-                    )
-                    streaming_pull_future.cancel()  # Trigger the shutdown.
-                    streaming_pull_future.result()  # Block until the shutdown is complete.
+            if config.pubsub_supervise:
+                supervise(config, lambda: run_monitor(config))
+            else:
+                run_monitor(config, pubsub_timeout)
     except LockManagerError as e:
         logger.info(f"pubsub process exits: {e}")
         sys.exit(1)
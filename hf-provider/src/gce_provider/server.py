@@ -0,0 +1,107 @@
+"""
+A long-lived provider server that executes HostFactory commands on behalf of `hf-gce-client`.
+
+Keeping the process alive means that the Google Cloud client libraries, the configuration,
+the database and the API clients are initialized once, rather than on every HostFactory poll.
+"""
+
+import os
+import signal
+import socketserver
+import threading
+from typing import Callable, Optional
+
+from gce_provider.client import SERVABLE_COMMANDS, decode_message, encode_message
+from gce_provider.config import Config
+from gce_provider.utils.process_lock import LockManager
+
+# executes a command, returning the process exit code and the text to print
+CommandRunner = Callable[[str, Optional[dict]], tuple[int, Optional[str]]]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection, which carries exactly one command"""
+
+    def handle(self):
+        server: ProviderServer = self.server  # type: ignore
+        logger = server.config.logger
+
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            request = decode_message(line)
+            command = request.get("command")
+            if command not in SERVABLE_COMMANDS:
+                raise ValueError(f"Command cannot be served: {command}")
+            exit_code, output = server.runner(command, request.get("payload"))
+        except Exception as e:
+            logger.error(f"Error serving request: {e}")
+            exit_code, output = 1, f"Error: {e}"
+
+        self.wfile.write(encode_message({"exit_code": exit_code, "output": output}))
+
+
+class ProviderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves provider commands over a local UNIX socket"""
+
+    daemon_threads = True
+
+    def __init__(self, config: Config, runner: CommandRunner):
+        self.config = config
+        self.runner = runner
+        socket_path = config.server_socket
+
+        # a stale socket from a previous server would prevent us from binding
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+
+        # only the HostFactory user should be able to submit commands
+        os.chmod(socket_path, 0o600)
+
+    def server_bind(self):
+        # the socket is created with the umask, so it is never accessible to others, not even
+        # until the chmod above
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.config.server_socket):
+            os.remove(self.config.server_socket)
+
+
+def serve(config: Config, runner: CommandRunner, warm_up: Optional[Callable[[], None]] = None):
+    """Run the provider server until it is interrupted or terminated"""
+    logger = config.logger
+
+    with LockManager(f"{config.server_socket}.lock"):
+        if warm_up is not None:
+            logger.info("Warming up the provider server")
+            try:
+                warm_up()
+            except Exception as e:
+                # commands will initialize whatever is still missing on demand
+                logger.warning(f"Provider server warm-up failed: {e}")
+
+        server = ProviderServer(config, runner)
+
+        def _shutdown(signum, _frame):
+            logger.info(f"Provider server received signal {signum}. Shutting down.")
+            # shutdown() blocks until serve_forever() returns, so it cannot run on this thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, _shutdown)
+
+        with server:
+            logger.info(f"Provider server listening on {config.server_socket}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                logger.info("Provider server interrupted. Shutting down.")
+        logger.info("Provider server stopped.")
@@ -0,0 +1,65 @@
+"""
+Decodes the audit-log entries that the event monitor receives from Pub/Sub.
+
+An entry holds much more than the monitor reads, and most entries are for operations that it
+ignores. The decoder checks the operation type on the parsed JSON first, and only builds objects
+for the fields that the handlers use. orjson parses the JSON when it is installed.
+"""
+
+import json
+from types import SimpleNamespace
+from typing import Any, Callable, Optional, Union
+
+from gce_provider.utils.constants import OperationType
+from gce_provider.utils.model_utils import to_simple_namespace
+
+try:
+    import orjson
+
+    loads: Callable[[Union[bytes, str]], Any] = orjson.loads
+except ImportError:
+    loads = json.loads
+
+HANDLED_OPERATION_TYPES = frozenset(operation_type.value for operation_type in OperationType)
+
+
+def operation_type(entry: dict) -> Optional[str]:
+    """Return the type of the operation that a parsed entry logs, if any"""
+    payload = entry.get("protoPayload")
+    response = payload.get("response") if isinstance(payload, dict) else None
+    return response.get("operationType") if isinstance(response, dict) else None
+
+
+def decode_entry(data: Union[bytes, str]) -> Optional[SimpleNamespace]:
+    """
+    Decode an audit-log entry into the objects that MachineDao.update_machine_state reads.
+    Returns None for an entry that the monitor does not act on.
+    """
+    entry = loads(data)
+    if not isinstance(entry, dict) or operation_type(entry) not in HANDLED_OPERATION_TYPES:
+        return None
+    operation = entry.get("operation")
+    if not isinstance(operation, dict) or "id" not in operation:
+        return None
+
+    payload = entry["protoPayload"]
+    response = payload["response"]
+    proto_payload = SimpleNamespace(
+        resourceName=payload.get("resourceName"),
+        response=SimpleNamespace(
+            operationType=response["operationType"], zone=response.get("zone")
+        ),
+    )
+    request = payload.get("request")
+    if isinstance(request, dict):
+        # the instances carry the metadata that becomes their labels
+        proto_payload.request = SimpleNamespace(
+            instances=to_simple_namespace(request.get("instances", []))
+        )
+
+    return SimpleNamespace(
+        insertId=entry.get("insertId"),
+        logName=entry.get("logName"),
+        operation=SimpleNamespace(id=operation["id"]),
+        protoPayload=proto_payload,
+    )
@@ -1,21 +1,24 @@
 import logging
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-
-import google.cloud.compute_v1 as compute
-import google.cloud.pubsub_v1 as pubsub
-from google.oauth2 import service_account
+from typing import TYPE_CHECKING, Optional
 
 from common.utils.file_utils import load_json_file
 from common.utils.path_utils import normalize_path
 from gce_provider.config import Config, get_config
 
+# The Google Cloud client libraries are slow to import, so they are only loaded
+# when a client is first requested
+if TYPE_CHECKING:
+    from google.oauth2 import service_account
+
 
 @lru_cache(maxsize=1)
 def get_credentials(
     config: Optional[Config] = None,
-) -> Optional[service_account.Credentials]:
+) -> Optional["service_account.Credentials"]:
+    from google.oauth2 import service_account
+
     if config is None:
         config = get_config()
 
@@ -42,19 +45,27 @@ def get_credentials(
 
 @lru_cache(maxsize=1)
 def instances_client(config: Optional[Config] = None):
+    import google.cloud.compute_v1 as compute
+
     return compute.InstancesClient(credentials=get_credentials(config))
 
 
 @lru_cache(maxsize=1)
 def instance_groups_client(config: Optional[Config] = None):
+    import google.cloud.compute_v1 as compute
+
     return compute.InstanceGroupsClient(credentials=get_credentials(config))
 
 
 @lru_cache(maxsize=1)
 def instance_group_managers_client(config: Optional[Config] = None):
+    import google.cloud.compute_v1 as compute
+
     return compute.InstanceGroupManagersClient(credentials=get_credentials(config))
 
 
 @lru_cache(maxsize=1)
 def pubsub_subscriber_client(config: Optional[Config] = None):
+    import google.cloud.pubsub_v1 as pubsub
+
     return pubsub.SubscriberClient(credentials=get_credentials(config))
@@ -32,3 +32,22 @@ class MachineStatus(Enum):
 
 class CommandNames(Enum):
     MONITOR_EVENTS = "monitorEvents"
+    SERVE_REQUESTS = "serveRequests"
+
+
+class EventSource(Enum):
+    """Where the event monitor learns about the changes to machines"""
+
+    PUBSUB = "pubsub"
+    RECONCILER = "reconciler"
+    BOTH = "both"
+
+
+class OperationType(Enum):
+    """The audit-logged operations that the event monitor acts on"""
+
+    CREATE_INSTANCES = "compute.instanceGroupManagers.createInstances"
+    INSERT = "insert"
+    DELETE_INSTANCES = "compute.instanceGroupManagers.deleteInstances"
+    DELETE = "delete"
+    PREEMPTED = "compute.instances.preempted"
@@ -1,11 +1,7 @@
 from types import SimpleNamespace
 from typing import Optional
-from google.cloud import compute_v1 as compute
-from google.cloud.compute_v1.types import (
-    InstancesSetLabelsRequest,
-    SetLabelsInstanceRequest,
-)
 from gce_provider.config import Config, get_config
+from gce_provider.db.gce_helpers import fetch_instances_bulk
 from gce_provider.utils.client_factory import instances_client
 
 
@@ -25,6 +21,11 @@ def set_instance_labels(
 
     returns: A list of instance names that failed to update
     """
+    from google.cloud.compute_v1.types import (
+        InstancesSetLabelsRequest,
+        SetLabelsInstanceRequest,
+    )
+
     if config is None:
         config = get_config()
 
@@ -43,14 +44,17 @@ def set_instance_labels(
         )
     ]
 
-    for name in instance_names:
+    if instance_names:
         try:
-            instance_map[name] = client.get(
-                project=config.gcp_project_id, zone=zone, instance=name
-            )
+            instance_map = {
+                instance.name: instance
+                for instance in fetch_instances_bulk(config.gcp_project_id, zone, instance_names)
+            }
         except Exception as e:
-            config.logger.error(f"Error fetching instance {name}: {e}")
-            failed_instances.append(name)
+            config.logger.error(f"Error fetching instances {', '.join(instance_names)}: {e}")
+        for name in instance_names:
+            if name not in instance_map:
+                failed_instances.append(name)
 
     for instance in instances:
         try:
@@ -1,39 +1,77 @@
+import fcntl
 import os
+from logging import Logger
+from typing import Optional, TextIO
 
 
 class LockManagerError(RuntimeError):
     pass
 
 
+def _assume_held(lockfile_path: str, error: OSError, logger: Optional[Logger]) -> bool:
+    if logger is not None:
+        logger.warning(f"Cannot check the lockfile {lockfile_path}, assuming it is held: {error}")
+    return True
+
+
+def is_locked(lockfile_path: str, logger: Optional[Logger] = None) -> bool:
+    """
+    Whether a process holds the lock, without taking it. This is cheap enough to run before
+    every command, and, unlike a PID check, is never fooled by a stale lockfile.
+    When the lockfile cannot be checked, for example because another user owns it, the lock is
+    assumed to be held: a process that cannot check the lockfile could not take it either.
+    """
+    try:
+        fd = os.open(lockfile_path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        return _assume_held(lockfile_path, e, logger)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except OSError as e:
+        return _assume_held(lockfile_path, e, logger)
+    finally:
+        # closing the file releases a lock that was taken
+        os.close(fd)
+    return False
+
+
 class LockManager:
+    """
+    Holds an exclusive `flock` on the lockfile while the context is open, and writes the PID
+    of the holder to it. The kernel releases the lock when the process exits, however it exits.
+    """
+
     def __init__(self, lockfile_path: str = None):
         self.lockfile_path = lockfile_path
+        self._file: Optional[TextIO] = None
 
     def __enter__(self):
-        # Check if lock file exists
         lockfile = self.lockfile_path
-        if os.path.exists(lockfile):
-            # Check if process is still running
-            with open(lockfile, "r") as f:
-                pid = f.read().strip()
-                try:
-                    os.kill(int(pid), 0)
-                except OSError:
-                    # Process is not running, remove lock file
-                    os.remove(lockfile)
-                else:
-                    # Process is still running, raise error
-                    message = f"Process is already running, see {lockfile}."
-                    raise LockManagerError(message)
-
-        # Create lock file
         try:
-            with open(lockfile, "w") as f:
-                f.write(str(os.getpid()))
+            f = open(lockfile, "a+")
         except Exception as e:
             raise LockManagerError() from e
 
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            message = f"Process is already running, see {lockfile}."
+            raise LockManagerError(message)
+
+        f.truncate(0)
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+
     def __exit__(self, exc_type, exc_value, traceback):
-        lockfile = self.lockfile_path
-        if os.path.exists(lockfile):
-            os.remove(lockfile)
+        # the file is left in place: removing it would let a process that opened it before the
+        # removal lock it at the same time as one that creates a new file
+        if self._file is not None:
+            self._file.truncate(0)
+            self._file.close()
+            self._file = None
@@ -0,0 +1,47 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+
+class PeriodicTask:
+    """Runs a function at a fixed interval on a daemon thread, until stopped"""
+
+    def __init__(
+        self,
+        name: str,
+        interval_seconds: float,
+        fn: Callable[[], object],
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.fn = fn
+        self.logger = logger or logging.getLogger(__name__)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                self.fn()
+            except Exception as e:
+                # a failed run must not end the schedule
+                self.logger.warning(f"Periodic task {self.name} failed: {e}")
+
+    def start(self) -> "PeriodicTask":
+        if self._thread is None and self.interval_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "PeriodicTask":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
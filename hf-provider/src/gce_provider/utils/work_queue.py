@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+
+class WorkQueueStats(NamedTuple):
+    pending: int
+    running: int
+    oldest_pending_seconds: float
+    completed: int
+    duplicates: int
+    mean_wait_seconds: float
+    mean_run_seconds: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.pending} pending, {self.running} running, "
+            f"oldest pending {self.oldest_pending_seconds:.1f}s, "
+            f"{self.completed} completed, {self.duplicates} duplicates dropped, "
+            f"mean wait {self.mean_wait_seconds:.1f}s, mean run {self.mean_run_seconds:.1f}s"
+        )
+
+
+class KeyedWorkQueue:
+    """
+    Runs work items on a fixed pool of daemon threads, in the order they were submitted.
+
+    Each item has a key, and an item whose key is already pending or running is dropped, so
+    duplicates collapse into one run. At most `max_pending` items wait at a time; `submit`
+    blocks while the queue is full, which holds back whoever produces the work.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        max_pending: int,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.logger = logger or logging.getLogger(__name__)
+        # key -> (submitted at, function, arguments)
+        self._pending: OrderedDict[Hashable, tuple[float, Callable, tuple]] = OrderedDict()
+        self._running: set[Hashable] = set()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._threads: list[threading.Thread] = []
+        self._completed = 0
+        self._duplicates = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def submit(self, key: Hashable, fn: Callable, *args: Any) -> bool:
+        """Queue fn(*args), unless an item with the same key is pending or running"""
+        with self._condition:
+            if self._is_duplicate(key):
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.logger.warning(f"{self.name}: queue is full, waiting: {self.stats()}")
+                self._condition.wait_for(
+                    lambda: len(self._pending) < self.max_pending or self._stopped
+                )
+                if self._is_duplicate(key):
+                    return False
+            self._pending[key] = (time.monotonic(), fn, args)
+            self._condition.notify_all()
+            return True
+
+    def _is_duplicate(self, key: Hashable) -> bool:
+        if key in self._pending or key in self._running:
+            self._duplicates += 1
+            self.logger.debug(f"{self.name}: dropped duplicate work for {key}")
+            return True
+        return False
+
+    def stats(self) -> WorkQueueStats:
+        with self._condition:
+            now = time.monotonic()
+            oldest = next(iter(self._pending.values()), None)
+            return WorkQueueStats(
+                pending=len(self._pending),
+                running=len(self._running),
+                oldest_pending_seconds=now - oldest[0] if oldest else 0.0,
+                completed=self._completed,
+                duplicates=self._duplicates,
+                mean_wait_seconds=self._total_wait / self._completed if self._completed else 0.0,
+                mean_run_seconds=self._total_run / self._completed if self._completed else 0.0,
+            )
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopped)
+                if not self._pending:
+                    return
+                key, (submitted_at, fn, args) = self._pending.popitem(last=False)
+                self._running.add(key)
+                self._condition.notify_all()
+
+            started_at = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                self.logger.error(f"{self.name}: work for {key} failed: {e}")
+            finally:
+                finished_at = time.monotonic()
+                with self._condition:
+                    self._running.discard(key)
+                    self._completed += 1
+                    self._total_wait += started_at - submitted_at
+                    self._total_run += finished_at - started_at
+
+    def start(self) -> "KeyedWorkQueue":
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def stop(self, wait: bool = True, drain: bool = True) -> None:
+        """
+        Stop the workers once the pending work is done, or, without `drain`, once the work that
+        is running is done, discarding the pending work
+        """
+        with self._condition:
+            self._stopped = True
+            if not drain:
+                self._pending.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def __enter__(self) -> "KeyedWorkQueue":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
@@ -1,27 +1,29 @@
-import argparse
-import json
-import os
 import sys
-from typing import Any, Dict, Optional
 
-from typing_extensions import Self
+from common.utils.profiling import PROFILE_STARTUP_FLAG, ImportProfiler
 
-from common.model.models import HFRequest
-from common.utils.file_utils import load_json_file, load_yaml_file
-from common.utils.path_utils import (
+# started before the other imports, which are most of the start-up time
+startup_profiler = ImportProfiler.for_command_line()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+from typing import Any, Dict, Optional  # noqa: E402
+
+from typing_extensions import Self  # noqa: E402
+
+from common.model.models import HFRequest  # noqa: E402
+from common.utils.file_utils import load_json_file, load_yaml_file  # noqa: E402
+from common.utils.path_utils import (  # noqa: E402
     normalize_path,
     resolve_caller_dir,
 )
-from common.utils.profiling import log_execution_time
-from common.utils.version import get_version
-from gke_provider.commands.get_request_machine_status import get_request_machine_status
-from gke_provider.commands.get_return_requests import get_return_requests
-from gke_provider.commands.request_machines import request_machines
-from gke_provider.commands.request_return_machines import request_return_machines
-from gke_provider.config import get_config
+from common.utils.profiling import log_execution_time  # noqa: E402
+from common.utils.version import get_version  # noqa: E402
+from gke_provider.config import get_config  # noqa: E402
 
-# Initialize configuration
-config = get_config()
+# Command modules, and the Kubernetes client library they depend on, are imported within
+# the command that needs them, and the configuration is only loaded once a command runs.
 
 
 class CommandNotFound(Exception):
@@ -47,7 +49,7 @@ valid_commands = ValidCommands(
 TEMPLATES_FILENAME = "gcpgkeinstprov_templates.json"
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def cmd_get_available_templates(
     payload: Optional[dict] = None,
 ) -> Optional[Dict]:
@@ -56,6 +58,7 @@ def cmd_get_available_templates(
     :param payload: optional payload
     :return: the templates JSON
     """
+    config = get_config()
     config.logger.info(f"cmd_get_available_templates; payload={payload}")
     config.logger.info(f"hf_provider_conf_dir: {config.hf_provider_conf_dir}")
     if not config.hf_provider_conf_dir or not os.path.isdir(
@@ -72,13 +75,16 @@ def cmd_get_available_templates(
         return None
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def cmd_request_machines(payload: Optional[dict] = None) -> Optional[dict]:
     """
     Execute the requestMachines command
     :param payload: the request payload
     :return: JSON response
     """
+    config = get_config()
+    from gke_provider.commands.request_machines import request_machines
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_request_machines {payload}")
@@ -131,7 +137,7 @@ def cmd_request_machines(payload: Optional[dict] = None) -> Optional[dict]:
     return None
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def cmd_request_return_machines(
     payload: Optional[dict] = None,
 ) -> Dict[str, Any]:
@@ -140,6 +146,9 @@ def cmd_request_return_machines(
     :param payload: the request payload
     :return: JSON response
     """
+    config = get_config()
+    from gke_provider.commands.request_return_machines import request_return_machines
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_request_return_remachines {payload}")
@@ -151,7 +160,7 @@ def cmd_request_return_machines(
     return request_return_machines(hf_request)
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def cmd_get_request_status(
     payload: Optional[dict] = None,
 ) -> Optional[Dict[str, Any]]:
@@ -160,6 +169,9 @@ def cmd_get_request_status(
     :param payload: the request payload
     :return: JSON response
     """
+    config = get_config()
+    from gke_provider.commands.get_request_machine_status import get_request_machine_status
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_get_request_status {payload}")
@@ -171,7 +183,7 @@ def cmd_get_request_status(
     return get_request_machine_status(hf_request)
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def cmd_get_request_machine_status(
     payload: Optional[dict],
 ) -> Optional[dict[str, Any]]:
@@ -180,6 +192,9 @@ def cmd_get_request_machine_status(
     :param payload: the request payload
     :return: JSON response
     """
+    config = get_config()
+    from gke_provider.commands.get_request_machine_status import get_request_machine_status
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_get_request_machine_status {payload}")
@@ -191,7 +206,7 @@ def cmd_get_request_machine_status(
     return get_request_machine_status(hf_request)
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def cmd_get_return_requests(
     payload: Optional[dict],
 ) -> Optional[dict[str, Any]]:
@@ -200,6 +215,9 @@ def cmd_get_return_requests(
     :param payload: the request payload
     :return: JSON response
     """
+    config = get_config()
+    from gke_provider.commands.get_return_requests import get_return_requests
+
     if payload is None:
         raise ValueError("Must specify a JSON template")
     config.logger.info(f"cmd_get_return_requests {payload}")
@@ -209,7 +227,7 @@ def cmd_get_return_requests(
     return get_return_requests(hf_request)
 
 
-@log_execution_time(config.logger)
+@log_execution_time(lambda: get_config().logger)
 def dispatch_command(command: str, payload: Optional[dict]):
     """
     Dispatch a command by executing the relevant service module
@@ -217,6 +235,7 @@ def dispatch_command(command: str, payload: Optional[dict]):
     :param payload: The JSON payload
     :return: The command's response
     """
+    config = get_config()
     config.logger.info(
         f"DISPATCHING|command: {command}; payload: {json.dumps(payload)}"
     )
@@ -251,11 +270,17 @@ def parse_args() -> tuple[str, Any]:
     parser.add_argument("json", nargs="?")
     parser.add_argument("-f", "--json-file")
 
+    parser.add_argument(
+        PROFILE_STARTUP_FLAG,
+        action="store_true",
+        help="Report the time spent importing modules for the command to stderr",
+    )
     parser.add_argument(
         "-v", "--version", action="version", version=f"%(prog)s {get_version()}"
     )
 
     args = parser.parse_args()
+    config = get_config()
     config.logger.debug(f"command is: {args.command}")
     config.logger.debug(f"json payload file is: {args.json_file}")
 
@@ -278,13 +303,19 @@ def parse_args() -> tuple[str, Any]:
 
 
 def main() -> int:
-    (command, payload) = parse_args()
+    profiler = startup_profiler
     try:
+        (command, payload) = parse_args()
         dispatch_command(command, payload)
         sys.exit(0)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            # stdout is reserved for the HostFactory response
+            print(profiler.report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
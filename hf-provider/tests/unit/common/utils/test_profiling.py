@@ -0,0 +1,66 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from common.utils.profiling import ImportProfiler
+
+SRC_DIR = Path(__file__).resolve().parents[4] / "src"
+
+
+def test_import_profiler_records_new_imports_only():
+    """Modules that are already loaded are not reported"""
+    sys.modules.pop("colorsys", None)
+
+    with ImportProfiler() as profiler:
+        import colorsys  # noqa: F401
+        import os  # noqa: F401
+
+    names = [name for name, *_ in profiler.records]
+    assert names == ["colorsys"]
+    assert profiler.elapsed > 0
+
+    report = profiler.report()
+    assert report.splitlines()[0] == "import time: self [us] | cumulative | imported package"
+    assert "startup: 1 modules imported" in report
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "gce_provider.__main__",
+        "gce_provider.client",
+        "gce_provider.commands.get_request_status",
+        "gce_provider.commands.get_return_requests",
+    ],
+)
+def test_hot_path_does_not_import_google_cloud(module):
+    """Polling commands must not pay for the Google Cloud client libraries at startup"""
+    script = (
+        f"import sys, {module}; "
+        "print(','.join(m for m in ('google.cloud.compute_v1', 'google.cloud.pubsub_v1', 'grpc') "
+        "if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
+
+
+@pytest.mark.parametrize("module", ["gce_provider", "gke_provider"])
+def test_profile_startup_covers_the_entry_point_imports(module):
+    """The profiler starts before the entry point imports its dependencies"""
+    result = subprocess.run(
+        [sys.executable, "-m", module, "--profile-startup", "--version"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+    )
+    imported = [line.split("|")[-1].strip() for line in result.stderr.splitlines()]
+    assert "pydantic" in imported or "common.model.models" in imported
+    assert result.stderr.splitlines()[-1].startswith("startup: ")
@@ -0,0 +1,197 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from common.model.models import HFRequestStatus
+from gce_provider.commands import get_request_status as get_request_status_module
+from gce_provider.commands.get_request_status import get_request_status, render_request_status
+from gce_provider.commands.helpers.request_machine_status_helper import (
+    RequestMachineStatusEvaluator,
+)
+from gce_provider.commands.helpers.request_return_machine_status_helper import (
+    RequestReturnMachineStatusEvaluator,
+)
+from gce_provider.db.machines import MachineDao
+from gce_provider.model.models import RequestStateCounts
+from gce_provider.utils.constants import RequestStatus
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.request_status_cache_size = 16
+        self.request_status_cache_ttl = 300
+
+
+@pytest.fixture(autouse=True)
+def empty_response_cache(monkeypatch):
+    monkeypatch.setattr(get_request_status_module, "_response_cache", None)
+
+
+def _counts(machine_counts: dict, missing_ip_counts: dict = None) -> RequestStateCounts:
+    return RequestStateCounts(
+        request_id="r1",
+        machine_counts=machine_counts,
+        missing_ip_counts=missing_ip_counts or {},
+    )
+
+
+@pytest.mark.parametrize(
+    "machine_counts, missing_ip_counts, expected",
+    [
+        ({}, {}, RequestStatus.complete),
+        ({250: 2}, {}, RequestStatus.complete),
+        ({250: 2}, {250: 1}, RequestStatus.running),
+        ({100: 1, 250: 1}, {}, RequestStatus.running),
+        ({250: 1, 400: 1}, {}, RequestStatus.complete_with_error),
+        # an executing machine takes precedence over a failed one
+        ({200: 1, 300: 1}, {200: 1}, RequestStatus.running),
+    ],
+)
+def test_request_status_from_counts(machine_counts, missing_ip_counts, expected):
+    counts = _counts(machine_counts, missing_ip_counts)
+    assert RequestMachineStatusEvaluator.evaluate_request_status_from_counts(counts) == expected
+
+
+@pytest.mark.parametrize(
+    "machine_counts, expected",
+    [
+        ({}, RequestStatus.complete),
+        ({400: 3}, RequestStatus.complete),
+        ({350: 1, 400: 2}, RequestStatus.running),
+    ],
+)
+def test_return_request_status_from_counts(machine_counts, expected):
+    counts = _counts(machine_counts)
+    assert (
+        RequestReturnMachineStatusEvaluator.evaluate_request_status_from_counts(counts)
+        == expected
+    )
+
+
+def test_get_request_status(tmp_path):
+    db_path = str(tmp_path / "status.db")
+    make_machines_db(
+        db_path,
+        [
+            {
+                "machine_name": "m1",
+                "request_id": "r1",
+                "machine_state": 250,
+                "internal_ip": "10.0.0.1",
+            },
+            {"machine_name": "m2", "request_id": "r1", "machine_state": 200},
+            {
+                "machine_name": "m3",
+                "request_id": "r2",
+                "machine_state": 400,
+                "return_request_id": "ret1",
+            },
+        ],
+    )
+
+    response = get_request_status(
+        HFRequestStatus(requests=[{"requestId": "r1"}, {"requestId": "ret1"}]),
+        _DummyConfig(db_path),
+    )
+
+    r1, ret1 = response.requests
+    assert r1.requestId == "r1"
+    assert r1.status == "running"
+    machines = {machine.name: machine for machine in r1.machines}
+    assert (machines["m1"].result, machines["m1"].status) == ("succeed", "running")
+    assert (machines["m2"].result, machines["m2"].status) == ("executing", "stopped")
+
+    assert ret1.requestId == "ret1"
+    assert ret1.status == "complete"
+    assert [(m.name, m.result) for m in ret1.machines] == [("m3", "succeed")]
+
+
+def test_get_request_status_uses_stored_status(tmp_path):
+    db_path = str(tmp_path / "stored.db")
+    make_machines_db(db_path, [{"machine_name": "m1", "request_id": "r1", "machine_state": 200}])
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO request_status "
+            "(request_key, machine_counts, missing_ip_counts, status) "
+            "SELECT id, '{\"400\": 1}', '{}', 'complete_with_error' FROM requests"
+        )
+
+    response = get_request_status(
+        HFRequestStatus(requests=[{"requestId": "r1"}]), _DummyConfig(db_path)
+    )
+
+    [r1] = response.requests
+    assert r1.status == "complete_with_error"
+    assert [machine.name for machine in r1.machines] == ["m1"]
+
+
+def _instance_message(machine_name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        operation=SimpleNamespace(id="op1"),
+        protoPayload=SimpleNamespace(resourceName=f"projects/p/zones/z/instances/{machine_name}"),
+    )
+
+
+def test_render_request_status_reuses_unchanged_requests(tmp_path):
+    db_path = str(tmp_path / "cached.db")
+    make_machines_db(
+        db_path,
+        [
+            {"machine_name": "m1", "request_id": "r1", "machine_state": 200},
+            {"machine_name": "m2", "request_id": "r1", "machine_state": 200},
+        ],
+    )
+    config = _DummyConfig(db_path)
+    dao = MachineDao(config)
+    dao._handle_instances_inserted(_instance_message("m1"))
+    request = HFRequestStatus(requests=[{"requestId": "r1"}])
+
+    first = render_request_status(request, config)
+    assert first == get_request_status(request, config).model_dump_json(
+        indent=2, exclude_none=True
+    )
+    with patch.object(MachineDao, "get_machines_for_requests") as get_machines:
+        assert render_request_status(request, config) == first
+    get_machines.assert_not_called()
+
+    # a change to the request's machines changes its fingerprint
+    dao._handle_instance_deleted(_instance_message("m2"))
+    changed = render_request_status(request, config)
+    assert changed != first
+    assert changed == get_request_status(request, config).model_dump_json(
+        indent=2, exclude_none=True
+    )
+
+
+def test_render_request_status_does_not_cache_final_statuses(tmp_path):
+    db_path = str(tmp_path / "final.db")
+    make_machines_db(
+        db_path,
+        [
+            {"machine_name": "m1", "request_id": "r1", "machine_state": 200},
+            {"machine_name": "m2", "request_id": "r2", "machine_state": 200},
+        ],
+    )
+    config = _DummyConfig(db_path)
+    dao = MachineDao(config)
+    dao._handle_instances_inserted(_instance_message("m1"))
+    dao._handle_instances_inserted(_instance_message("m2"))
+    dao._handle_instance_deleted(_instance_message("m2"))
+
+    output = render_request_status(
+        HFRequestStatus(requests=[{"requestId": "r1"}, {"requestId": "r2"}, {"requestId": "r3"}]),
+        config,
+    )
+
+    statuses = [request["status"] for request in json.loads(output)["requests"]]
+    assert statuses == ["running", "complete_with_error", "complete"]
+    cache = get_request_status_module._response_cache
+    assert cache.get("r1") is not None
+    assert cache.get("r2") is None
+    assert cache.get("r3") is None
@@ -0,0 +1,49 @@
+import pytest
+
+from gce_provider.db.chunking import bucket_size, chunked, chunked_queries, chunked_statements
+
+
+@pytest.mark.parametrize(
+    "count, expected",
+    [(1, 1), (2, 2), (3, 4), (5, 8), (500, 512), (512, 512), (513, 512)],
+)
+def test_bucket_size(count, expected):
+    assert bucket_size(count) == expected
+
+
+def test_chunked_pads_with_nulls():
+    chunks = list(chunked(list(range(11)), max_chunk_size=8))
+
+    assert chunks == [list(range(8)), [8, 9, 10, None]]
+
+
+def test_chunked_queries_reuse_one_query_per_bucket():
+    queries = {
+        query
+        for query, _ in chunked_queries(
+            "SELECT * FROM machines WHERE machine_name IN ({in_params})", ["a", "b", "c"]
+        )
+    }
+    queries |= {
+        query
+        for query, _ in chunked_queries(
+            "SELECT * FROM machines WHERE machine_name IN ({in_params})", ["d", "e", "f", "g"]
+        )
+    }
+
+    assert queries == {"SELECT * FROM machines WHERE machine_name IN (?,?,?,?)"}
+
+
+def test_chunked_statements_prepend_params():
+    statements = chunked_statements(
+        "UPDATE machines SET delete_operation_id=? WHERE machine_name IN ({in_params})",
+        ["m1", "m2", "m3"],
+        params=["op1"],
+        max_chunk_size=2,
+    )
+
+    assert [statement.params for statement in statements] == [
+        ["op1", "m1", "m2"],
+        ["op1", "m3"],
+    ]
+    assert statements[1].query.endswith("IN (?)")
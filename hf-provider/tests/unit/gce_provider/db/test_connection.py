@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from gce_provider.db.connection import ConnectionManager, background_checkpoint
+from gce_provider.db.transaction import Statement, Transaction
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.db_checkpoint_interval = 60
+        self.logger = MagicMock()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "test.db"), timeout=0.1)
+    manager.writer().execute("CREATE TABLE machines (machine_name TEXT)")
+    yield manager
+    manager.close()
+
+
+def test_writer_enables_wal(manager):
+    assert manager.writer().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert manager.writer().execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_connections_are_cached_per_thread(manager):
+    assert manager.reader() is manager.reader()
+    assert manager.writer() is manager.writer()
+    assert manager.reader() is not manager.writer()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.reader()))
+    thread.start()
+    thread.join()
+    assert other[0] is not manager.reader()
+
+
+def test_connections_of_finished_threads_are_closed(manager):
+    finished = []
+    thread = threading.Thread(target=lambda: finished.append(manager.reader()))
+    thread.start()
+    thread.join()
+    assert len(manager._connections) == 2
+
+    # the next thread that connects closes the connection of the finished thread
+    thread = threading.Thread(target=manager.writer)
+    thread.start()
+    thread.join()
+    with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+        finished[0].execute("SELECT 1")
+    assert len(manager._connections) == 2
+
+
+def test_reader_is_read_only(manager):
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        manager.reader().execute("INSERT INTO machines VALUES ('m1')")
+
+
+def test_reader_does_not_wait_for_writer(manager):
+    writer = manager.writer()
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("INSERT INTO machines VALUES ('m1')")
+
+    # the uncommitted write is invisible, and reading does not hit the busy timeout
+    assert manager.reader().execute("SELECT COUNT(*) FROM machines").fetchone()[0] == 0
+
+    writer.commit()
+    assert manager.reader().execute("SELECT COUNT(*) FROM machines").fetchone()[0] == 1
+
+
+def test_transaction_reuses_the_cached_connection(tmp_path):
+    config = _DummyConfig(str(tmp_path / "test.db"))
+    with Transaction(config) as trans:
+        trans.execute([Statement("CREATE TABLE machines (machine_name TEXT)", [])])
+        first = trans.connection
+    with Transaction(config) as trans:
+        trans.execute([Statement("INSERT INTO machines VALUES (?)", ["m1"])])
+        assert trans.connection is first
+
+    assert not first.in_transaction
+    assert first.execute("SELECT machine_name FROM machines").fetchall() == [("m1",)]
+
+
+def test_nested_transaction_rolls_back_on_its_own(tmp_path):
+    config = _DummyConfig(str(tmp_path / "test.db"))
+    with Transaction(config) as trans:
+        trans.execute([Statement("CREATE TABLE machines (machine_name TEXT)", [])])
+
+    with Transaction(config) as outer:
+        with Transaction(config) as inner:
+            inner.execute([Statement("INSERT INTO machines VALUES (?)", ["m1"])])
+        with pytest.raises(RuntimeError):
+            with Transaction(config) as inner:
+                inner.execute([Statement("INSERT INTO machines VALUES (?)", ["m2"])])
+                raise RuntimeError("failed")
+        # nothing is committed until the outer transaction ends
+        assert outer.connection.in_transaction
+
+    rows = outer.connection.execute("SELECT machine_name FROM machines").fetchall()
+    assert rows == [("m1",)]
+    assert not outer.connection.in_transaction
+
+
+def test_background_checkpoint(tmp_path):
+    config = _DummyConfig(str(tmp_path / "test.db"))
+    config.db_checkpoint_interval = 0.01
+    with Transaction(config) as trans:
+        trans.execute([Statement("CREATE TABLE machines (machine_name TEXT)", [])])
+
+    called = threading.Event()
+    config.logger.debug.side_effect = (
+        lambda message: message.startswith("WAL checkpoint") and called.set()
+    )
+    with background_checkpoint(config):
+        assert called.wait(5)
@@ -1,10 +1,15 @@
+import re
 from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 
 import pytest
+from tenacity import wait_none
 
 from gce_provider.db.gce_helpers import (
     fetch_managed_instance_list,
+    fetch_instances_bulk,
+    list_zone_instances,
+    name_filters,
     fetch_instance,
     fetch_instance_by_url,
     fetch_instances,
@@ -196,6 +201,60 @@ def test_fetch_instances_by_url(mock_client, mock_instance):
         assert instance.name in instance_names
 
 
+def test_name_filters_are_chunked():
+    names = [f"sym-{i:04d}" for i in range(100)]
+
+    filters = list(name_filters(names, max_length=200))
+
+    assert len(filters) > 1
+    assert all(len(name_filter) <= 200 + len('name eq "()"') for name_filter in filters)
+    assert filters[0].startswith('name eq "(sym\\-0000|sym\\-0001|')
+    # every name is in exactly one filter
+    joined = "|".join(name_filter[len('name eq "(') : -2] for name_filter in filters)
+    assert joined.replace("\\", "").split("|") == names
+
+
+@patch("gce_provider.db.gce_helpers.client_factory.instances_client")
+def test_fetch_instances_bulk(mock_client, mock_instance):
+    instance_names = [f"multi-instance-{i + 1}" for i in range(1000)]
+
+    def list_instances(request):
+        pattern = request.filter[len('name eq "') : -1]
+        return [
+            mock_instance(name, "10.0.0.1")
+            for name in instance_names
+            if re.fullmatch(pattern, name)
+        ]
+
+    mock_client.return_value.list.side_effect = list_instances
+
+    instances = fetch_instances_bulk(TEST_PROJECT, TEST_ZONE, instance_names)
+
+    assert sorted(instance.name for instance in instances) == sorted(instance_names)
+    # one list call per chunk of names, rather than one get per instance
+    chunks = len(list(name_filters(instance_names)))
+    assert 1 < chunks < 20
+    assert mock_client.return_value.list.call_count == chunks
+    mock_client.return_value.get.assert_not_called()
+
+
+@patch("gce_provider.db.gce_helpers.client_factory.instances_client")
+def test_fetch_instances_bulk_retries(mock_client, mock_instance):
+    mock_client.return_value.list.side_effect = [
+        RuntimeError("rate limited"),
+        [mock_instance("my-instance", "10.0.0.1")],
+    ]
+
+    with patch(
+        "gce_provider.db.gce_helpers.list_zone_instances",
+        list_zone_instances.retry_with(wait=wait_none()),
+    ):
+        instances = fetch_instances_bulk(TEST_PROJECT, TEST_ZONE, ["my-instance"])
+
+    assert [instance.name for instance in instances] == ["my-instance"]
+    assert mock_client.return_value.list.call_count == 2
+
+
 def test_extract_instance_ips(mock_instance):
     instance = mock_instance("my-instance", "10.0.0.1", "35.100.200.1")
     result = extract_instance_ips(instance)
@@ -3,10 +3,13 @@ import stat
 import sqlite3
 import textwrap
 import pytest
+from types import SimpleNamespace
 from typing import Optional
 from unittest.mock import MagicMock, patch
 
 from gce_provider.db.machines import MachineDao
+from gce_provider.utils.constants import MachineState, RequestStatus
+from tests.unit.gce_provider.fixtures import make_machines_db
 
 class _DummyConfig:
     def __init__(self, db_path: str):
@@ -21,24 +24,15 @@ def _make_db(db_path: str, schema_sql: Optional[str]):
         if schema_sql:
             conn.executescript(schema_sql)
 
-def test_quick_check_ok_autoinc_table(tmp_path):
+def test_quick_check_probes_the_machines_table(tmp_path):
     """
-    machines table allows INSERT DEFAULT VALUES because it has only an autoincrement PK.
-    Expect: ok=True, insert_ok=True, delete_ok=True, needs_required_values=False
+    The probe inserts and deletes a machine within a savepoint that is rolled back.
+    Expect: ok=True, insert_ok=True, delete_ok=True, and the table left unchanged
     """
-    db_path = tmp_path / "ok_autoinc.db"
-    _make_db(
-        str(db_path),
-        textwrap.dedent(
-            """
-            CREATE TABLE machines (
-                id INTEGER PRIMARY KEY AUTOINCREMENT
-            );
-            """
-        ),
-    )
+    db_path = str(tmp_path / "probe.db")
+    make_machines_db(db_path, [{"machine_name": "m1", "request_id": "r1"}])
 
-    dao = MachineDao(_DummyConfig(str(db_path)))
+    dao = MachineDao(_DummyConfig(db_path))
     ok, details = dao._quick_check()
     assert ok is True
     assert details["table_exists"] is True
@@ -46,23 +40,23 @@ def test_quick_check_ok_autoinc_table(tmp_path):
     assert details["integrity"] == "ok"
     assert details["insert_ok"] is True
     assert details["delete_ok"] is True
-    assert details["needs_required_values"] is False
+    with sqlite3.connect(db_path) as conn:
+        names = [row[0] for row in conn.execute("SELECT machine_name FROM machines")]
+    assert names == ["m1"]
 
 
-def test_check_ok_but_needs_required_values(tmp_path):
+def test_quick_check_fails_on_an_outdated_machines_table(tmp_path):
     """
-    machines has a NOT NULL column without a default, so INSERT DEFAULT VALUES fails.
-    Permissions and integrity are fine.
-    Expect: ok=True, needs_required_values=True, insert_ok=False, delete_ok=False
+    machines lacks the columns of the current schema, so the probe cannot insert.
+    Expect: ok=False, insert_ok=False, delete_ok=False
     """
-    db_path = tmp_path / "needs_values.db"
+    db_path = tmp_path / "outdated.db"
     _make_db(
         str(db_path),
         textwrap.dedent(
             """
             CREATE TABLE machines (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                req TEXT NOT NULL
+                id INTEGER PRIMARY KEY AUTOINCREMENT
             );
             """
         ),
@@ -70,12 +64,9 @@ def test_check_ok_but_needs_required_values(tmp_path):
 
     dao = MachineDao(_DummyConfig(str(db_path)))
     ok, details = dao._quick_check()
-    assert ok is True
-    assert details["table_exists"] is True
+    assert ok is False
     assert details["writable"] is True
-    assert details["integrity"] == "ok"
-    assert details["needs_required_values"] is True
-    # Since INSERT DEFAULT VALUES failed, these should remain False
+    assert "Insert/Delete Error" in details["integrity"]
     assert details["insert_ok"] is False
     assert details["delete_ok"] is False
 
@@ -141,4 +132,141 @@ def test_check_raises_wrapper(tmp_path):
 
     dao = MachineDao(_DummyConfig(str(db_path)))
     with pytest.raises(RuntimeError):
-        dao.check_or_raise()
\ No newline at end of file
+        dao.check_or_raise()
+
+def test_get_machines_for_requests_groups_by_request(tmp_path):
+    db_path = str(tmp_path / "requests.db")
+    make_machines_db(
+        db_path,
+        [
+            {"machine_name": "m1", "request_id": "r1", "return_request_id": None},
+            {"machine_name": "m2", "request_id": "r1", "return_request_id": "ret1"},
+            {"machine_name": "m3", "request_id": "r2", "return_request_id": "ret1"},
+        ],
+    )
+
+    dao = MachineDao(_DummyConfig(db_path))
+    machines = dao.get_machines_for_requests(["r1", "ret1", "missing", "r1"])
+
+    assert list(machines) == ["r1", "ret1", "missing"]
+    assert sorted(m.machine_name for m in machines["r1"]) == ["m1", "m2"]
+    assert sorted(m.machine_name for m in machines["ret1"]) == ["m2", "m3"]
+    assert machines["missing"] == []
+    assert [m.machine_name for m in dao.get_machines_for_request("r2")] == ["m3"]
+
+
+def test_get_request_state_counts(tmp_path):
+    db_path = str(tmp_path / "counts.db")
+    make_machines_db(
+        db_path,
+        [
+            {
+                "machine_name": "m1",
+                "request_id": "r1",
+                "machine_state": 250,
+                "internal_ip": "10.0.0.1",
+            },
+            {"machine_name": "m2", "request_id": "r1", "machine_state": 250},
+            {
+                "machine_name": "m3",
+                "request_id": "r1",
+                "machine_state": 200,
+                "return_request_id": "ret1",
+            },
+        ],
+    )
+
+    counts = MachineDao(_DummyConfig(db_path)).get_request_state_counts(["r1", "ret1", "missing"])
+
+    assert counts["r1"].is_return_request is False
+    assert counts["r1"].machine_counts == {200: 1, 250: 2}
+    assert counts["r1"].missing_ip_counts == {200: 1, 250: 1}
+    assert counts["ret1"].is_return_request is True
+    assert counts["ret1"].machine_counts == {200: 1}
+    assert counts["missing"].machine_counts == {}
+
+
+def test_large_in_lists_are_chunked(tmp_path):
+    """More machines than SQLite's legacy limit of 999 host parameters"""
+    db_path = str(tmp_path / "large.db")
+    names = [f"m{i}" for i in range(1200)]
+    make_machines_db(db_path, [{"machine_name": name, "request_id": "r1"} for name in names])
+    dao = MachineDao(_DummyConfig(db_path))
+
+    assert len(dao.get_machines_by_name(names)) == 1200
+
+    instances = [f"projects/p/zones/z/instances/{name}" for name in names]
+    message = SimpleNamespace(
+        operation=SimpleNamespace(id="op1"),
+        protoPayload=SimpleNamespace(request=SimpleNamespace(instances=instances)),
+    )
+    dao._handle_group_instances_deleted(message)
+
+    counts = dao.get_request_state_counts(["r1"])["r1"]
+    assert counts.machine_counts == {MachineState.DELETE_REQUESTED.value: 1200}
+    summary = dao.get_request_status_summaries(["r1"])["r1"]
+    assert summary.machine_counts == counts.machine_counts
+
+
+def test_request_status_summaries_follow_machine_updates(tmp_path):
+    db_path = str(tmp_path / "summaries.db")
+    make_machines_db(
+        db_path,
+        [
+            {"machine_name": "m1", "request_id": "r1"},
+            {"machine_name": "m2", "request_id": "r1", "internal_ip": "10.0.0.2"},
+            {
+                "machine_name": "m3",
+                "request_id": "r2",
+                "return_request_id": "ret1",
+                "machine_state": MachineState.DELETE_REQUESTED.value,
+            },
+        ],
+    )
+    dao = MachineDao(_DummyConfig(db_path))
+    assert dao.get_request_status_summaries(["r1", "r2", "ret1"]) == {}
+
+    def message(machine_name: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            operation=SimpleNamespace(id="op2"),
+            protoPayload=SimpleNamespace(
+                resourceName=f"projects/p/zones/z/instances/{machine_name}"
+            ),
+        )
+
+    dao._handle_instances_inserted(message("m2"))
+    summary = dao.get_request_status_summaries(["r1"])["r1"]
+    assert summary.status == RequestStatus.running
+    assert summary.machine_counts == {0: 1, MachineState.INSERTED.value: 1}
+    assert summary.ip_ready_count == 1
+    assert summary.updated_at is not None
+
+    dao._handle_instance_deleted(message("m3"))
+    summaries = dao.get_request_status_summaries(["r1", "r2", "ret1"])
+    assert summaries["ret1"].is_return_request is True
+    assert summaries["ret1"].status == RequestStatus.complete
+    assert summaries["r2"].status == RequestStatus.complete_with_error
+    # the summaries match the counts of the machines
+    counts = dao.get_request_state_counts(["r1", "r2", "ret1"])
+    for request_id, summary in summaries.items():
+        assert summary.machine_counts == counts[request_id].machine_counts
+        assert summary.missing_ip_counts == counts[request_id].missing_ip_counts
+
+
+def test_handle_instance_preempted(tmp_path):
+    db_path = str(tmp_path / "preempted.db")
+    make_machines_db(db_path, [{"machine_name": "m1", "request_id": "r1"}])
+    dao = MachineDao(_DummyConfig(db_path))
+
+    message = SimpleNamespace(
+        operation=SimpleNamespace(id="op1"),
+        protoPayload=SimpleNamespace(
+            resourceName="projects/p/zones/z/instances/m1"
+        ),
+    )
+    dao._handle_instance_preempted(message)
+
+    [machine] = dao.get_machines_by_name(["m1"])
+    assert machine.machine_state == MachineState.PREEMPTED.value
+    assert machine.delete_grace_period == 30
+    assert machine.updated_at is not None
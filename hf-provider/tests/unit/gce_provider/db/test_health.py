@@ -0,0 +1,87 @@
+import os
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gce_provider.db.health import DatabaseHealth
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+
+
+@pytest.fixture
+def health(tmp_path):
+    db_path = str(tmp_path / "health.db")
+    make_machines_db(db_path, [])
+    return DatabaseHealth(_DummyConfig(db_path))
+
+
+def test_fast_check_ok(health):
+    with patch("gce_provider.db.health.MachineDao") as dao:
+        ok, details = health._fast_check()
+
+    assert ok is True
+    assert details["writable"] is True
+    assert details["integrity"] == "unknown"
+    # the O(database size) check never runs on the fast path
+    dao.assert_not_called()
+
+
+def test_fast_check_stamps_the_health_row(health):
+    health.check_or_raise()
+
+    with sqlite3.connect(health.config.db_path) as conn:
+        assert conn.execute("SELECT stamped_at FROM db_health").fetchone()[0] is not None
+
+
+def test_fast_check_missing_file(tmp_path):
+    health = DatabaseHealth(_DummyConfig(str(tmp_path / "missing.db")))
+
+    ok, details = health._fast_check()
+    assert ok is False
+    assert details["file"] == "missing"
+    assert not os.path.exists(tmp_path / "missing.db")
+
+
+def test_fast_check_outdated_schema(tmp_path):
+    db_path = str(tmp_path / "outdated.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE machines (id INTEGER PRIMARY KEY)")
+
+    with pytest.raises(RuntimeError, match="schema_version"):
+        DatabaseHealth(_DummyConfig(db_path)).check_or_raise()
+
+
+def test_integrity_check_result_is_cached(health):
+    assert health.run_integrity_check() is True
+    ok, details = health._fast_check()
+    assert ok is True
+    assert details["integrity"] == "ok"
+    assert details["integrity_checked_at"] is not None
+
+    with patch(
+        "gce_provider.db.health.MachineDao._quick_check",
+        return_value=(False, {"integrity": "database disk image is malformed"}),
+    ):
+        assert health.run_integrity_check() is False
+
+    with pytest.raises(RuntimeError, match="malformed"):
+        health.check_or_raise()
+
+
+def test_busy_integrity_check_keeps_the_cached_result(health):
+    assert health.run_integrity_check() is True
+
+    with patch(
+        "gce_provider.db.health.MachineDao._quick_check",
+        return_value=(False, {"integrity": "Not Writable: database is locked"}),
+    ):
+        assert health.run_integrity_check() is False
+
+    health.check_or_raise()
+    assert health._fast_check()[1]["integrity"] == "ok"
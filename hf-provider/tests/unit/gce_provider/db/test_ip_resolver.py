@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gce_provider.db.ip_resolver import resolve_missing_ips
+from gce_provider.db.machines import MachineDao
+from gce_provider.utils.constants import MachineState
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.gcp_project_id = "project"
+        self.gcp_instance_prefix = "sym-"
+        self.ip_resolve_interval = 5
+
+
+def _instance(name: str, ip: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name,
+        network_interfaces=[SimpleNamespace(network_i_p=ip, access_configs=[])],
+    )
+
+
+def _make_db(db_path: str) -> None:
+    make_machines_db(
+        db_path,
+        [
+            {
+                "machine_name": f"sym-{i}",
+                "request_id": "r1",
+                "operation_id": "op1",
+                "machine_state": MachineState.CREATED.value,
+            }
+            for i in range(3)
+        ],
+    )
+
+
+def test_resolve_missing_ips_lists_each_zone_once(tmp_path):
+    db_path = str(tmp_path / "resolver.db")
+    _make_db(db_path)
+    config = _DummyConfig(db_path)
+    instances = [
+        _instance("sym-0", "10.0.0.1"),
+        _instance("sym-1", "10.0.0.2"),
+        # no IP assigned yet
+        _instance("sym-2", ""),
+    ]
+
+    with patch(
+        "gce_provider.db.ip_resolver.fetch_instances_bulk", return_value=instances
+    ) as fetch_instances_bulk:
+        assert resolve_missing_ips(config) == 2
+
+    fetch_instances_bulk.assert_called_once_with("project", "zone", ["sym-0", "sym-1", "sym-2"])
+    dao = MachineDao(config)
+    assert dao.get_machines_missing_ip() == {"zone": ["sym-2"]}
+    summary = dao.get_request_status_summaries(["r1"])["r1"]
+    assert summary.ip_ready_count == 2
+
+
+def test_resolve_missing_ips_without_pending_machines(tmp_path):
+    db_path = str(tmp_path / "nothing.db")
+    make_machines_db(db_path, [])
+
+    with patch("gce_provider.db.ip_resolver.fetch_instances_bulk") as fetch_instances_bulk:
+        assert resolve_missing_ips(_DummyConfig(db_path)) == 0
+
+    fetch_instances_bulk.assert_not_called()
+
+
+def test_update_instance_ips_waits_for_the_resolver(tmp_path):
+    db_path = str(tmp_path / "waiting.db")
+    _make_db(db_path)
+    config = _DummyConfig(db_path)
+    dao = MachineDao(config)
+    message = SimpleNamespace(operation=SimpleNamespace(id="op1"))
+
+    with patch("gce_provider.db.machines.fetch_instances_bulk") as fetch_instances_bulk:
+        with pytest.raises(MachineDao.RetryRequired):
+            dao._update_instance_ips(message)
+        with patch("gce_provider.db.ip_resolver.fetch_instances_bulk") as resolver_fetch:
+            resolver_fetch.return_value = [_instance(f"sym-{i}", f"10.0.0.{i}") for i in range(3)]
+            resolve_missing_ips(config)
+        dao._update_instance_ips(message)
+
+    fetch_instances_bulk.assert_not_called()
+
+
+def test_update_instance_ips_without_the_resolver(tmp_path):
+    db_path = str(tmp_path / "direct.db")
+    _make_db(db_path)
+    config = _DummyConfig(db_path)
+    config.ip_resolve_interval = 0
+    dao = MachineDao(config)
+    message = SimpleNamespace(operation=SimpleNamespace(id="op1"))
+
+    with patch("gce_provider.db.machines.fetch_instances_bulk") as fetch_instances_bulk:
+        fetch_instances_bulk.return_value = [
+            _instance(f"sym-{i}", f"10.0.0.{i}") for i in range(3)
+        ]
+        dao._update_instance_ips(message)
+
+    # one call for the zone, not one per machine
+    fetch_instances_bulk.assert_called_once_with("project", "zone", ["sym-0", "sym-1", "sym-2"])
+    assert dao.get_machines_missing_ip() == {}
@@ -0,0 +1,228 @@
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gce_provider.db import machines, pending_tasks, processed_messages
+from gce_provider.db.migrations import (
+    INCREMENTAL_AUTO_VACUUM,
+    LATEST_VERSION,
+    MIGRATIONS,
+    Migration,
+    complete_pending_vacuum,
+    current_version,
+    migrate,
+    vacuum_pending,
+)
+from gce_provider.utils.constants import MachineState
+
+
+def _indexes(conn: sqlite3.Connection) -> set[str]:
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+    return {row[0] for row in rows}
+
+
+def test_migrate_new_database(tmp_path):
+    conn = sqlite3.connect(tmp_path / "new.db")
+
+    assert migrate(conn, MagicMock()) == LATEST_VERSION
+    assert current_version(conn) == LATEST_VERSION
+    assert {"idx_return_request_key", "idx_unreturned_machine_state"} <= _indexes(conn)
+    # a new database needs no VACUUM to use incremental auto-vacuum
+    assert not vacuum_pending(conn)
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL_AUTO_VACUUM
+
+
+def test_migrate_is_idempotent(tmp_path):
+    conn = sqlite3.connect(tmp_path / "again.db")
+    migrate(conn, MagicMock())
+
+    # simulate a concurrent process that applied the migrations after we read the version
+    with patch("gce_provider.db.migrations.current_version", return_value=0):
+        assert migrate(conn, MagicMock()) == LATEST_VERSION
+    versions = conn.execute("SELECT version FROM schema_version ORDER BY version").fetchall()
+    assert versions == [(migration.version,) for migration in MIGRATIONS]
+    assert not conn.in_transaction
+
+
+def test_migration_descriptions_are_bound(tmp_path):
+    conn = sqlite3.connect(tmp_path / "quoted.db")
+    migrations = MIGRATIONS + [
+        Migration(LATEST_VERSION + 1, "the machines' new index", "SELECT 1;"),
+        Migration(LATEST_VERSION + 2, "the pragmas' defaults", "SELECT 1;", transactional=False),
+    ]
+
+    with patch("gce_provider.db.migrations.MIGRATIONS", migrations):
+        assert migrate(conn, MagicMock()) == LATEST_VERSION + 2
+    descriptions = conn.execute(
+        "SELECT description FROM schema_version WHERE version > ? ORDER BY version",
+        (LATEST_VERSION,),
+    ).fetchall()
+    assert descriptions == [("the machines' new index",), ("the pragmas' defaults",)]
+    assert not conn.in_transaction
+
+
+def test_migrate_unversioned_database(tmp_path):
+    """Databases created before versioning already hold the baseline schema and data"""
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    conn.executescript(MIGRATIONS[0].script)
+    conn.execute(
+        "INSERT INTO machines (machine_name, request_id, gcp_zone, instance_group_manager, "
+        "operation_id) VALUES ('m1', 'r1', 'z', 'igm', 'op1')"
+    )
+    conn.commit()
+
+    assert migrate(conn, MagicMock()) == LATEST_VERSION
+    assert conn.execute(
+        "SELECT machine_name, request_id, gcp_zone, instance_group_manager, operation_id "
+        "FROM machine_records"
+    ).fetchall() == [("m1", "r1", "z", "igm", "op1")]
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall()
+    assert triggers == []
+    # switching the auto-vacuum mode of the legacy database is left to an explicit VACUUM
+    assert vacuum_pending(conn)
+    logger = MagicMock()
+    assert complete_pending_vacuum(conn, logger) is True
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL_AUTO_VACUUM
+    assert complete_pending_vacuum(conn, logger) is False
+
+
+def test_migrate_normalizes_machines(tmp_path):
+    conn = sqlite3.connect(tmp_path / "v6.db")
+    for migration in MIGRATIONS[:6]:
+        conn.executescript(migration.script)
+    rows = [
+        ("m1", "r1", "z", "igm", 400, "op1", "ret1", "delreq", "delop", "2025-01-01 00:00:00"),
+        ("m2", "r1", "z", "igm", 200, "op1", None, None, None, "2025-01-02 00:00:00"),
+    ]
+    conn.executemany(
+        "INSERT INTO machines (machine_name, request_id, gcp_zone, instance_group_manager, "
+        "machine_state, operation_id, return_request_id, delete_operation_request_id, "
+        "delete_operation_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.execute(
+        "INSERT INTO machines_archive (machine_name, request_id, gcp_zone, "
+        "instance_group_manager, machine_state, operation_id, return_request_id) "
+        "VALUES ('m0', 'r0', 'z', 'igm', 400, 'op0', 'ret1')"
+    )
+    conn.commit()
+
+    assert migrate(conn, MagicMock()) == LATEST_VERSION
+    columns = (
+        "machine_name, request_id, gcp_zone, instance_group_manager, machine_state, "
+        "operation_id, return_request_id, delete_operation_request_id, delete_operation_id, "
+        "updated_at"
+    )
+    migrated = conn.execute(
+        f"SELECT {columns} FROM machine_records ORDER BY machine_name"
+    ).fetchall()
+    assert migrated == rows
+    archived = conn.execute(
+        "SELECT machine_name, request_id, return_request_id FROM archived_machine_records"
+    ).fetchall()
+    assert archived == [("m0", "r0", "ret1")]
+    # every identifier is stored once
+    assert conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(*) FROM operations").fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(*) FROM instance_groups").fetchone()[0] == 1
+
+
+@pytest.fixture(scope="module")
+def migrated_db():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn, MagicMock())
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "query, params, expected_index",
+    [
+        (machines.SELECT_MACHINES_MISSING_IP, ("op1", 200, 250), "idx_operation_key"),
+        (machines.SELECT_ALL_MACHINES_MISSING_IP, (200, 250), "idx_missing_ip"),
+        (
+            machines.SELECT_MACHINES_FOR_REQUESTS.format(in_params="(?),(?)"),
+            ("r1", "r2"),
+            "idx_return_request_key",
+        ),
+        (
+            machines.SELECT_MACHINES_FOR_REQUESTS.format(in_params="(?),(?)"),
+            ("r1", "r2"),
+            "idx_request_key",
+        ),
+        (
+            machines.SELECT_REQUEST_STATE_COUNTS.format(in_params="(?),(?)"),
+            ("r1", "r2"),
+            "idx_request_key",
+        ),
+        (
+            machines.SELECT_REQUEST_STATE_COUNTS.format(in_params="(?),(?)"),
+            ("r1", "r2"),
+            "idx_return_request_key",
+        ),
+        (
+            machines.SELECT_MACHINES_BY_NAME.format(in_params="?,?"),
+            ("m1", "m2"),
+            "machines USING PRIMARY KEY",
+        ),
+        (
+            machines.SELECT_UNRETURNED_DELETED_MACHINES,
+            (MachineState.PREEMPTED.value, MachineState.DELETED.value),
+            "COVERING INDEX idx_unreturned_machine_state",
+        ),
+        (
+            machines.SELECT_EXPIRED_MACHINES,
+            ("2025-01-01 00:00:00", 500),
+            "idx_deleted_updated_at",
+        ),
+        (
+            machines.SELECT_EXPIRED_ARCHIVED_MACHINES,
+            ("2025-01-01 00:00:00", 500),
+            "idx_archive_updated_at",
+        ),
+        (
+            machines.SELECT_ARCHIVABLE_MACHINES,
+            ("2025-01-01 00:00:00", 500),
+            "idx_deleted_updated_at",
+        ),
+        (
+            machines.SELECT_MACHINES_FOR_REQUESTS.format(in_params="(?),(?)"),
+            ("r1", "r2"),
+            "idx_archive_request_key",
+        ),
+        (
+            machines.SELECT_REQUEST_STATE_COUNTS.format(in_params="(?),(?)"),
+            ("r1", "r2"),
+            "idx_archive_return_request_key",
+        ),
+        (
+            machines.SELECT_REQUEST_KEY_STATE_COUNTS.format(in_params="(?),(?)"),
+            (1, 2),
+            "idx_return_request_key",
+        ),
+        (
+            machines.SELECT_REQUEST_KEYS_BY_OPERATION,
+            ("op1",),
+            "idx_operation_key",
+        ),
+        (
+            processed_messages.SELECT_PROCESSED_MESSAGE,
+            ("i1", "op1"),
+            "sqlite_autoindex_processed_messages_1",
+        ),
+        (
+            processed_messages.DELETE_EXPIRED_PROCESSED_MESSAGES,
+            ("2025-01-01 00:00:00", 500),
+            "idx_processed_at",
+        ),
+        (pending_tasks.SELECT_DUE_TASKS, (100,), "idx_next_run_at"),
+    ],
+)
+def test_query_plan_uses_index(migrated_db, query, params, expected_index):
+    plan = " | ".join(
+        row[3] for row in migrated_db.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    )
+
+    assert expected_index in plan
+    assert "SCAN machines" not in plan
@@ -0,0 +1,48 @@
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+from gce_provider.db.pending_tasks import PendingTasks
+from gce_provider.db.transaction import Transaction
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+
+
+def _delays(db_path: str) -> dict[str, int]:
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT operation_id, "
+            "CAST(ROUND((JULIANDAY(next_run_at) - JULIANDAY('now')) * 86400) AS INTEGER) "
+            "FROM pending_tasks"
+        ).fetchall()
+    return dict(rows)
+
+
+def test_pending_tasks_back_off_until_abandoned(tmp_path):
+    db_path = str(tmp_path / "tasks.db")
+    make_machines_db(db_path, [])
+    tasks = PendingTasks(_DummyConfig(db_path))
+    with Transaction(tasks.config) as trans:
+        tasks.add(trans, "op1", "_handle_instances_created_callback", "{}")
+        tasks.add(trans, "op2", "_handle_instances_created_callback", "{}")
+        # the second message of an operation does not add more work
+        tasks.add(trans, "op1", "_handle_instances_created_callback", "{}")
+
+    [first, second] = tasks.due(10)
+    assert (first.operation_id, first.attempts) == ("op1", 0)
+    tasks.reschedule(first._replace(attempts=3))
+    tasks.reschedule(second._replace(attempts=9))
+    # the timestamps have a resolution of one second
+    delays = _delays(db_path)
+    assert 7 <= delays["op1"] <= 8
+    assert 59 <= delays["op2"] <= 60
+    assert tasks.due(10) == []
+
+    with patch("gce_provider.db.pending_tasks.MAX_ATTEMPTS", 2):
+        tasks.reschedule(first._replace(attempts=1))
+    tasks.complete("op2")
+    assert _delays(db_path) == {}
@@ -0,0 +1,53 @@
+import sqlite3
+from unittest.mock import MagicMock
+
+from gce_provider.db.processed_messages import ProcessedMessages
+from gce_provider.db.transaction import Transaction
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.pubsub_dedup_cache_size = 100
+        self.pubsub_dedup_retention = 3600
+        self.trim_db_batch_size = 2
+
+
+def test_processed_messages_are_found_in_the_cache(tmp_path):
+    db_path = str(tmp_path / "processed.db")
+    make_machines_db(db_path, [])
+    processed = ProcessedMessages(_DummyConfig(db_path))
+
+    assert not processed.is_processed(("i1", "op1"))
+    with Transaction(processed.config) as trans:
+        assert processed.record(trans, ("i1", "op1"))
+        assert not processed.record(trans, ("i1", "op1"))
+    assert processed.is_processed(("i1", "op1"))
+    processed.remember(("i1", "op1"))
+    assert processed.is_processed(("i1", "op1"))
+    # entries without an insertId cannot be told apart
+    assert not processed.is_processed(None)
+
+    stats = processed.stats()
+    assert stats == (3, 2, 1)
+    assert str(stats) == (
+        "3 messages checked, 2 duplicates (66.7%), 50.0% of them found in the cache"
+    )
+
+
+def test_remove_expired_processed_messages(tmp_path):
+    db_path = str(tmp_path / "expired.db")
+    make_machines_db(db_path, [])
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO processed_messages (insert_id, operation_id, processed_at) "
+            "VALUES (?, 'op', DATETIME('now', ?))",
+            [(f"old-{i}", "-2 hours") for i in range(5)] + [("new", "-1 minutes")],
+        )
+    processed = ProcessedMessages(_DummyConfig(db_path))
+
+    assert processed.remove_expired() == 5
+    assert processed.is_processed(("new", "op"))
+    assert not processed.is_processed(("old-0", "op"))
@@ -0,0 +1,180 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from gce_provider.db.machines import MachineDao
+from gce_provider.db.reconciler import background_reconciler, reconcile
+from gce_provider.utils.constants import EventSource, MachineState
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.gcp_project_id = "project"
+        self.ip_resolve_interval = 5
+        self.event_source = EventSource.RECONCILER
+        self.reconcile_interval = 60
+
+
+def _managed_instance(name: str, current_action: str, instance_status: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name,
+        instance=f"https://compute.googleapis.com/compute/v1/projects/p/zones/z/instances/{name}",
+        current_action=current_action,
+        instance_status=instance_status,
+        preserved_state_from_config=SimpleNamespace(metadata={"Team": f"Team-{name}"}),
+    )
+
+
+def _instance(name: str, ip: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name,
+        network_interfaces=[SimpleNamespace(network_i_p=ip, access_configs=[])],
+    )
+
+
+def _make_db(db_path: str, states: dict[str, MachineState]) -> None:
+    make_machines_db(
+        db_path,
+        [
+            {
+                "machine_name": machine_name,
+                "request_id": "r1",
+                "operation_id": "op1",
+                "machine_state": state.value,
+            }
+            for machine_name, state in states.items()
+        ],
+    )
+
+
+def _states(config: _DummyConfig) -> dict[str, int]:
+    machines = MachineDao(config).get_live_machines().get(("zone", "igm"), [])
+    return {machine_name: machine_state for machine_name, machine_state, _ in machines}
+
+
+def test_reconcile_moves_machines_forward(tmp_path):
+    db_path = str(tmp_path / "forward.db")
+    _make_db(
+        db_path,
+        {
+            "sym-0": MachineState.CREATED,
+            "sym-1": MachineState.CREATED,
+            "sym-2": MachineState.INSERTED,
+            "sym-3": MachineState.DELETE_REQUESTED,
+            "sym-4": MachineState.CREATED,
+        },
+    )
+    config = _DummyConfig(db_path)
+    managed_instances = [
+        _managed_instance("sym-0", "NONE", "RUNNING"),
+        _managed_instance("sym-1", "CREATING", "PROVISIONING"),
+        _managed_instance("sym-2", "DELETING", "STOPPING"),
+        # a late observation does not undo the deletion request
+        _managed_instance("sym-3", "NONE", "RUNNING"),
+        # sym-4 is no longer in its group
+    ]
+
+    with patch(
+        "gce_provider.db.reconciler.fetch_managed_instances", return_value=managed_instances
+    ) as fetch_managed_instances, patch(
+        "gce_provider.db.reconciler.fetch_instances_bulk",
+        return_value=[_instance("sym-0", "10.0.0.1")],
+    ) as fetch_instances_bulk, patch(
+        "gce_provider.db.reconciler.set_instance_labels", return_value=[]
+    ):
+        assert reconcile(config) == 4
+
+    fetch_managed_instances.assert_called_once_with("project", "zone", "igm")
+    # only the running machine that has no IP, and is not being deleted, is looked up
+    fetch_instances_bulk.assert_called_once_with("project", "zone", ["sym-0"])
+    assert _states(config) == {
+        "sym-0": MachineState.INSERTED.value,
+        "sym-1": MachineState.CREATED.value,
+        "sym-2": MachineState.DELETE_REQUESTED.value,
+        "sym-3": MachineState.DELETE_REQUESTED.value,
+    }
+    dao = MachineDao(config)
+    (deleted,) = dao.get_machines_by_name(["sym-4"])
+    assert deleted.machine_state == MachineState.DELETED.value
+    summary = dao.get_request_status_summaries(["r1"])["r1"]
+    assert summary.ip_ready_count == 1
+
+
+def test_reconcile_labels_the_instances_it_sees_running(tmp_path):
+    db_path = str(tmp_path / "labels.db")
+    _make_db(db_path, {"sym-0": MachineState.CREATED, "sym-1": MachineState.INSERTED})
+    config = _DummyConfig(db_path)
+    managed_instances = [
+        _managed_instance("sym-0", "NONE", "RUNNING"),
+        # labelled when it was first seen running
+        _managed_instance("sym-1", "NONE", "RUNNING"),
+    ]
+
+    with patch(
+        "gce_provider.db.reconciler.fetch_managed_instances", return_value=managed_instances
+    ), patch("gce_provider.db.reconciler.fetch_instances_bulk", return_value=[]), patch(
+        "gce_provider.db.reconciler.set_instance_labels", return_value=["sym-0"]
+    ) as set_instance_labels:
+        reconcile(config)
+
+    set_instance_labels.assert_called_once()
+    (labelled,), zone, _ = set_instance_labels.call_args.args
+    assert zone == "zone"
+    assert labelled.name == "sym-0"
+    assert [(m.key, m.value) for m in labelled.preservedState.metadatas] == [
+        ("Team", "Team-sym-0")
+    ]
+    config.logger.warning.assert_called_once()
+
+
+def test_reconcile_leaves_labels_to_pubsub(tmp_path):
+    """With Pub/Sub, the monitor labels the instances once it applies their creation"""
+    db_path = str(tmp_path / "pubsub-labels.db")
+    _make_db(db_path, {"sym-0": MachineState.CREATED})
+    config = _DummyConfig(db_path)
+    config.event_source = EventSource.BOTH
+
+    with patch(
+        "gce_provider.db.reconciler.fetch_managed_instances",
+        return_value=[_managed_instance("sym-0", "NONE", "RUNNING")],
+    ), patch("gce_provider.db.reconciler.fetch_instances_bulk", return_value=[]), patch(
+        "gce_provider.db.reconciler.set_instance_labels"
+    ) as set_instance_labels:
+        assert reconcile(config) == 1
+
+    set_instance_labels.assert_not_called()
+
+
+def test_reconcile_leaves_requested_machines_that_are_not_listed(tmp_path):
+    db_path = str(tmp_path / "requested.db")
+    _make_db(db_path, {"sym-0": MachineState.REQUESTED})
+    config = _DummyConfig(db_path)
+
+    with patch("gce_provider.db.reconciler.fetch_managed_instances", return_value=[]):
+        assert reconcile(config) == 0
+
+    assert _states(config) == {"sym-0": MachineState.REQUESTED.value}
+
+
+def test_reconcile_skips_a_group_that_cannot_be_listed(tmp_path):
+    db_path = str(tmp_path / "unlisted.db")
+    _make_db(db_path, {"sym-0": MachineState.CREATED})
+    config = _DummyConfig(db_path)
+
+    with patch(
+        "gce_provider.db.reconciler.fetch_managed_instances", side_effect=RuntimeError("denied")
+    ):
+        assert reconcile(config) == 0
+
+    assert _states(config) == {"sym-0": MachineState.CREATED.value}
+    config.logger.warning.assert_called_once()
+
+
+def test_background_reconciler_is_disabled_for_pubsub(tmp_path):
+    config = _DummyConfig(str(tmp_path / "disabled.db"))
+    assert background_reconciler(config).interval_seconds == 60
+
+    config.event_source = EventSource.PUBSUB
+    assert background_reconciler(config).interval_seconds == 0
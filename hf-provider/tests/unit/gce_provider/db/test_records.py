@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from gce_provider.db.records import MACHINE_COLUMNS, MachineRecord
+
+
+def _row(**overrides):
+    values = {column: None for column in MACHINE_COLUMNS}
+    values.update(
+        machine_name="m1",
+        request_id="r1",
+        machine_state=250,
+        created_at="2025-01-02 03:04:05",
+        **overrides,
+    )
+    return tuple(values[column] for column in MACHINE_COLUMNS)
+
+
+def test_from_row_maps_columns_in_order():
+    record = MachineRecord.from_row(_row(internal_ip="10.0.0.1"))
+
+    assert record.machine_name == "m1"
+    assert record.request_id == "r1"
+    assert record.machine_state == 250
+    assert record.internal_ip == "10.0.0.1"
+    assert record.hf_machine_result is None
+
+
+def test_timestamps_are_parsed_lazily():
+    record = MachineRecord.from_row(_row())
+    assert record._created_at == "2025-01-02 03:04:05"
+
+    assert record.created_at == datetime(2025, 1, 2, 3, 4, 5)
+    assert record.created_at is record._created_at
+    assert record.updated_at is None
+
+
+def test_records_have_no_instance_dict():
+    record = MachineRecord.from_row(_row())
+    assert not hasattr(record, "__dict__")
@@ -0,0 +1,228 @@
+import sqlite3
+from unittest.mock import MagicMock
+
+import pytest
+
+from gce_provider.db.machines import INSERT_REQUEST, MachineDao
+from gce_provider.db.migrations import INCREMENTAL_AUTO_VACUUM
+from gce_provider.db.transaction import Transaction
+from gce_provider.db.trim import background_archive, background_trim, trim_db
+from gce_provider.utils.constants import MachineState
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.returned_vm_ttl = 30
+        self.trim_db_batch_size = 500
+        self.trim_db_interval = 3600
+        self.auto_run_trim_db = True
+        self.db_archive_delay = 600
+        self.db_archive_interval = 300
+        self.pubsub_dedup_cache_size = 100
+        self.pubsub_dedup_retention = 3600
+
+
+def _make_db(db_path: str, expired: int, recent: int) -> None:
+    deleted = MachineState.DELETED.value
+    make_machines_db(
+        db_path,
+        [
+            {"machine_name": f"expired-{i}", "request_id": "r1", "machine_state": deleted}
+            for i in range(expired)
+        ]
+        + [
+            {"machine_name": f"recent-{i}", "request_id": "r2", "machine_state": deleted}
+            for i in range(recent)
+        ]
+        + [{"machine_name": "running", "request_id": "r3", "machine_state": 200}],
+    )
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "UPDATE machines SET updated_at=DATETIME('now', '-31 days') "
+            "WHERE machine_name LIKE 'expired-%' OR machine_name = 'running'"
+        )
+        conn.execute(
+            "UPDATE machines SET updated_at=DATETIME('now', '-29 days') "
+            "WHERE machine_name LIKE 'recent-%'"
+        )
+
+
+def _machine_names(db_path: str, table: str = "machines") -> set[str]:
+    with sqlite3.connect(db_path) as conn:
+        return {row[0] for row in conn.execute(f"SELECT machine_name FROM {table}")}
+
+
+@pytest.fixture
+def archive_db(tmp_path):
+    deleted = MachineState.DELETED.value
+    db_path = str(tmp_path / "archive.db")
+    make_machines_db(
+        db_path,
+        [
+            {
+                "machine_name": "returned",
+                "request_id": "r1",
+                "return_request_id": "ret1",
+                "machine_state": deleted,
+            },
+            {
+                "machine_name": "just-returned",
+                "request_id": "r1",
+                "return_request_id": "ret1",
+                "machine_state": deleted,
+            },
+            {"machine_name": "unreturned", "request_id": "r1", "machine_state": deleted},
+            {
+                "machine_name": "running",
+                "request_id": "r1",
+                "machine_state": 200,
+                "internal_ip": "10.0.0.1",
+            },
+        ],
+    )
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE machines SET updated_at=DATETIME('now', '-1 hours')")
+        conn.execute(
+            "UPDATE machines SET updated_at=CURRENT_TIMESTAMP WHERE machine_name='just-returned'"
+        )
+    return db_path
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 10, 500])
+def test_remove_expired_returned_machines_in_batches(tmp_path, batch_size):
+    db_path = str(tmp_path / "trim.db")
+    _make_db(db_path, expired=10, recent=3)
+    config = _DummyConfig(db_path)
+    config.trim_db_batch_size = batch_size
+
+    assert MachineDao(config).remove_expired_returned_machines() == 10
+    assert _machine_names(db_path) == {"recent-0", "recent-1", "recent-2", "running"}
+    # the request of the expired machines is gone with them
+    with sqlite3.connect(db_path) as conn:
+        requests = {row[0] for row in conn.execute("SELECT hf_request_id FROM requests")}
+    assert requests == {"r2", "r3"}
+
+
+def test_trim_db_reports_and_reclaims_space(tmp_path):
+    db_path = str(tmp_path / "trim.db")
+    _make_db(db_path, expired=5000, recent=0)
+
+    report = trim_db(_DummyConfig(db_path))
+
+    assert report.rowsDeleted == 5000
+    assert report.durationSeconds >= 0
+    assert report.bytesReclaimed > 0
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert set(report.model_dump()) == {"rowsDeleted", "durationSeconds", "bytesReclaimed"}
+
+
+def test_only_an_explicit_trim_completes_a_pending_vacuum(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    # a database written before incremental auto-vacuum was introduced
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE legacy (id INTEGER)")
+    _make_db(db_path, expired=0, recent=2)
+
+    trim_db(_DummyConfig(db_path))
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+
+    trim_db(_DummyConfig(db_path), vacuum=True)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL_AUTO_VACUUM
+
+
+def test_trim_db_without_expired_machines(tmp_path):
+    db_path = str(tmp_path / "trim.db")
+    _make_db(db_path, expired=0, recent=2)
+
+    report = trim_db(_DummyConfig(db_path))
+
+    assert report.rowsDeleted == 0
+    assert report.bytesReclaimed == 0
+    assert len(_machine_names(db_path)) == 3
+
+
+def test_archive_returned_machines(archive_db):
+    dao = MachineDao(_DummyConfig(archive_db))
+
+    assert dao.archive_returned_machines(batch_size=1) == 1
+    assert _machine_names(archive_db) == {"just-returned", "unreturned", "running"}
+    assert _machine_names(archive_db, "machines_archive") == {"returned"}
+    assert dao.archive_returned_machines() == 0
+
+
+def test_archiving_a_reused_name_refreshes_the_replaced_request(archive_db):
+    config = _DummyConfig(archive_db)
+    dao = MachineDao(config)
+    dao.archive_returned_machines()
+    with Transaction(config) as trans:
+        dao._refresh_request_status_of_machines(trans, ["just-returned"])
+    deleted = MachineState.DELETED.value
+    assert dao.get_request_status_summaries(["r1"])["r1"].machine_counts == {
+        deleted: 3,
+        MachineState.CREATED.value: 1,
+    }
+
+    # the name of the archived machine is reused by another request
+    with sqlite3.connect(archive_db) as conn:
+        conn.executemany(INSERT_REQUEST, [("r2",), ("ret2",)])
+        conn.execute(
+            "INSERT INTO machines (machine_name, request_key, return_request_key, "
+            "operation_key, instance_group_key, machine_state, updated_at) "
+            "SELECT 'returned', "
+            "(SELECT id FROM requests WHERE hf_request_id = 'r2'), "
+            "(SELECT id FROM requests WHERE hf_request_id = 'ret2'), "
+            f"operation_key, instance_group_key, {deleted}, DATETIME('now', '-1 hours') "
+            "FROM machines WHERE machine_name = 'running'"
+        )
+    assert dao.archive_returned_machines() == 1
+
+    summaries = dao.get_request_status_summaries(["r1", "ret1"])
+    assert summaries["r1"].machine_counts == {deleted: 2, MachineState.CREATED.value: 1}
+    assert summaries["ret1"].machine_counts == {deleted: 1}
+
+
+def test_request_lookups_include_archived_machines(archive_db):
+    dao = MachineDao(_DummyConfig(archive_db))
+    before = dao.get_request_state_counts(["r1", "ret1"])
+    dao.archive_returned_machines()
+
+    machines = dao.get_machines_for_requests(["r1", "ret1"])
+    assert {m.machine_name for m in machines["r1"]} == {
+        "returned",
+        "just-returned",
+        "unreturned",
+        "running",
+    }
+    assert {m.machine_name for m in machines["ret1"]} == {"returned", "just-returned"}
+    assert dao.get_request_state_counts(["r1", "ret1"]) == before
+
+
+def test_trim_removes_expired_archived_machines(archive_db):
+    config = _DummyConfig(archive_db)
+    dao = MachineDao(config)
+    dao.archive_returned_machines()
+    with sqlite3.connect(archive_db) as conn:
+        conn.execute("UPDATE machines_archive SET updated_at=DATETIME('now', '-31 days')")
+
+    assert dao.remove_expired_returned_machines() == 1
+    assert _machine_names(archive_db, "machines_archive") == set()
+
+
+def test_background_archive_disabled(tmp_path):
+    config = _DummyConfig(str(tmp_path / "trim.db"))
+    config.db_archive_interval = 0
+    assert background_archive(config).interval_seconds == 0
+
+
+def test_background_trim_disabled(tmp_path):
+    config = _DummyConfig(str(tmp_path / "trim.db"))
+    assert background_trim(config).interval_seconds == 3600
+
+    config.auto_run_trim_db = False
+    assert background_trim(config).interval_seconds == 0
@@ -6,6 +6,7 @@ sys.path.insert(
     0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
 )
 import pytest
+import sqlite3
 from unittest.mock import MagicMock
 from gce_provider.config import get_config
 import logging
@@ -24,3 +25,40 @@ def mock_logger():
     """Fixture to provide a mock logger instance."""
     logger = MagicMock(spec=logging.Logger)
     return logger
+
+
+def make_machines_db(db_path: str, machines: list[dict]):
+    """Create a DB with the current schema, holding the given machines."""
+    from gce_provider.db.machines import INSERT_INSTANCE_GROUP, INSERT_OPERATION, INSERT_REQUEST
+    from gce_provider.db.migrations import migrate
+
+    defaults = {
+        "return_request_id": None,
+        "operation_id": "op",
+        "machine_state": 0,
+        "internal_ip": None,
+    }
+    machines = [{**defaults, **machine} for machine in machines]
+    with sqlite3.connect(db_path) as conn:
+        migrate(conn, MagicMock())
+        conn.execute(INSERT_INSTANCE_GROUP, ("zone", "igm"))
+        for machine in machines:
+            conn.execute(INSERT_REQUEST, (machine["request_id"],))
+            conn.execute(INSERT_OPERATION, (machine["operation_id"],))
+            if machine["return_request_id"] is not None:
+                conn.execute(INSERT_REQUEST, (machine["return_request_id"],))
+        conn.executemany(
+            """
+            INSERT INTO machines
+            (machine_name, request_key, return_request_key, operation_key,
+             instance_group_key, machine_state, internal_ip)
+            VALUES
+            (:machine_name,
+             (SELECT id FROM requests WHERE hf_request_id = :request_id),
+             (SELECT id FROM requests WHERE hf_request_id = :return_request_id),
+             (SELECT id FROM operations WHERE gcp_operation_id = :operation_id),
+             (SELECT id FROM instance_groups WHERE gcp_zone = 'zone'),
+             :machine_state, :internal_ip)
+            """,
+            machines,
+        )
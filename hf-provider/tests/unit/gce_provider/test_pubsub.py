@@ -0,0 +1,296 @@
+import json
+import sqlite3
+import time
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gce_provider.db.machines import MachineDao
+from gce_provider.pubsub import (
+    MessageBatcher,
+    launch_pubsub_daemon,
+    run_monitor,
+    subscribe,
+    supervise,
+)
+from gce_provider.utils.constants import EventSource, MachineState
+from gce_provider.utils.model_utils import to_simple_namespace
+from gce_provider.utils.process_lock import LockManager
+from tests.unit.gce_provider.fixtures import make_machines_db
+
+
+class _DummyConfig:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = MagicMock()
+        self.pubsub_batch_max_messages = 10
+        self.pubsub_batch_max_latency_ms = 10
+        self.pubsub_max_outstanding_messages = 200
+        self.pubsub_max_outstanding_bytes = 1024
+        self.pubsub_callback_threads = 2
+        self.pubsub_streams = 3
+        self.post_ack_workers = 2
+        self.post_ack_max_pending = 10
+        self.post_ack_stats_interval = 0
+        self.pubsub_dedup_cache_size = 100
+        self.pubsub_dedup_retention = 3600
+        self.trim_db_batch_size = 2
+        self.pending_task_interval = 0
+
+
+def _deleted_message(
+    message_id: str, resource_name: str, operation_id: Optional[str] = None
+) -> MagicMock:
+    message = MagicMock(message_id=message_id)
+    message.data = json.dumps(
+        {
+            "insertId": message_id,
+            "logName": "log",
+            "operation": {"id": operation_id or f"op-{message_id}"},
+            "protoPayload": {
+                "resourceName": resource_name,
+                "response": {"operationType": "delete"},
+            },
+        }
+    ).encode("utf-8")
+    return message
+
+
+def _pending_tasks(db_path: str) -> list[tuple[str, str, int]]:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT operation_id, task, attempts FROM pending_tasks").fetchall()
+
+
+def _machine_states(db_path: str) -> dict[str, int]:
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT machine_name, machine_state FROM machines").fetchall())
+
+
+def test_batch_is_acknowledged_after_commit(tmp_path):
+    db_path = str(tmp_path / "batch.db")
+    make_machines_db(db_path, [{"machine_name": f"m{i}", "request_id": "r1"} for i in range(3)])
+    messages = [
+        _deleted_message(f"{i}", f"projects/p/zones/z/instances/m{i}") for i in range(3)
+    ]
+    messages.insert(1, _deleted_message("bad", "not-an-instance"))
+    # each acknowledgement sees every state transition of the batch
+    states_at_ack = []
+    for message in messages:
+        message.ack.side_effect = lambda: states_at_ack.append(_machine_states(db_path))
+
+    batcher = MessageBatcher(_DummyConfig(db_path))
+    with batcher:
+        for message in messages:
+            batcher.submit(message)
+
+    assert _machine_states(db_path) == {f"m{i}": MachineState.DELETED.value for i in range(3)}
+    assert states_at_ack == [_machine_states(db_path)] * 3
+    messages[1].ack.assert_not_called()
+    messages[1].nack.assert_called_once()
+    # the status summary is refreshed once, for the whole batch
+    summary = MachineDao(_DummyConfig(db_path)).get_request_status_summaries(["r1"])["r1"]
+    assert summary.machine_counts == {MachineState.DELETED.value: 3}
+
+
+def test_failed_commit_nacks_the_batch(tmp_path):
+    db_path = str(tmp_path / "missing" / "batch.db")
+    message = _deleted_message("1", "projects/p/zones/z/instances/m1")
+    batcher = MessageBatcher(_DummyConfig(db_path))
+
+    batcher.apply([(message, to_simple_namespace(json.loads(message.data)))])
+
+    message.ack.assert_not_called()
+    message.nack.assert_called_once()
+
+
+def test_subscribe_opens_configured_streams(tmp_path):
+    subscriber = MagicMock()
+    callback = MagicMock()
+
+    streams = subscribe(subscriber, "subscription", callback, _DummyConfig(str(tmp_path)))
+
+    assert len(streams) == 3
+    schedulers = set()
+    for call in subscriber.subscribe.call_args_list:
+        assert call.args == ("subscription",)
+        assert call.kwargs["callback"] is callback
+        flow_control = call.kwargs["flow_control"]
+        assert (flow_control.max_messages, flow_control.max_bytes) == (200, 1024)
+        schedulers.add(call.kwargs["scheduler"])
+    # each stream runs its callbacks on its own pool
+    assert len(schedulers) == 3
+
+
+def test_post_ack_work_is_keyed_by_operation(tmp_path):
+    db_path = str(tmp_path / "post_ack.db")
+    make_machines_db(db_path, [{"machine_name": "m1", "request_id": "r1"}])
+    hf_callback = MagicMock(__name__="_handle_instances_created_callback")
+    # two log entries of the same operation
+    messages = [
+        _deleted_message(f"{i}", "projects/p/zones/z/instances/m1", operation_id="op-1")
+        for i in range(2)
+    ]
+    batcher = MessageBatcher(_DummyConfig(db_path))
+
+    with patch.object(MachineDao, "update_machine_state", return_value=hf_callback):
+        batcher.apply(
+            [(message, to_simple_namespace(json.loads(message.data))) for message in messages]
+        )
+    assert batcher.post_ack.stats().pending == 1
+    assert _pending_tasks(db_path) == [("op-1", "_handle_instances_created_callback", 0)]
+    batcher.post_ack.start()
+    batcher.post_ack.stop()
+
+    hf_callback.assert_called_once()
+    assert hf_callback.call_args.args[0].operation.id == "op-1"
+    assert batcher.post_ack.stats().duplicates == 1
+    for message in messages:
+        message.ack.assert_called_once()
+    # the work is done
+    assert _pending_tasks(db_path) == []
+
+
+def test_unhandled_operations_are_acknowledged_without_batching(tmp_path):
+    message = MagicMock(message_id="1")
+    message.data = json.dumps(
+        {
+            "insertId": "1",
+            "operation": {"id": "op-1"},
+            "protoPayload": {"response": {"operationType": "setLabels"}},
+        }
+    ).encode("utf-8")
+    batcher = MessageBatcher(_DummyConfig(str(tmp_path / "unhandled.db")))
+
+    batcher.submit(message)
+
+    message.ack.assert_called_once()
+    assert batcher._queue.empty()
+
+
+def test_redelivered_messages_are_acknowledged_without_work(tmp_path):
+    db_path = str(tmp_path / "dedup.db")
+    make_machines_db(db_path, [{"machine_name": "m1", "request_id": "r1"}])
+    config = _DummyConfig(db_path)
+    # delivered twice before the first delivery was applied, then once more
+    messages = [_deleted_message("1", "projects/p/zones/z/instances/m1") for _ in range(3)]
+
+    with patch.object(
+        MachineDao, "update_machine_state", autospec=True, return_value=None
+    ) as update_machine_state:
+        with MessageBatcher(config) as batcher:
+            batcher.submit(messages[0])
+            batcher.submit(messages[1])
+        # a restarted monitor starts with an empty cache
+        batcher = MessageBatcher(config)
+        batcher.submit(messages[2])
+
+    update_machine_state.assert_called_once()
+    for message in messages:
+        message.ack.assert_called_once()
+    assert batcher._queue.empty()
+    assert batcher.processed.stats() == (1, 1, 0)
+
+
+def test_failed_post_ack_work_is_retried_after_a_restart(tmp_path):
+    db_path = str(tmp_path / "pending.db")
+    make_machines_db(db_path, [{"machine_name": "m1", "request_id": "r1"}])
+    config = _DummyConfig(db_path)
+    message = _deleted_message("1", "projects/p/zones/z/instances/m1")
+    hf_callback = MagicMock(
+        __name__="_handle_instances_created_callback",
+        side_effect=MachineDao.RetryRequired("no IP yet"),
+    )
+
+    with patch.object(MachineDao, "update_machine_state", return_value=hf_callback):
+        batcher = MessageBatcher(config)
+        batcher.apply([(message, to_simple_namespace(json.loads(message.data)))])
+        batcher.post_ack.start()
+        batcher.post_ack.stop()
+    hf_callback.assert_called_once()
+    message.ack.assert_called_once()
+    assert _pending_tasks(db_path) == [("op-1", "_handle_instances_created_callback", 1)]
+
+    # not due yet; the backoff is moved well beyond the one-second resolution of the timestamps
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE pending_tasks SET next_run_at=DATETIME('now', '+1 hours')")
+    assert MessageBatcher(config).resume_pending_tasks() == 0
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE pending_tasks SET next_run_at=DATETIME('now', '-1 seconds')")
+    with patch.object(MachineDao, "_handle_instances_created_callback") as resumed:
+        # a new monitor resumes the task when it starts
+        with MessageBatcher(config) as batcher:
+            while batcher.post_ack.stats().completed == 0:
+                time.sleep(0.001)
+
+    resumed.assert_called_once()
+    assert resumed.call_args.args[0].operation.id == "op-1"
+    assert _pending_tasks(db_path) == []
+
+
+def test_supervisor_restarts_with_backoff(tmp_path):
+    runs = iter([RuntimeError("stream failed"), None, RuntimeError("stream failed")])
+
+    def run():
+        result = next(runs)
+        if result is not None:
+            raise result
+
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) == 3:
+            raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        supervise(_DummyConfig(str(tmp_path)), run, sleep)
+
+    assert delays == [1, 2, 4]
+
+
+def test_supervisor_resets_backoff_after_a_healthy_run(tmp_path):
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) == 3:
+            raise KeyboardInterrupt()
+
+    clock = iter([0, 1, 1, 1000, 1000, 1001])
+    with patch("gce_provider.pubsub.time.monotonic", lambda: next(clock)):
+        with pytest.raises(KeyboardInterrupt):
+            supervise(_DummyConfig(str(tmp_path)), lambda: None, sleep)
+
+    assert delays == [1, 1, 2]
+
+
+@patch("gce_provider.pubsub.subprocess.Popen")
+def test_launch_skips_a_running_monitor(popen, tmp_path):
+    config = MagicMock(pubsub_lockfile=str(tmp_path / "monitor.lock"))
+
+    with patch("gce_provider.pubsub.get_config", return_value=config):
+        with LockManager(config.pubsub_lockfile):
+            launch_pubsub_daemon()
+        popen.assert_not_called()
+        launch_pubsub_daemon()
+
+    popen.assert_called_once()
+
+
+@patch("gce_provider.pubsub.client_factory")
+def test_reconciler_monitor_does_not_subscribe(client_factory, tmp_path):
+    config = _DummyConfig(str(tmp_path / "reconciler.db"))
+    config.event_source = EventSource.RECONCILER
+    config.db_checkpoint_interval = 0
+    config.db_integrity_check_interval = 0
+    config.db_archive_interval = 0
+    config.auto_run_trim_db = False
+    config.trim_db_interval = 0
+    config.ip_resolve_interval = 0
+    config.reconcile_interval = 60
+
+    run_monitor(config, pubsub_timeout=0.01)
+
+    client_factory.pubsub_subscriber_client.assert_not_called()
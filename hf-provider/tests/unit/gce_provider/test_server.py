@@ -0,0 +1,106 @@
+import os
+import stat
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gce_provider.client import ServerUnavailable, parse_args, send_request
+from gce_provider.server import ProviderServer
+
+
+class _DummyConfig:
+    def __init__(self, server_socket: str):
+        self.server_socket = server_socket
+        self.logger = MagicMock()
+
+
+@pytest.fixture
+def running_server(tmp_path):
+    """Run a provider server on a temporary socket, with a runner that echoes the request"""
+    calls = []
+
+    def runner(command, payload):
+        calls.append((command, payload))
+        if command == "requestMachines":
+            return 1, "Error: boom"
+        return 0, f"{command}:{payload}"
+
+    server = ProviderServer(_DummyConfig(str(tmp_path / "hf.sock")), runner)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, calls
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_send_request_round_trip(running_server):
+    server, calls = running_server
+
+    response = send_request(
+        server.config.server_socket, "getRequestStatus", {"requests": [{"requestId": "r1"}]}
+    )
+
+    assert response["exit_code"] == 0
+    assert response["output"] == "getRequestStatus:{'requests': [{'requestId': 'r1'}]}"
+    assert calls == [("getRequestStatus", {"requests": [{"requestId": "r1"}]})]
+
+
+def test_send_request_propagates_errors(running_server):
+    server, _ = running_server
+
+    response = send_request(server.config.server_socket, "requestMachines", {})
+
+    assert response == {"exit_code": 1, "output": "Error: boom"}
+
+
+def test_server_rejects_long_lived_commands(running_server):
+    server, calls = running_server
+
+    response = send_request(server.config.server_socket, "monitorEvents", None)
+
+    assert response["exit_code"] == 1
+    assert calls == []
+
+
+def test_send_request_without_server(tmp_path):
+    with pytest.raises(ServerUnavailable):
+        send_request(str(tmp_path / "missing.sock"), "getRequestStatus", None)
+
+
+def test_server_close_removes_socket(tmp_path):
+    socket_path = tmp_path / "hf.sock"
+    server = ProviderServer(_DummyConfig(str(socket_path)), MagicMock())
+    assert socket_path.exists()
+
+    server.server_close()
+    assert not socket_path.exists()
+
+
+def test_socket_is_private_from_the_moment_it_is_bound(tmp_path):
+    socket_path = tmp_path / "hf.sock"
+    umask = os.umask(0o022)
+    try:
+        # without the chmod, the socket keeps the mode it was created with
+        with patch("gce_provider.server.os.chmod"):
+            server = ProviderServer(_DummyConfig(str(socket_path)), MagicMock())
+        assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+    server.server_close()
+
+
+@pytest.mark.parametrize(
+    "argv, forwarded",
+    [
+        (["getRequestStatus", "-f", "in.json"], True),
+        (["getReturnRequests", '{"machines": []}'], True),
+        (["monitorEvents"], False),
+        (["getRequestStatus", "--monitor"], False),
+        (["--version"], False),
+    ],
+)
+def test_parse_args_only_forwards_servable_commands(argv, forwarded):
+    assert (parse_args(argv) is not None) == forwarded
@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from gce_provider.utils.audit_log import decode_entry
+from gce_provider.utils.model_utils import to_simple_namespace
+
+MESSAGES_DIR = Path(__file__).parents[3] / "resources" / "pubsub-messages"
+
+
+def _read(name: str) -> bytes:
+    return (MESSAGES_DIR / name).read_bytes()
+
+
+@pytest.mark.parametrize(
+    "name", ["create-instances.json", "insert.json", "delete-instances.json", "delete.json"]
+)
+def test_decode_entry_keeps_the_fields_that_are_dispatched(name):
+    data = _read(name)
+    full = to_simple_namespace(json.loads(data))
+
+    decoded = decode_entry(data)
+
+    assert decoded.insertId == full.insertId
+    assert decoded.logName == full.logName
+    assert decoded.operation.id == full.operation.id
+    assert decoded.protoPayload.resourceName == full.protoPayload.resourceName
+    assert decoded.protoPayload.response.operationType == full.protoPayload.response.operationType
+    assert decoded.protoPayload.response.zone == full.protoPayload.response.zone
+    assert decoded.protoPayload.request.instances == getattr(
+        full.protoPayload.request, "instances", []
+    )
+
+
+def test_decode_entry_keeps_instance_metadata():
+    decoded = decode_entry(_read("create-instances.json"))
+
+    [metadata, _] = decoded.protoPayload.request.instances[0].preservedState.metadatas
+    assert (metadata.key, metadata.value) == ("symphony-request-id", "req-0001")
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        _read("set-labels.json"),
+        b'{"insertId": "1", "logName": "log"}',
+        b'{"protoPayload": {"response": {"operationType": "delete"}}}',
+        b"[]",
+    ],
+)
+def test_decode_entry_drops_unhandled_entries(data):
+    assert decode_entry(data) is None
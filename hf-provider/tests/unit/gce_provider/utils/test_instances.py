@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from gce_provider.utils.instances import set_instance_labels
+
+
+def _managed_instance(name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name,
+        preservedState=SimpleNamespace(
+            metadatas=[SimpleNamespace(key="Symphony-Request", value="R1")]
+        ),
+    )
+
+
+@patch("gce_provider.utils.instances.instances_client")
+@patch("gce_provider.utils.instances.fetch_instances_bulk")
+def test_set_instance_labels_fetches_instances_in_bulk(fetch_instances_bulk, mock_client):
+    config = SimpleNamespace(gcp_project_id="project", logger=MagicMock())
+    fetch_instances_bulk.return_value = [
+        SimpleNamespace(name="m1", labels={"team": "hpc"}, label_fingerprint="abc")
+    ]
+
+    failed = set_instance_labels([_managed_instance("m1"), _managed_instance("m2")], "z", config)
+
+    # m2 no longer exists
+    assert failed == ["m2"]
+    fetch_instances_bulk.assert_called_once_with("project", "z", ["m1", "m2"])
+    mock_client.return_value.get.assert_not_called()
+    [call] = mock_client.return_value.set_labels.call_args_list
+    request = call.kwargs["request"]
+    assert request.instance == "m1"
+    assert dict(request.instances_set_labels_request_resource.labels) == {
+        "team": "hpc",
+        "symphony-request": "r1",
+    }
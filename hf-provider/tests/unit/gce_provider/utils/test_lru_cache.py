@@ -0,0 +1,41 @@
+from gce_provider.utils.lru_cache import LRUCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2, 60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_expires_entries_after_ttl():
+    clock = _Clock()
+    cache = LRUCache(2, 60, clock=clock)
+    cache.put("a", 1)
+
+    clock.now = 60
+    assert cache.get("a") == 1
+    clock.now = 61
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_size_zero_disables_cache():
+    cache = LRUCache(0, 60)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert cache.pop("a") is None
@@ -0,0 +1,48 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gce_provider.utils.process_lock import LockManager, LockManagerError, is_locked
+
+
+def test_lock_is_exclusive(tmp_path):
+    lockfile = str(tmp_path / "monitor.lock")
+    assert not is_locked(lockfile)
+
+    with LockManager(lockfile):
+        assert is_locked(lockfile)
+        with open(lockfile) as f:
+            assert f.read() == str(os.getpid())
+        with pytest.raises(LockManagerError):
+            with LockManager(lockfile):
+                pass
+        # the failed attempt leaves the lock in place
+        assert is_locked(lockfile)
+
+    assert not is_locked(lockfile)
+    with LockManager(lockfile):
+        assert is_locked(lockfile)
+
+
+def test_stale_lockfile_is_not_locked(tmp_path):
+    lockfile = tmp_path / "stale.lock"
+    # left by a process that was killed
+    lockfile.write_text(str(os.getpid()))
+
+    assert not is_locked(str(lockfile))
+    with LockManager(str(lockfile)):
+        assert is_locked(str(lockfile))
+
+
+def test_unreadable_lockfile_is_assumed_locked(tmp_path):
+    lockfile = tmp_path / "other-user.lock"
+    lockfile.write_text("")
+    logger = MagicMock()
+
+    with patch(
+        "gce_provider.utils.process_lock.os.open", side_effect=PermissionError("denied")
+    ):
+        assert is_locked(str(lockfile), logger)
+
+    logger.warning.assert_called_once()
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from gce_provider.utils.work_queue import KeyedWorkQueue
+
+
+def test_duplicate_keys_collapse():
+    release = threading.Event()
+    runs = []
+
+    def work(key):
+        release.wait(5)
+        runs.append(key)
+
+    with KeyedWorkQueue("test", workers=1, max_pending=10) as work_queue:
+        assert work_queue.submit("op1", work, "op1")
+        assert work_queue.submit("op2", work, "op2")
+        # op1 is running or pending, and op2 is pending
+        assert not work_queue.submit("op1", work, "op1")
+        assert not work_queue.submit("op2", work, "op2")
+        release.set()
+
+    assert runs == ["op1", "op2"]
+    stats = work_queue.stats()
+    assert (stats.pending, stats.running, stats.completed, stats.duplicates) == (0, 0, 2, 2)
+
+
+def test_submit_waits_while_queue_is_full():
+    release = threading.Event()
+    work_queue = KeyedWorkQueue("test", workers=1, max_pending=1).start()
+    work_queue.submit("running", release.wait, 5)
+    while work_queue.stats().running == 0:
+        time.sleep(0.001)
+    work_queue.submit("pending", lambda: None)
+
+    submitted = threading.Event()
+    producer = threading.Thread(
+        target=lambda: (work_queue.submit("blocked", lambda: None), submitted.set())
+    )
+    producer.start()
+    assert not submitted.wait(0.1)
+    assert work_queue.stats().pending == 1
+
+    release.set()
+    assert submitted.wait(5)
+    producer.join()
+    work_queue.stop()
+    assert work_queue.stats().completed == 3
+
+
+def test_failed_work_does_not_stop_the_workers():
+    def fail():
+        raise RuntimeError("failed")
+
+    with KeyedWorkQueue("test", workers=1, max_pending=10) as work_queue:
+        work_queue.submit("op1", fail)
+        work_queue.submit("op2", lambda: None)
+
+    assert work_queue.stats().completed == 2
+    assert work_queue._threads == []
+
+
+def test_stop_without_draining_discards_pending_work():
+    release = threading.Event()
+    runs = []
+    work_queue = KeyedWorkQueue("test", workers=1, max_pending=10).start()
+    work_queue.submit("running", lambda: (release.wait(5), runs.append("running")))
+    while work_queue.stats().running == 0:
+        time.sleep(0.001)
+    work_queue.submit("pending", runs.append, "pending")
+
+    stopper = threading.Thread(target=work_queue.stop, kwargs={"drain": False})
+    stopper.start()
+    while work_queue.stats().pending:
+        time.sleep(0.001)
+    release.set()
+    stopper.join()
+
+    assert runs == ["running"]